@@ -0,0 +1,41 @@
+"""计算相关内容表：按共同点赞/收藏为每个内容计算top-k相关内容，写入feature.item_related
+
+在backend目录下运行（建议由定时任务调用，例如每天全量、每小时增量）：
+    python -m scripts.build_item_related --top-k 50
+    python -m scripts.build_item_related --since-hours 1
+
+运行中的服务按updated_at水位增量加载新结果。
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from src.db.session import AsyncSessionLocal
+from src.services.rec.related import RELATED_RELATION_TYPES, build_item_related
+
+async def run(args):
+    since = datetime.now(timezone.utc) - timedelta(hours=args.since_hours) if args.since_hours else None
+    count = await build_item_related(
+        AsyncSessionLocal,
+        args.relation_types or RELATED_RELATION_TYPES,
+        top_k=args.top_k,
+        since=since,
+        max_user_items=args.max_user_items,
+        max_item_users=args.max_item_users,
+        alpha=args.alpha,
+    )
+    print(f"写入 {count} 个内容的相关内容")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--relation-types", nargs="+",
+                        help="关系类型，需与服务端ITEM_RELATED_RELATION_TYPES一致，默认使用该配置")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--since-hours", type=float, default=0, help="只重新计算最近N小时关系有变化的内容，0表示全量")
+    parser.add_argument("--max-user-items", type=int, default=200, help="每个用户最多使用的最近互动内容数")
+    parser.add_argument("--max-item-users", type=int, default=500, help="每个内容最多使用的最近互动用户数")
+    parser.add_argument("--alpha", type=float, default=0.5, help="流行度惩罚系数")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
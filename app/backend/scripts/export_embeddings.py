@@ -0,0 +1,35 @@
+"""导出向量存储：把feature.item_embeddings / feature.user_embeddings批量写成mmap文件
+
+在backend目录下运行（可由定时任务调用，此时可将EMBEDDING_STORE_EXPORT_INTERVAL_S设为0）：
+    python -m scripts.export_embeddings --name item --name user --dtype float16
+
+写完新版本后原子替换清单，运行中的worker在下一次检查时切换到新版本。
+"""
+import argparse
+import asyncio
+
+from src.core.config import settings
+from src.db.session import AsyncSessionLocal
+from src.services.rec.embedding_store import EXPORT_QUERIES, export_lock, export_store
+
+async def run(args):
+    with export_lock(args.dir) as acquired:
+        if not acquired:
+            print("另一个导出任务正在运行，跳过")
+            return
+        for name in args.name or list(EXPORT_QUERIES):
+            manifest = await export_store(AsyncSessionLocal, name, args.dir,
+                                          dtype=args.dtype, page_size=args.page_size)
+            print(f"[{name}] version={manifest['version']} count={manifest['count']} "
+                  f"dim={manifest['dim']} skipped={manifest['skipped']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", action="append", choices=list(EXPORT_QUERIES))
+    parser.add_argument("--dir", default=settings.EMBEDDING_STORE_DIR)
+    parser.add_argument("--dtype", default=settings.EMBEDDING_STORE_DTYPE, choices=["float32", "float16"])
+    parser.add_argument("--page-size", type=int, default=5000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
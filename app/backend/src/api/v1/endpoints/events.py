@@ -7,6 +7,7 @@ from src.db.session import get_db
 from src.db.models import Event
 from src.db.schemas import ResponseModel, EventCreate
 from src.core.logger import logger
+from src.services.rec.seen import seen_history
 
 router = APIRouter()
 
@@ -55,6 +56,9 @@ async def create_event(
         result = await db.execute(stmt)
         await db.commit()
         
+        # 更新本进程的已看记录，过滤节点无需查询事件表
+        seen_history.record(event.user_id, event.item_id, event.event_type)
+        
         # 计算请求耗时
         process_time = time.time() - start_time
         logger.info(
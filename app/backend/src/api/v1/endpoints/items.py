@@ -7,21 +7,28 @@ from sqlalchemy.orm import selectinload
 from src.db.session import get_db
 from src.db.schemas import ResponseModel, Item, FeedItem
 from src.db.models import Item as ItemModel, User as UserModel
+from src.services.rec.catalog import item_catalog
+from src.services.rec.hydration import load_items
 
 router = APIRouter()
 
 @router.get("/list", response_model=ResponseModel)
 async def get_items_by_type(kind: str = Query(..., description="Content type: content, ad, product"), limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db)) -> ResponseModel:
     """根据类型获取内容列表"""
-    # 构建查询，包括关联的作者信息
-    query = select(ItemModel).options(selectinload(ItemModel.author)).where(ItemModel.kind == kind)
-    
-    # 添加分页
-    query = query.limit(limit).offset(offset)
-    
-    # 执行查询
-    result = await db.execute(query)
-    items_db = result.scalars().all()
+    # 优先按内容目录分页，目录不完整时查询数据库
+    page = item_catalog.list_by_kind(kind, limit, offset)
+    if page is not None:
+        items_db = list((await load_items(db, [item.id for item in page])).values())
+    else:
+        # 构建查询，包括关联的作者信息
+        query = select(ItemModel).options(selectinload(ItemModel.author)).where(ItemModel.kind == kind)
+        
+        # 添加分页
+        query = query.order_by(ItemModel.id).limit(limit).offset(offset)
+        
+        # 执行查询
+        result = await db.execute(query)
+        items_db = result.scalars().all()
     
     # 将数据库模型转换为Pydantic模型列表
     items_data = []
@@ -76,12 +83,8 @@ async def get_items_by_type(kind: str = Query(..., description="Content type: co
 @router.get("/{item_id}", response_model=ResponseModel)
 async def get_item(item_id: int = Path(...), db: AsyncSession = Depends(get_db)) -> ResponseModel:
     """获取单个内容详情"""
-    # 构建查询，包括关联的作者信息
-    query = select(ItemModel).options(selectinload(ItemModel.author)).where(ItemModel.id == item_id)
-    
-    # 执行查询
-    result = await db.execute(query)
-    item_db = result.scalar_one_or_none()
+    # 命中内容目录时只查询正文，否则查询完整记录
+    item_db = (await load_items(db, [item_id])).get(item_id)
     
     # 如果找不到内容，返回404错误
     if not item_db:
@@ -99,12 +102,8 @@ async def get_item(item_id: int = Path(...), db: AsyncSession = Depends(get_db))
 @router.get("", response_model=ResponseModel)
 async def get_items(ids: List[int] = Query(...), db: AsyncSession = Depends(get_db)) -> ResponseModel:
     """批量获取内容详情"""
-    # 构建查询，包括关联的作者信息
-    query = select(ItemModel).options(selectinload(ItemModel.author)).where(ItemModel.id.in_(ids))
-    
-    # 执行查询
-    result = await db.execute(query)
-    items_db = result.scalars().all()
+    # 命中内容目录的内容只查询正文，未命中的内容查询完整记录
+    items_db = list((await load_items(db, ids)).values())
     
     # 将数据库模型转换为Pydantic模型
     items_data = [Item.model_validate(item) for item in items_db]
@@ -4,6 +4,20 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.session import get_db
 from src.db.schemas import ResponseModel
+from src.services.rec.hedge import hedge_stats
+from src.services.rec.node_cache import node_output_cache
+from src.services.rec.breaker import breaker_registry
+from src.services.rec.basic import dag_manager
+from src.services.rec.catalog import item_catalog
+from src.services.rec.tag_index import tag_index
+from src.services.rec.vector_index import item_vector_index
+from src.services.rec.embedding_store import embedding_stores
+from src.services.rec.popularity import popularity_counters
+from src.services.rec.related import item_related_index
+from src.services.rec.relation_graph import relation_graph
+from src.services.rec.seen import seen_history
+from src.services.rec.negative import negative_feedback
+from src.core.exceptions import NotFoundException, ValidationException
 
 router = APIRouter()
 
@@ -69,4 +83,158 @@ async def get_runs(
             ]
         },
         msg="",
-    )
\ No newline at end of file
+    )
+
+@router.get("/rec/hedges", response_model=ResponseModel)
+async def get_hedge_stats() -> ResponseModel:
+    """获取推荐节点对冲执行计数（触发次数、胜出次数等）"""
+    return ResponseModel(
+        code=0,
+        data={"hedges": hedge_stats.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/node-cache", response_model=ResponseModel)
+async def get_node_cache_stats() -> ResponseModel:
+    """获取节点输出缓存的命中计数"""
+    return ResponseModel(
+        code=0,
+        data={"node_cache": node_output_cache.snapshot()},
+        msg="",
+    )
+
+@router.post("/rec/node-cache/invalidate", response_model=ResponseModel)
+async def invalidate_node_cache(
+    prefix: str = Query("", description="缓存键前缀，格式为 DAG:版本:节点，为空时清空全部"),
+) -> ResponseModel:
+    """清除当前worker的节点输出缓存（Redis中的二级缓存按TTL过期）"""
+    return ResponseModel(
+        code=0,
+        data={"invalidated": node_output_cache.invalidate(prefix)},
+        msg="",
+    )
+
+@router.get("/rec/breakers", response_model=ResponseModel)
+async def get_breakers() -> ResponseModel:
+    """获取推荐节点熔断器状态"""
+    return ResponseModel(
+        code=0,
+        data={"breakers": breaker_registry.snapshot()},
+        msg="",
+    )
+
+@router.post("/rec/breakers/{key}/reset", response_model=ResponseModel)
+async def reset_breaker(key: str = Path(..., description="熔断器键，格式为 DAG.节点")) -> ResponseModel:
+    """手动关闭节点熔断器"""
+    breaker = breaker_registry.find(key)
+    if not breaker:
+        raise NotFoundException(f"熔断器 {key} 不存在")
+    breaker.reset()
+    return ResponseModel(
+        code=0,
+        data={"key": key, **breaker.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/dags", response_model=ResponseModel)
+async def get_dags() -> ResponseModel:
+    """获取已加载的推荐DAG及版本"""
+    return ResponseModel(
+        code=0,
+        data={"dags": dag_manager.list_dags()},
+        msg="",
+    )
+
+@router.post("/rec/dags/{dag_id}/reload", response_model=ResponseModel)
+async def reload_dag(
+    dag_id: str = Path(...),
+    warmup_requests: int = Query(3, ge=0, le=20),
+) -> ResponseModel:
+    """热加载推荐DAG：构建、校验并预热新版本后原子替换"""
+    old_dag = dag_manager.get_dag(dag_id)
+    try:
+        new_dag = await dag_manager.reload_dag(dag_id, warmup_requests=warmup_requests)
+    except Exception as e:
+        raise ValidationException(f"DAG {dag_id} 热加载失败: {str(e)}")
+    return ResponseModel(
+        code=0,
+        data={
+            "dag_id": dag_id,
+            "previous_version": old_dag.version if old_dag else None,
+            "version": new_dag.version,
+            "loaded_at": new_dag.loaded_at,
+        },
+        msg="",
+    )
+
+@router.get("/rec/catalog", response_model=ResponseModel)
+async def get_catalog_stats() -> ResponseModel:
+    """获取内容目录状态（容量、水位、陈旧时间、命中率等）及派生的标签倒排索引状态"""
+    return ResponseModel(
+        code=0,
+        data={"catalog": item_catalog.snapshot(), "tag_index": tag_index.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/vector-index", response_model=ResponseModel)
+async def get_vector_index_stats() -> ResponseModel:
+    """获取内容向量索引状态"""
+    return ResponseModel(
+        code=0,
+        data={"vector_index": item_vector_index.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/embedding-stores", response_model=ResponseModel)
+async def get_embedding_store_stats() -> ResponseModel:
+    """获取向量存储状态"""
+    return ResponseModel(
+        code=0,
+        data={name: store.snapshot() for name, store in embedding_stores.items()},
+        msg="",
+    )
+
+@router.get("/rec/popularity", response_model=ResponseModel)
+async def get_popularity_stats() -> ResponseModel:
+    """获取内容热度计数状态"""
+    return ResponseModel(
+        code=0,
+        data={"popularity": popularity_counters.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/related", response_model=ResponseModel)
+async def get_related_stats() -> ResponseModel:
+    """获取相关内容表缓存状态"""
+    return ResponseModel(
+        code=0,
+        data={"related": item_related_index.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/relation-graph", response_model=ResponseModel)
+async def get_relation_graph_stats() -> ResponseModel:
+    """获取内存关系图状态"""
+    return ResponseModel(
+        code=0,
+        data={"relation_graph": relation_graph.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/seen-history", response_model=ResponseModel)
+async def get_seen_history_stats() -> ResponseModel:
+    """获取已看记录状态"""
+    return ResponseModel(
+        code=0,
+        data={"seen_history": seen_history.snapshot()},
+        msg="",
+    )
+
+@router.get("/rec/negative-feedback", response_model=ResponseModel)
+async def get_negative_feedback_stats() -> ResponseModel:
+    """获取负反馈缓存状态"""
+    return ResponseModel(
+        code=0,
+        data={"negative_feedback": negative_feedback.snapshot()},
+        msg="",
+    )
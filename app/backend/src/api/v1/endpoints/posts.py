@@ -73,7 +73,8 @@ async def get_posts(
         device=device,
         geo=geo,
         ab=ab,
-        debug=debug
+        debug=debug,
+        seed=seed,
     )
     
     # 生成下一页的cursor
@@ -1,8 +1,14 @@
 from fastapi import APIRouter, Depends, Body
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.session import get_db
+from src.db.models import UserEntityRelation
 from src.db.schemas import ResponseModel, UserEntityRelationCreate
+from src.core.logger import logger
+from src.services.rec.relation_graph import relation_graph
+from src.services.rec.negative import negative_feedback
 
 router = APIRouter()
 
@@ -11,10 +17,64 @@ async def upsert_relation(
     relation: UserEntityRelationCreate = Body(...),
     db: AsyncSession = Depends(get_db),
 ) -> ResponseModel:
-    """创建或更新用户-实体关系（关注/点赞/收藏/拉黑等）"""
-    # TODO: 实现创建或更新关系的逻辑
+    """创建或更新用户-实体关系（关注/点赞/收藏/拉黑等）
+
+    写入后立即更新本进程的关系图和拉黑列表缓存，其他worker按水位增量刷新
+    """
+    values = relation.model_dump()
+    stmt = insert(UserEntityRelation).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "entity_type", "entity_id", "relation_type"],
+        set_={
+            "status": stmt.excluded.status,
+            "strength": stmt.excluded.strength,
+            "score": stmt.excluded.score,
+            "attrs": stmt.excluded.attrs,
+            # 取消关系也更新时间，增量刷新据此拉取变化
+            "last_interact_at": func.now(),
+        },
+    ).returning(UserEntityRelation.last_interact_at)
+
+    try:
+        last_interact_at = (await db.execute(stmt)).scalar()
+        await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Upsert relation failed: {str(e)}",
+            extra={
+                "user_id": relation.user_id,
+                "entity_type": relation.entity_type,
+                "entity_id": relation.entity_id,
+                "relation_type": relation.relation_type,
+                "error": str(e),
+            },
+            exc_info=True,
+        )
+        return ResponseModel(
+            code=5001,
+            data=None,
+            msg=f"更新关系失败: {str(e)}",
+        )
+
+    negative_feedback.apply(
+        relation.user_id,
+        relation.entity_type,
+        relation.entity_id,
+        relation.relation_type,
+        active=relation.status == "active",
+    )
+    if relation.entity_type == "item":
+        relation_graph.apply(
+            relation.user_id,
+            relation.entity_id,
+            relation.relation_type,
+            relation.strength,
+            active=relation.status == "active",
+            interact_ts=last_interact_at.timestamp() if last_interact_at else None,
+        )
+
     return ResponseModel(
         code=0,
         data={"success": True},
         msg="",
-    )
\ No newline at end of file
+    )
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import time
 import uuid
 
@@ -8,6 +9,16 @@ from src.core.config import settings
 from src.core.logger import logger
 from src.api.v1.api import api_router
 from src.core.exceptions import AppException
+from src.services.rec.basic import dag_manager
+from src.services.rec.catalog import item_catalog
+from src.services.rec.vector_index import item_vector_index
+from src.services.rec.embedding_store import refresh_stores, watch_stores
+from src.services.rec.popularity import popularity_counters
+from src.services.rec.related import item_related_index
+from src.services.rec.relation_graph import relation_graph
+from src.services.rec.seen import seen_history
+from src.services.rec.negative import negative_feedback
+from src.db.session import AsyncSessionLocal
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -121,12 +132,116 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def health_check():
     return {"code": 0, "data": {"status": "ok", "version": settings.VERSION}, "msg": ""}
 
+# 后台任务
+background_tasks = []
+
 # 启动事件
 @app.on_event("startup")
 async def startup_event():
     logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
+    
+    # 监听推荐DAG配置文件，变化时热加载
+    if settings.REC_DAG_WATCH_INTERVAL_S > 0:
+        background_tasks.append(asyncio.create_task(dag_manager.watch(settings.REC_DAG_WATCH_INTERVAL_S)))
+    
+    # 加载内容目录并按updated_at水位增量刷新
+    if settings.ITEM_CATALOG_ENABLED:
+        try:
+            await item_catalog.load(AsyncSessionLocal)
+        except Exception as e:
+            # 目录未加载时读取回源数据库，后台任务会继续重试
+            logger.error(f"加载内容目录失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(item_catalog.watch(
+            AsyncSessionLocal,
+            settings.ITEM_CATALOG_REFRESH_INTERVAL_S,
+            settings.ITEM_CATALOG_FULL_RELOAD_S,
+        )))
+    
+    # 统计内容热度并按events.id水位增量刷新
+    if settings.POPULARITY_ENABLED:
+        try:
+            await popularity_counters.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"加载内容热度计数失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(popularity_counters.watch(
+            AsyncSessionLocal,
+            settings.POPULARITY_REFRESH_INTERVAL_S,
+            settings.POPULARITY_FULL_RELOAD_S,
+        )))
+    
+    # 加载相关内容表（由scripts/build_item_related.py离线计算）并增量刷新
+    if settings.ITEM_RELATED_ENABLED:
+        try:
+            await item_related_index.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"加载相关内容表失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(item_related_index.watch(
+            AsyncSessionLocal,
+            settings.ITEM_RELATED_REFRESH_INTERVAL_S,
+            settings.ITEM_RELATED_FULL_RELOAD_S,
+        )))
+    
+    # 加载用户-内容关系图并增量刷新，本进程写入的关系由/relations/upsert直接追加
+    if settings.RELATION_GRAPH_ENABLED:
+        try:
+            await relation_graph.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"加载关系图失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(relation_graph.watch(
+            AsyncSessionLocal,
+            settings.RELATION_GRAPH_REFRESH_INTERVAL_S,
+            settings.RELATION_GRAPH_FULL_RELOAD_S,
+        )))
+    
+    # 已看记录从当前事件水位开始拉取，用户历史在首次查询时加载
+    if settings.SEEN_HISTORY_ENABLED:
+        try:
+            await seen_history.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"初始化已看记录失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(seen_history.watch(
+            AsyncSessionLocal,
+            settings.SEEN_HISTORY_REFRESH_INTERVAL_S,
+        )))
+    
+    # 拉黑列表按用户惰性加载，其他进程写入的变化定期拉取后失效
+    if settings.NEGATIVE_FEEDBACK_ENABLED:
+        try:
+            await negative_feedback.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"初始化负反馈缓存失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(negative_feedback.watch(
+            AsyncSessionLocal,
+            settings.NEGATIVE_FEEDBACK_REFRESH_INTERVAL_S,
+        )))
+    
+    # 映射向量存储（到期时先导出），之后定期检查新版本
+    if settings.EMBEDDING_STORE_ENABLED:
+        try:
+            await refresh_stores(AsyncSessionLocal, settings.EMBEDDING_STORE_EXPORT_INTERVAL_S)
+        except Exception as e:
+            logger.error(f"加载向量存储失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(watch_stores(
+            AsyncSessionLocal,
+            settings.EMBEDDING_STORE_CHECK_INTERVAL_S,
+            settings.EMBEDDING_STORE_EXPORT_INTERVAL_S,
+        )))
+    
+    # 加载内容向量索引并增量刷新
+    if settings.ITEM_VECTOR_INDEX_ENABLED:
+        try:
+            await item_vector_index.load(AsyncSessionLocal)
+        except Exception as e:
+            logger.error(f"加载内容向量索引失败: {str(e)}")
+        background_tasks.append(asyncio.create_task(item_vector_index.watch(
+            AsyncSessionLocal,
+            settings.ITEM_VECTOR_INDEX_REFRESH_INTERVAL_S,
+            settings.ITEM_VECTOR_INDEX_FULL_RELOAD_S,
+        )))
 
 # 关闭事件
 @app.on_event("shutdown")
 async def shutdown_event():
-    logger.info(f"Shutting down {settings.PROJECT_NAME}")
\ No newline at end of file
+    logger.info(f"Shutting down {settings.PROJECT_NAME}")
+    for task in background_tasks:
+        task.cancel()
\ No newline at end of file
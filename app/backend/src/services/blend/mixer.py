@@ -16,6 +16,7 @@ async def blend_feed(
     geo: Optional[str] = None,
     ab: Optional[str] = None,
     debug: bool = False,
+    seed: Optional[str] = None,
 ) -> List[FeedItem]:
     """
     混排服务：整合推荐内容、广告和商品
@@ -31,6 +32,7 @@ async def blend_feed(
         geo: 地理位置
         ab: AB测试分组
         debug: 是否为调试模式
+        seed: cursor中的随机种子，用于随机结果的稳定分页
         
     Returns:
         List[FeedItem]: 混排后的内容列表
@@ -53,6 +55,7 @@ async def blend_feed(
         "device": device,
         "geo": geo,
         "ab": ab,
-        "debug": debug
+        "debug": debug,
+        "seed": seed,
     })
-    return await get_recommended_items(db, user_id, count, offset)
\ No newline at end of file
+    return await get_recommended_items(db, user_id, count, offset, seed=seed)
\ No newline at end of file
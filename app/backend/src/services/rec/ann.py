@@ -0,0 +1,245 @@
+from typing import Dict, List, Any, Optional, Set, Tuple
+import numpy as np
+
+from src.core.logger import logger
+from src.services.rec.batch import topk
+
+METRICS = ("cosine", "l2")
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def l2_score(distance: np.ndarray) -> np.ndarray:
+    """欧氏距离转换为(0, 1]的相似度分数，距离越小分数越高"""
+    return 1.0 / (1.0 + distance)
+
+class IVFIndex:
+    """倒排文件（IVF）近似最近邻索引
+
+    向量保存在float32矩阵中，按行编号；粗量化器是在归一化向量上训练的k-means
+    质心，每个质心对应一个倒排列表。查询时只扫描与查询向量最接近的nprobe个列表，
+    再在这些行上精确计算分数。
+
+    同一个索引同时支持cosine和l2：两者都由点积和预先计算的范数得到。
+    新增向量分配到最近的质心，删除只标记行失效并从倒排列表移除，空闲行被复用；
+    数据量相对训练时增长较多后应调用train()重新训练。
+    未训练或数据量较小时退化为精确扫描。
+    """
+
+    def __init__(self, dim: Optional[int] = None, nlist: Optional[int] = None,
+                 brute_force_below: int = 4096, kmeans_iterations: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.brute_force_below = brute_force_below
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._row_of: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._rows = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._members: List[Set[int]] = []
+        self._lists: List[Optional[np.ndarray]] = []
+        self.trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._row_of
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # 写入
+
+    def _grow(self, rows: int):
+        capacity = len(self._ids)
+        if rows <= capacity:
+            return
+        old_capacity = capacity
+        capacity = max(rows, capacity * 2, 1024)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:old_capacity] = self._vectors
+        self._vectors = vectors
+        for name, dtype in (("_norms", np.float32), ("_ids", np.int64), ("_alive", bool), ("_assign", np.int32)):
+            column = np.zeros(capacity, dtype=dtype)
+            column[:old_capacity] = getattr(self, name)
+            setattr(self, name, column)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """新增或覆盖向量"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("向量必须是与ID数量一致的二维数组")
+        if not len(ids):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+
+        rows = np.empty(len(ids), dtype=np.int64)
+        for i, item_id in enumerate(ids.tolist()):
+            row = self._row_of.get(item_id)
+            if row is None:
+                row = self._free.pop() if self._free else None
+            if row is None:
+                row = self._rows
+                self._rows += 1
+            else:
+                self._unlist(row)
+            self._row_of[item_id] = row
+            rows[i] = row
+        self._grow(self._rows)
+
+        self._vectors[rows] = vectors
+        self._norms[rows] = np.linalg.norm(vectors, axis=1)
+        self._ids[rows] = ids
+        self._alive[rows] = True
+        if self.trained:
+            self._assign[rows] = self._nearest(vectors)
+            for row, list_no in zip(rows.tolist(), self._assign[rows].tolist()):
+                self._members[list_no].add(row)
+                self._lists[list_no] = None
+
+    def remove(self, ids: np.ndarray):
+        """删除向量，不存在的ID被忽略"""
+        for item_id in np.asarray(ids, dtype=np.int64).tolist():
+            row = self._row_of.pop(item_id, None)
+            if row is None:
+                continue
+            self._unlist(row)
+            self._alive[row] = False
+            self._free.append(row)
+
+    def _unlist(self, row: int):
+        if self.trained and self._alive[row]:
+            list_no = int(self._assign[row])
+            self._members[list_no].discard(row)
+            self._lists[list_no] = None
+
+    # 训练
+
+    def train(self, nlist: Optional[int] = None, sample_size: int = 100000):
+        """在现有向量上训练粗量化器并重建倒排列表"""
+        alive = np.flatnonzero(self._alive[:self._rows])
+        if not len(alive):
+            return
+        nlist = nlist or self.nlist or int(np.clip(4 * np.sqrt(len(alive)), 16, 4096))
+        nlist = min(nlist, len(alive))
+        rng = np.random.default_rng(self.seed)
+        sample = alive if len(alive) <= sample_size else rng.choice(alive, sample_size, replace=False)
+        data = _normalize(self._vectors[sample])
+
+        # 球面k-means
+        centroids = data[rng.choice(len(data), nlist, replace=False)]
+        for _ in range(self.kmeans_iterations):
+            assign = self._nearest_in(data, centroids)
+            # 按簇排序后分段求和，空簇保留原质心
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            centroids[nonempty] = _normalize(np.add.reduceat(data[order], starts, axis=0))
+
+        self.centroids = centroids.astype(np.float32)
+        self.nlist = nlist
+        self._assign[alive] = self._nearest(self._vectors[alive])
+        self._members = [set() for _ in range(nlist)]
+        for row, list_no in zip(alive.tolist(), self._assign[alive].tolist()):
+            self._members[list_no].add(row)
+        self._lists = [None] * nlist
+        self.trained_size = len(alive)
+        logger.info(f"IVF索引训练完成: {len(alive)} 条向量, {nlist} 个倒排列表")
+
+    @staticmethod
+    def _nearest_in(data: np.ndarray, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+        assign = np.empty(len(data), dtype=np.int32)
+        for start in range(0, len(data), batch):
+            assign[start:start + batch] = np.argmax(data[start:start + batch] @ centroids.T, axis=1)
+        return assign
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        return self._nearest_in(_normalize(vectors), self.centroids)
+
+    def _list(self, list_no: int) -> np.ndarray:
+        rows = self._lists[list_no]
+        if rows is None:
+            rows = self._lists[list_no] = np.fromiter(self._members[list_no], dtype=np.int64)
+        return rows
+
+    # 查询
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray, metric: str) -> np.ndarray:
+        dots = self._vectors[rows] @ query
+        query_norm = float(np.linalg.norm(query))
+        if metric == "cosine":
+            return dots / np.maximum(self._norms[rows] * query_norm, 1e-12)
+        squared = np.maximum(self._norms[rows] ** 2 + query_norm ** 2 - 2 * dots, 0.0)
+        return l2_score(np.sqrt(squared))
+
+    def _top(self, rows: np.ndarray, query: np.ndarray, k: int, metric: str,
+             min_score: Optional[float], exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if metric not in METRICS:
+            raise ValueError(f"不支持的距离度量: {metric}")
+        if exclude is not None and len(exclude):
+            rows = rows[~np.isin(self._ids[rows], exclude)]
+        scores = self._scores(rows, query, metric)
+        if min_score is not None:
+            keep = scores >= min_score
+            rows, scores = rows[keep], scores[keep]
+        order = topk(scores, k)
+        return self._ids[rows[order]], scores[order].astype(np.float64)
+
+    def brute_force(self, query: np.ndarray, k: int, metric: str = "cosine",
+                    min_score: Optional[float] = None,
+                    exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """精确扫描全部向量"""
+        rows = np.flatnonzero(self._alive[:self._rows])
+        return self._top(rows, np.asarray(query, dtype=np.float32), k, metric, min_score, exclude)
+
+    def search(self, query: np.ndarray, k: int, metric: str = "cosine", nprobe: int = 8,
+               min_score: Optional[float] = None,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """近似最近邻查询
+
+        cosine分数为余弦相似度，l2分数为1/(1+欧氏距离)，分数均越大越相似。
+
+        Args:
+            query: 查询向量
+            k: 返回数量
+            metric: 距离度量，cosine或l2
+            nprobe: 扫描的倒排列表数量
+            min_score: 最低分数
+            exclude: 跳过的内容ID，在计算分数之前去掉
+
+        Returns:
+            内容ID和分数，按分数从高到低排序
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self.dim is not None and len(query) != self.dim:
+            raise ValueError(f"查询向量维度 {len(query)} 与索引维度 {self.dim} 不一致")
+        if not self.trained or len(self) < self.brute_force_below or nprobe >= self.nlist:
+            return self.brute_force(query, k, metric, min_score, exclude)
+        probe = topk(self.centroids @ _normalize(query), nprobe)
+        rows = np.concatenate([self._list(int(list_no)) for list_no in probe])
+        return self._top(rows, query, k, metric, min_score, exclude)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": len(self),
+            "dim": self.dim,
+            "trained": self.trained,
+            "nlist": self.nlist if self.trained else None,
+            "trained_size": self.trained_size,
+            "free_rows": len(self._free),
+        }
@@ -1,49 +1,51 @@
 from typing import List, Optional, Dict, Any
-from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 import uuid
 from datetime import datetime
 import os
 import json
+import time
 
 from src.db.models import Item, User
 from src.db.schemas import FeedItem
+from src.db.session import AsyncSessionLocal
+from src.core.config import settings
 from src.core.logger import logger
 from src.services.rec.config.dag import DAGManager
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.hydration import hydrate_items, load_items, author_name
+from src.services.rec.sampling import sample_item_ids
+from src.services.rec.negative import negative_feedback
+from src.services.rec.exclusion import recall_exclusion
+from src.services.rec.trace import TraceInfo
 
 # 初始化DAG管理器
 dag_config_dir = os.path.join(os.path.dirname(__file__), "config/dags")
-dag_manager = DAGManager(dag_config_dir)
+dag_manager = DAGManager(dag_config_dir, session_factory=AsyncSessionLocal)
 
-async def get_random_items(db: AsyncSession, count: int, offset: int = 0) -> List[FeedItem]:
+async def get_random_items(db: AsyncSession, count: int, offset: int = 0,
+                           seed: Optional[str] = None) -> List[FeedItem]:
     """
-    从数据库随机获取指定数量的内容项
+    随机获取指定数量的内容项
+    
+    在内容目录的ID数组上抽样（目录不可用时使用TABLESAMPLE），不对全表排序。
+    这里也是所有DAG失败时的降级路径，需要在系统异常时保持低开销。
     
     Args:
         db: 数据库会话
         count: 需要获取的内容数量
-        offset: 偏移量，用于分页
+        offset: 偏移量，用于分页（有种子时生效）
+        seed: 随机种子（来自cursor），相同种子的各页结果确定且不重复
         
     Returns:
         List[FeedItem]: 内容项列表
     """
-    # 构建查询，包括关联的作者信息
-    query = (
-        select(Item)
-        .options(selectinload(Item.author))
-        # .where(Item.kind == 'content')
-        .order_by(func.random())
-        .limit(count)
-        .offset(offset)
-    )
+    ids = await sample_item_ids(db, None, count, offset, seed)
+    logger.debug("Random sample", extra={"count": count, "offset": offset, "seed": seed, "sampled": len(ids)})
     
-    # 记录SQL语句，用于调试
-    logger.debug("SQL query", extra={"query": str(query), "count": count, "offset": offset})
-    
-    # 执行查询
-    result = await db.execute(query)
-    items_db = result.scalars().all()
+    # 优先读取内容目录，未命中的内容连同作者一次性查询
+    items = await load_items(db, ids)
+    items_db = [items[item_id] for item_id in ids if item_id in items]
     
     # 将数据库模型转换为API响应模型
     feed_items: List[FeedItem] = []
@@ -71,7 +73,7 @@ async def get_random_items(db: AsyncSession, count: int, offset: int = 0) -> Lis
                 "description": item_db.content,
                 "author": {
                     "id": item_db.author_id,
-                    "name": item_db.author.username if item_db.author else "未知作者"
+                    "name": author_name(item_db)
                 },
                 "created_at": item_db.created_at.isoformat(),
                 "media": item_db.media,
@@ -83,7 +85,7 @@ async def get_random_items(db: AsyncSession, count: int, offset: int = 0) -> Lis
                 "description": item_db.content,
                 "advertiser": {
                     "id": item_db.author_id,
-                    "name": item_db.author.username if item_db.author else "未知广告主"
+                    "name": author_name(item_db, "未知广告主")
                 },
                 "image_url": item_db.media.get("image_url") if item_db.media else None,
                 "landing_url": item_db.media.get("landing_url", "#") if item_db.media else "#",
@@ -97,7 +99,7 @@ async def get_random_items(db: AsyncSession, count: int, offset: int = 0) -> Lis
                 "original_price": item_db.media.get("original_price", 199.9) if item_db.media else 199.9,
                 "seller": {
                     "id": item_db.author_id,
-                    "name": item_db.author.username if item_db.author else "未知卖家"
+                    "name": author_name(item_db, "未知卖家")
                 },
                 "image_url": item_db.media.get("image_url") if item_db.media else None,
                 "sales": item_db.media.get("sales", 100) if item_db.media else 100,
@@ -116,7 +118,7 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
         user_id: 用户ID
         count: 需要获取的内容数量
         offset: 偏移量，用于分页
-        **kwargs: 其他参数，如场景、设备、地理位置等
+        **kwargs: 其他参数，如场景、设备、地理位置、随机种子seed、延迟预算timeout_ms等
         
     Returns:
         List[Dict[str, Any]]: 推荐结果列表
@@ -125,8 +127,7 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
     logger.info(f"开始执行推荐DAG，用户ID: {user_id}, 数量: {count}, 偏移: {offset}")
     
     # 创建trace信息
-    from src.services.rec.trace import TraceInfo
-    trace = TraceInfo()
+    trace = kwargs.get("trace") or TraceInfo()
     
     # 获取DAG
     dag = dag_manager.get_dag("feed_rec")
@@ -134,7 +135,7 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
         logger.warning("推荐DAG不存在，使用随机推荐")
         # 如果DAG不存在，使用随机推荐
         trace.add_error("dag_manager", "推荐DAG不存在，使用随机推荐")
-        random_items = await get_random_items(db, count, offset)
+        random_items = await get_random_items(db, count, offset, kwargs.get("seed"))
         logger.info(f"使用随机推荐，返回 {len(random_items)} 个结果")
         trace.add_node_detail("random_fallback", "count", len(random_items))
         trace.complete("fallback")
@@ -152,27 +153,38 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
             "trace_info": trace.to_dict()
         } for item in random_items]
     
+    # 在后台预取拉黑列表，与召回并行，过滤节点同步读取
+    negative_feedback.prefetch(AsyncSessionLocal, user_id)
+    
+    # 请求级延迟预算，召回分支在截止时间前未完成将被取消
+    timeout_ms = kwargs.get("timeout_ms") or settings.REC_DAG_TIMEOUT_MS
+    
     # 构建上下文
     context = {
         "db": db,
+        "session_factory": AsyncSessionLocal,  # 并行分支使用独立会话
         "user_id": user_id,
         "count": count,
         "offset": offset,
+        "seed": kwargs.get("seed"),  # cursor中的随机种子，随机召回据此分页
+        "exclusion": recall_exclusion(AsyncSessionLocal, user_id),  # 召回时排除拉黑和看过的内容，各召回节点共享
         "scene": kwargs.get("scene", "feed"),
         "slot": kwargs.get("slot"),
         "device": kwargs.get("device"),
         "geo": kwargs.get("geo"),
         "ab": kwargs.get("ab"),
         "debug": kwargs.get("debug", False),
+        "timeout_ms": timeout_ms,
+        "deadline": time.monotonic() + timeout_ms / 1000,
         "trace": trace  # 添加trace信息
     }
     
     try:
         # 执行DAG
-        start_time = __import__("time").time()
+        start_time = time.time()
         try:
             results = await dag.execute(context)
-            end_time = __import__("time").time()
+            end_time = time.time()
             
             # 记录执行时间
             duration_ms = int((end_time - start_time) * 1000)
@@ -184,8 +196,13 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
             raise inner_e
         
         # 获取最终结果
-        # 最后一个节点的输出作为最终结果
-        final_node = "rerank"  # 最后一个节点
+        # 执行计划中声明的输出节点
+        final_node = dag.output_node
+        # 列式候选集在出口处转换为字典视图
+        results = {
+            node_id: result.to_dicts() if isinstance(result, CandidateBatch) else result
+            for node_id, result in results.items()
+        }
         if final_node in results:
             result_count = len(results[final_node]) if isinstance(results[final_node], list) else 0
             logger.info(f"使用最终节点 {final_node} 的结果，返回 {result_count} 个结果")
@@ -212,7 +229,7 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
             logger.warning("DAG执行没有产生有效结果，使用随机推荐")
             trace.add_error("dag_execution", "没有找到有效的结果")
             trace.add_node_detail("random_fallback", "error", "no_valid_results")
-            random_items = await get_random_items(db, count, offset)
+            random_items = await get_random_items(db, count, offset, kwargs.get("seed"))
             trace.add_node_detail("random_fallback", "count", len(random_items))
             trace.complete("fallback")
             return [{
@@ -237,7 +254,7 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
         trace.add_error("dag_execution", error_msg)
         
         # 出错时使用随机推荐
-        random_items = await get_random_items(db, count, offset)
+        random_items = await get_random_items(db, count, offset, kwargs.get("seed"))
         
         # 记录随机推荐信息
         trace.add_node_detail("random_fallback", "count", len(random_items))
@@ -258,19 +275,28 @@ async def execute_recommendation_dag(db: AsyncSession, user_id: Optional[int], c
             "trace_info": trace.to_dict()
         } for item in random_items]
 
-async def format_recommendation_results(db: AsyncSession, items: List[Dict[str, Any]]) -> List[FeedItem]:
+async def format_recommendation_results(db: AsyncSession, items: List[Dict[str, Any]],
+                                        trace: Optional[TraceInfo] = None) -> List[FeedItem]:
     """
     将推荐结果格式化为API响应格式
     
     Args:
         db: 数据库会话
         items: 推荐结果列表
+        trace: 追踪信息，用于记录内容加载耗时
         
     Returns:
         List[FeedItem]: 格式化后的推荐结果
     """
     feed_items: List[FeedItem] = []
     
+    # 一次性加载最终结果的完整内容和作者，保持排序顺序
+    if trace:
+        trace.start_node("hydration", "Hydration")
+    items_db = await hydrate_items(db, items, trace)
+    if trace:
+        trace.end_node("hydration", "success", len(items_db))
+    
     for i, item in enumerate(items):
         position = i + 1
         
@@ -318,16 +344,10 @@ async def format_recommendation_results(db: AsyncSession, items: List[Dict[str,
         kind = item.get('kind', 'content')
         if kind == "content":
             # 获取详细信息
-            # 确保item_id是整数类型
             try:
-                item_id = item.get('id')
-                item_id_int = int(item_id)
-                item_query = select(Item).where(Item.id == item_id_int)
-                item_result = await db.execute(item_query)
-                item_db = item_result.scalar_one_or_none()
-            except (ValueError, TypeError) as e:
-                logger.error(f"获取项目详情失败，ID类型转换错误: {str(e)}")
-                return None
+                item_db = items_db.get(int(item.get('id')))
+            except (ValueError, TypeError):
+                item_db = None
             
             if item_db:
                 feed_item.content = {
@@ -335,7 +355,7 @@ async def format_recommendation_results(db: AsyncSession, items: List[Dict[str,
                     "description": item_db.content,
                     "author": {
                         "id": item_db.author_id,
-                        "name": "未知作者"  # 简化处理，实际应该查询作者信息
+                        "name": author_name(item_db)
                     },
                     "created_at": item_db.created_at.isoformat() if item_db.created_at else None,
                     "media": item_db.media,
@@ -378,11 +398,12 @@ async def get_recommended_items(db: AsyncSession, user_id: Optional[int], count:
     logger.debug("Recommendation parameters", extra={"user_id": user_id, "count": count, "offset": offset})
     
     try:
-        # 执行推荐DAG
-        rec_items = await execute_recommendation_dag(db, user_id, count, offset, **kwargs)
+        # 执行推荐DAG，格式化阶段沿用同一个trace
+        trace = kwargs.pop("trace", None) or TraceInfo()
+        rec_items = await execute_recommendation_dag(db, user_id, count, offset, trace=trace, **kwargs)
         
         # 格式化结果
-        feed_items = await format_recommendation_results(db, rec_items)
+        feed_items = await format_recommendation_results(db, rec_items, trace)
         
         return feed_items
     except Exception as e:
@@ -394,4 +415,4 @@ async def get_recommended_items(db: AsyncSession, user_id: Optional[int], count:
             logger.error(f"回滚事务失败: {str(rollback_error)}")
         
         # 出错时使用随机推荐
-        return await get_random_items(db, count, offset)
\ No newline at end of file
+        return await get_random_items(db, count, offset, kwargs.get("seed"))
\ No newline at end of file
@@ -0,0 +1,394 @@
+from typing import Dict, List, Any, Optional, Iterable, Sequence, Union
+from datetime import datetime, timezone
+import numpy as np
+
+# 整数列的缺失值
+INT_MISSING = -1
+# 整数列（ID类字段），缺失时使用INT_MISSING
+INT_FIELDS = {"author_id"}
+# 分数列，始终存为float64，缺失时为nan
+FLOAT_FIELDS = {"match_score", "popularity", "original_score"}
+# 特征列前缀，字典视图中还原为features字典
+FEATURE_PREFIX = "feature."
+
+class TagVocab:
+    """标签字典，将标签字符串驻留为整数ID，进程内共享"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._tags: List[str] = []
+
+    def intern(self, tag: str) -> int:
+        tag_id = self._ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self._tags)
+            self._ids[tag] = tag_id
+            self._tags.append(tag)
+        return tag_id
+
+    def lookup(self, tag_id: int) -> str:
+        return self._tags[tag_id]
+
+    def get(self, tag: str) -> Optional[int]:
+        return self._ids.get(tag)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+# 全局标签字典
+tag_vocab = TagVocab()
+
+def _is_float_field(name: str) -> bool:
+    return name in FLOAT_FIELDS or name.endswith("_score")
+
+def _parse_timestamp(value: Any) -> float:
+    """将datetime或ISO字符串转换为时间戳，无法解析时返回nan"""
+    if value is None:
+        return np.nan
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.timestamp()
+    except (ValueError, TypeError, AttributeError, OSError):
+        return np.nan
+
+def _infer_column(name: str, values: List[Any]) -> Optional[np.ndarray]:
+    """根据字段名和取值推断列类型，全部缺失时返回None"""
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    if _is_float_field(name):
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    if name in INT_FIELDS:
+        return np.array([INT_MISSING if v is None else int(v) for v in values], dtype=np.int64)
+    if len(present) == len(values):
+        if all(isinstance(v, bool) for v in present):
+            return np.array(values, dtype=bool)
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+            return np.array(values, dtype=np.int64)
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present) \
+            and any(isinstance(v, float) for v in present):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+def _missing_like(column: np.ndarray, n: int) -> np.ndarray:
+    """生成与column类型相同、长度为n的缺失值列"""
+    if column.dtype == np.float64:
+        return np.full(n, np.nan)
+    if column.dtype == np.int64:
+        return np.full(n, INT_MISSING, dtype=np.int64)
+    if column.dtype == bool:
+        return np.zeros(n, dtype=bool)
+    return np.full(n, None, dtype=object)
+
+def _full(n: int, value: Any) -> np.ndarray:
+    """标量广播为列"""
+    if isinstance(value, bool) or value is None or isinstance(value, (str, dict, list, tuple)):
+        column = np.empty(n, dtype=object)
+        column[:] = [value] * n
+        return column
+    if isinstance(value, (int, np.integer)):
+        return np.full(n, value, dtype=np.int64)
+    return np.full(n, value, dtype=np.float64)
+
+class CandidateBatch:
+    """列式候选集
+
+    用NumPy列保存候选项：ids、分数、作者ID、创建时间戳等，标签驻留为整数ID并以
+    CSR形式保存（tag_offsets / tag_ids），其余轻量属性保存在object列中。
+
+    批次在节点间按不可变约定传递：节点不修改已有的列，通过with_columns / take
+    生成新批次（未变化的列共享同一数组），因此同一批次可以安全地被多个下游读取。
+    字典视图（to_dicts）只用于调试trace和兼容按字典处理的节点。
+    """
+
+    def __init__(self, ids: np.ndarray,
+                 columns: Optional[Dict[str, np.ndarray]] = None,
+                 tag_offsets: Optional[np.ndarray] = None,
+                 tag_ids: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.columns: Dict[str, np.ndarray] = columns if columns is not None else {}
+        n = len(self.ids)
+        self.tag_offsets = tag_offsets if tag_offsets is not None else np.zeros(n + 1, dtype=np.int64)
+        self.tag_ids = tag_ids if tag_ids is not None else np.zeros(0, dtype=np.int32)
+
+    # ---------- 构建与转换 ----------
+
+    @classmethod
+    def empty(cls) -> "CandidateBatch":
+        return cls(np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def from_dicts(cls, items: Sequence[Dict[str, Any]]) -> "CandidateBatch":
+        """从候选项字典列表构建批次，列类型按字段名和取值推断"""
+        n = len(items)
+        if n == 0:
+            return cls.empty()
+        ids = np.fromiter((int(item["id"]) for item in items), dtype=np.int64, count=n)
+
+        # 收集字段，保持首次出现的顺序
+        names: Dict[str, None] = {}
+        for item in items:
+            for name in item:
+                names.setdefault(name, None)
+            features = item.get("features")
+            if isinstance(features, dict):
+                for name in features:
+                    names.setdefault(FEATURE_PREFIX + name, None)
+
+        columns: Dict[str, np.ndarray] = {}
+        tag_offsets = tag_ids = None
+        for name in names:
+            if name in ("id", "features"):
+                continue
+            if name == "tags":
+                tag_offsets, tag_ids = cls._intern_tags([item.get("tags") for item in items])
+                continue
+            if name == "created_at":
+                columns["created_ts"] = np.fromiter(
+                    (_parse_timestamp(item.get("created_at")) for item in items), dtype=np.float64, count=n)
+                continue
+            if name.startswith(FEATURE_PREFIX):
+                key = name[len(FEATURE_PREFIX):]
+                values = [(item.get("features") or {}).get(key) for item in items]
+            else:
+                values = [item.get(name) for item in items]
+            column = _infer_column(name, values)
+            if column is not None:
+                columns[name] = column
+        return cls(ids, columns, tag_offsets, tag_ids)
+
+    @classmethod
+    def ensure(cls, data: Any) -> "CandidateBatch":
+        """将节点输入统一为批次"""
+        if isinstance(data, CandidateBatch):
+            return data
+        if not data:
+            return cls.empty()
+        return cls.from_dicts(data)
+
+    @staticmethod
+    def _intern_tags(tag_lists: List[Any]):
+        lengths = np.zeros(len(tag_lists) + 1, dtype=np.int64)
+        flat: List[int] = []
+        intern = tag_vocab.intern
+        for i, tags in enumerate(tag_lists):
+            if isinstance(tags, list):
+                flat.extend(intern(tag) for tag in tags)
+                lengths[i + 1] = len(tags)
+        return np.cumsum(lengths), np.array(flat, dtype=np.int32)
+
+    def to_dicts(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """字典视图，用于调试trace和按字典处理的下游"""
+        n = len(self) if limit is None else min(limit, len(self))
+        rows: List[Dict[str, Any]] = [{"id": item_id} for item_id in self.ids[:n].tolist()]
+        if not n:
+            return rows
+
+        tag_lists = self.tag_lists(names=True)
+        has_tags = len(self.tag_ids) > 0
+        for name, column in self.columns.items():
+            values = column[:n].tolist()
+            if name == "created_ts":
+                for row, ts in zip(rows, values):
+                    row["created_at"] = (datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                                         if ts == ts else None)
+                continue
+            feature = name[len(FEATURE_PREFIX):] if name.startswith(FEATURE_PREFIX) else None
+            missing_int = column.dtype == np.int64 and name in INT_FIELDS
+            for row, value in zip(rows, values):
+                if value is None or value != value or (missing_int and value == INT_MISSING):
+                    continue
+                if feature is not None:
+                    row.setdefault("features", {})[feature] = value
+                else:
+                    row[name] = value
+        if has_tags:
+            for row, tags in zip(rows, tag_lists):
+                row["tags"] = tags
+        return rows
+
+    # ---------- 基本属性 ----------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def has_column(self, name: str) -> bool:
+        return name in self.columns
+
+    def column(self, name: str) -> Optional[np.ndarray]:
+        return self.columns.get(name)
+
+    def scores(self, name: str, default: float = 0.0) -> np.ndarray:
+        """读取分数列，缺失时使用default"""
+        column = self.columns.get(name)
+        if column is None:
+            return np.full(len(self), default, dtype=np.float64)
+        column = column.astype(np.float64, copy=False)
+        return np.where(np.isnan(column), default, column)
+
+    def coalesce(self, names: Iterable[str], default: float = 0.0) -> np.ndarray:
+        """按顺序取第一个存在的分数列，等价于逐个dict.get的回退链"""
+        result = np.full(len(self), np.nan)
+        for name in names:
+            column = self.columns.get(name)
+            if column is None:
+                continue
+            result = np.where(np.isnan(result), column.astype(np.float64, copy=False), result)
+        return np.where(np.isnan(result), default, result)
+
+    def values(self, name: str) -> List[Any]:
+        """列的Python取值列表，缺失值为None，用于逐项的贪心逻辑"""
+        if name == "tags":
+            return self.tag_lists()
+        if name == "id":
+            return self.ids.tolist()
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * len(self)
+        values = column.tolist()
+        if column.dtype == np.float64:
+            return [None if v != v else v for v in values]
+        if column.dtype == np.int64 and name in INT_FIELDS:
+            return [None if v == INT_MISSING else v for v in values]
+        return values
+
+    @property
+    def author_ids(self) -> np.ndarray:
+        column = self.columns.get("author_id")
+        if column is None:
+            return np.full(len(self), INT_MISSING, dtype=np.int64)
+        return column
+
+    @property
+    def created_ts(self) -> np.ndarray:
+        column = self.columns.get("created_ts")
+        if column is None:
+            return np.full(len(self), np.nan)
+        return column
+
+    def feature_names(self) -> List[str]:
+        """特征列名（不含前缀）"""
+        return [name[len(FEATURE_PREFIX):] for name in self.columns if name.startswith(FEATURE_PREFIX)]
+
+    def tag_counts(self) -> np.ndarray:
+        return np.diff(self.tag_offsets)
+
+    def tag_lists(self, names: bool = False) -> List[List[Any]]:
+        """每个候选项的标签ID列表（names为True时返回标签字符串）"""
+        offsets = self.tag_offsets.tolist()
+        flat = self.tag_ids.tolist()
+        if names:
+            lookup = tag_vocab.lookup
+            flat = [lookup(tag_id) for tag_id in flat]
+        return [flat[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    # ---------- 派生新批次 ----------
+
+    def with_columns(self, **columns: Any) -> "CandidateBatch":
+        """返回增加或替换了列的新批次，其余列共享"""
+        n = len(self)
+        merged = dict(self.columns)
+        for name, value in columns.items():
+            if isinstance(value, np.ndarray):
+                merged[name] = value
+            elif isinstance(value, list):
+                merged[name] = _infer_column(name, value) if value else np.zeros(0)
+            else:
+                merged[name] = _full(n, value)
+        return CandidateBatch(self.ids, merged, self.tag_offsets, self.tag_ids)
+
+    def with_features(self, features: Dict[str, Any]) -> "CandidateBatch":
+        """增加特征列，标量特征广播到所有候选项"""
+        return self.with_columns(**{FEATURE_PREFIX + name: value for name, value in features.items()})
+
+    def take(self, indices: Union[np.ndarray, List[int]]) -> "CandidateBatch":
+        """按下标选取候选项，保持下标顺序"""
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {name: column[indices] for name, column in self.columns.items()}
+
+        # 标签CSR按行收集
+        starts = self.tag_offsets[indices]
+        lengths = self.tag_offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        flat_index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return CandidateBatch(self.ids[indices], columns, offsets, self.tag_ids[flat_index])
+
+    def mask(self, keep: np.ndarray) -> "CandidateBatch":
+        """按布尔掩码过滤"""
+        if keep.all():
+            return self
+        return self.take(np.flatnonzero(keep))
+
+    def head(self, k: int) -> "CandidateBatch":
+        if k >= len(self):
+            return self
+        return self.take(np.arange(k))
+
+    def dedup(self) -> "CandidateBatch":
+        """按ID去重，保留首次出现的候选项"""
+        _, first = np.unique(self.ids, return_index=True)
+        if len(first) == len(self):
+            return self
+        first.sort()
+        return self.take(first)
+
+    def sort_by(self, scores: np.ndarray, k: Optional[int] = None) -> "CandidateBatch":
+        """按分数降序排列并截断到k个，分数相同时保持原顺序"""
+        return self.take(topk(scores, len(self) if k is None else k))
+
+    @classmethod
+    def concat(cls, batches: Sequence["CandidateBatch"]) -> "CandidateBatch":
+        """按顺序拼接多个批次，缺失的列以缺失值补齐"""
+        batches = [batch for batch in batches if batch is not None and len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        names: Dict[str, np.ndarray] = {}
+        for batch in batches:
+            for name, column in batch.columns.items():
+                names.setdefault(name, column)
+        columns = {
+            name: np.concatenate([
+                batch.columns[name] if name in batch.columns else _missing_like(template, len(batch))
+                for batch in batches
+            ])
+            for name, template in names.items()
+        }
+
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for batch in batches:
+            offsets.append(batch.tag_offsets[1:] + base)
+            base += batch.tag_offsets[-1]
+        return cls(
+            np.concatenate([batch.ids for batch in batches]),
+            columns,
+            np.concatenate(offsets),
+            np.concatenate([batch.tag_ids for batch in batches]),
+        )
+
+def topk(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的k个下标，降序且分数相同时保持原顺序（与sorted(reverse=True)一致）
+
+    k远小于候选数时先用argpartition选出前k，再只对这k个排序。
+    """
+    n = len(scores)
+    neg = np.where(np.isnan(scores), np.inf, -scores)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n or n <= 2 * k:
+        return np.argsort(neg, kind="stable")[:k]
+
+    part = np.argpartition(neg, k - 1)[:k]
+    kth = neg[part].max()
+    strict = np.flatnonzero(neg < kth)
+    ties = np.flatnonzero(neg == kth)[:k - len(strict)]
+    selected = np.concatenate([strict, ties])
+    selected.sort()
+    return selected[np.argsort(neg[selected], kind="stable")]
@@ -0,0 +1,162 @@
+from typing import Dict, List, Any, Optional, Deque, Tuple
+from collections import deque
+import time
+
+from src.core.logger import logger
+
+class CircuitBreaker:
+    """DAG节点熔断器
+
+    在滑动时间窗口内统计调用的错误率和慢调用率：
+    - closed: 正常执行，超过阈值后打开
+    - open: 跳过节点（或使用缓存输出），open_seconds后进入半开
+    - half_open: 放行少量探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, key: str, config: Dict[str, Any]):
+        self.key = key
+        self.configure(config)
+        self.state = self.CLOSED
+        self.opened_at: Optional[float] = None
+        self.open_count = 0
+        self.rejected_count = 0
+        self._probes_in_flight = 0
+        # 窗口内的调用记录：(时间, 是否失败, 是否慢调用)
+        self._window: Deque[Tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow_calls = 0
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """更新熔断参数"""
+        self.config = config
+        self.window_seconds = config.get('window_seconds', 30)
+        self.min_calls = config.get('min_calls', 20)
+        self.error_rate = config.get('error_rate', 0.5)
+        self.slow_call_ms = config.get('slow_call_ms')
+        self.slow_call_rate = config.get('slow_call_rate', 0.8)
+        self.open_seconds = config.get('open_seconds', 15)
+        self.half_open_probes = config.get('half_open_probes', 1)
+        self.fallback = config.get('fallback', 'skip')
+
+    def _evict(self, now: float) -> None:
+        """移除窗口外的调用记录"""
+        window = self._window
+        while window and now - window[0][0] > self.window_seconds:
+            _, failed, slow = window.popleft()
+            self._failures -= failed
+            self._slow_calls -= slow
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"节点熔断器 {self.key} 状态变更: {self.state} -> {state}")
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+        else:
+            self.opened_at = None
+        if state != self.HALF_OPEN:
+            self._probes_in_flight = 0
+        if state == self.CLOSED:
+            self._window.clear()
+            self._failures = 0
+            self._slow_calls = 0
+
+    def allow(self) -> bool:
+        """判断是否放行本次调用"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected_count += 1
+                return False
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected_count += 1
+                return False
+            self._probes_in_flight += 1
+
+        return True
+
+    def record(self, success: bool, duration_ms: float) -> None:
+        """记录调用结果"""
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._transition(self.CLOSED if success else self.OPEN)
+            return
+        if self.state == self.OPEN:
+            return
+
+        now = time.monotonic()
+        slow = self.slow_call_ms is not None and duration_ms >= self.slow_call_ms
+        self._window.append((now, not success, slow))
+        self._failures += not success
+        self._slow_calls += slow
+        self._evict(now)
+
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        if (self._failures / calls >= self.error_rate
+                or (self.slow_call_ms is not None and self._slow_calls / calls >= self.slow_call_rate)):
+            self._transition(self.OPEN)
+
+    def release(self) -> None:
+        """放行的调用被取消、没有结果时调用，归还半开状态的探测名额"""
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def reset(self) -> None:
+        """手动关闭熔断器"""
+        self._transition(self.CLOSED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出熔断器状态"""
+        self._evict(time.monotonic())
+        calls = len(self._window)
+        return {
+            "state": self.state,
+            "fallback": self.fallback,
+            "window_calls": calls,
+            "window_error_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "window_slow_rate": round(self._slow_calls / calls, 4) if calls else 0.0,
+            "open_count": self.open_count,
+            "rejected_count": self.rejected_count,
+            "open_remaining_s": (
+                round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 2)
+                if self.state == self.OPEN else 0.0
+            ),
+        }
+
+class CircuitBreakerRegistry:
+    """熔断器注册表，按"DAG.节点"索引，DAG重新加载后保留状态"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, dag_id: str, node_id: str, config: Optional[Dict[str, Any]]) -> Optional[CircuitBreaker]:
+        """获取节点熔断器，节点未启用熔断时返回None"""
+        if not config or not config.get('enabled', True):
+            return None
+        key = f"{dag_id}.{node_id}"
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key, config)
+            self._breakers[key] = breaker
+        elif breaker.config is not config:
+            breaker.configure(config)
+        return breaker
+
+    def find(self, key: str) -> Optional[CircuitBreaker]:
+        return self._breakers.get(key)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {key: breaker.snapshot() for key, breaker in self._breakers.items()}
+
+# 全局熔断器注册表
+breaker_registry = CircuitBreakerRegistry()
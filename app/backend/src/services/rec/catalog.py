@@ -0,0 +1,376 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import load_only, selectinload
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.db.models import Item, User
+from src.services.rec.batch import tag_vocab
+
+def _epoch(value: Optional[datetime]) -> float:
+    return value.timestamp() if value is not None else 0.0
+
+def _datetime(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc)
+
+class CatalogAuthor:
+    """目录中的作者记录，同一作者的内容共享一条记录"""
+
+    __slots__ = ('id', 'username', 'tags', 'created_at', 'updated_at')
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.update(user)
+
+    def update(self, user: User):
+        self.username = user.username
+        self.tags = user.tags
+        self.created_at = user.created_at
+        self.updated_at = user.updated_at
+
+class CatalogItem:
+    """目录中的内容记录
+
+    只保存召回、过滤和排序用到的字段：标签保存为词表ID，时间保存为epoch秒，
+    媒体只保存引用。标题、正文和原始标签不常驻内存，展示前由hydration按ID加载。
+    """
+
+    __slots__ = ('id', 'kind', 'tag_ids', 'author_id', 'author', 'media', 'created_ts', 'updated_ts')
+
+    # 构建记录需要从数据库读取的列
+    COLUMNS = (Item.id, Item.kind, Item.tags, Item.author_id, Item.media, Item.created_at, Item.updated_at)
+
+    def __init__(self, item: Item, author: Optional[CatalogAuthor]):
+        self.id = item.id
+        self.kind = item.kind
+        self.tag_ids = tuple(tag_vocab.intern(tag) for tag in item.tags) if isinstance(item.tags, list) else ()
+        self.author_id = item.author_id
+        self.author = author
+        self.media = item.media
+        self.created_ts = _epoch(item.created_at)
+        self.updated_ts = _epoch(item.updated_at)
+
+    @property
+    def created_at(self) -> datetime:
+        return _datetime(self.created_ts)
+
+    @property
+    def updated_at(self) -> datetime:
+        return _datetime(self.updated_ts)
+
+class ItemCatalog:
+    """进程内内容目录
+
+    启动时全量加载app.items及作者，之后按updated_at水位增量刷新。超过容量时
+    淘汰ID最小（最早）的内容，此时目录不完整，按类型列表的查询回源数据库。
+    目录未加载或超过最大陈旧时间时所有读取都回源数据库。
+
+    数据库中删除的内容无法通过水位发现，由定期全量重载清理。
+    
+    派生索引（如标签倒排索引）通过add_listener订阅目录变化：全量加载后调用
+    on_load(items)，增量写入调用on_upsert(old, new)，淘汰调用on_evict(item)。
+    """
+
+    def __init__(self, max_items: int = 200000, max_staleness_seconds: float = 300,
+                 overlap_seconds: float = 5.0, page_size: int = 5000):
+        self.max_items = max_items
+        self.max_staleness_seconds = max_staleness_seconds
+        # 增量刷新向前重叠的时间窗口，避免漏掉提交晚于水位的长事务
+        self.overlap_seconds = overlap_seconds
+        self.page_size = page_size
+        self._items: Dict[int, CatalogItem] = {}
+        self._authors: Dict[int, CatalogAuthor] = {}
+        self._kind_ids: Optional[Dict[str, np.ndarray]] = None
+        self._item_watermark: Optional[datetime] = None
+        self._user_watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self._listeners: List[Any] = []
+        self.loaded = False
+        self.complete = False
+        self.last_refresh_at: Optional[float] = None
+        self.last_full_load_at: Optional[float] = None
+        self._stats = dict.fromkeys(
+            ("hits", "misses", "bypassed", "refreshes", "refresh_errors", "upserts", "evictions"), 0)
+        self._last_refresh_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def staleness_seconds(self) -> Optional[float]:
+        """距离最近一次成功刷新的时间"""
+        if self.last_refresh_at is None:
+            return None
+        return time.time() - self.last_refresh_at
+
+    @property
+    def ready(self) -> bool:
+        """目录是否可以提供读取"""
+        if not self.loaded:
+            return False
+        return self.max_staleness_seconds <= 0 or self.staleness_seconds <= self.max_staleness_seconds
+
+    # 读取
+
+    def get(self, item_id: int) -> Optional[CatalogItem]:
+        """获取单个内容，未命中时返回None"""
+        if not self.ready:
+            self._stats["bypassed"] += 1
+            return None
+        item = self._items.get(item_id)
+        self._stats["hits" if item is not None else "misses"] += 1
+        return item
+
+    def get_many(self, ids: Iterable[int]) -> Tuple[Dict[int, CatalogItem], List[int]]:
+        """批量获取内容
+
+        Returns:
+            命中的内容（ID -> 内容）和未命中的ID列表
+        """
+        ids = list(dict.fromkeys(ids))
+        if not self.ready:
+            self._stats["bypassed"] += len(ids)
+            return {}, ids
+        found = {}
+        missing = []
+        for item_id in ids:
+            item = self._items.get(item_id)
+            if item is not None:
+                found[item_id] = item
+            else:
+                missing.append(item_id)
+        self._stats["hits"] += len(found)
+        self._stats["misses"] += len(missing)
+        return found, missing
+
+    def list_by_kind(self, kind: str, limit: int, offset: int = 0,
+                     exclude: Optional[np.ndarray] = None) -> Optional[List[CatalogItem]]:
+        """按ID顺序分页获取某个类型的内容，跳过exclude中的内容，目录不完整时返回None"""
+        if not self.ready or not self.complete:
+            self._stats["bypassed"] += 1
+            return None
+        ids = self._kind_index().get(kind)
+        if ids is None:
+            return []
+        if exclude is not None and len(exclude):
+            # 每个排除的ID最多占用一个位置
+            page = ids[offset:offset + limit + len(exclude)]
+            page = page[~np.isin(page, exclude)][:limit]
+        else:
+            page = ids[offset:offset + limit]
+        self._stats["hits"] += len(page)
+        return [self._items[int(item_id)] for item_id in page]
+
+    def kind_pools(self, kinds: Optional[Iterable[str]] = None) -> Optional[List[np.ndarray]]:
+        """按类型名排序的有序ID数组（kinds为None表示全部类型），目录不完整时返回None
+
+        返回的数组与目录共享，调用方不能修改。
+        """
+        if not self.ready or not self.complete:
+            self._stats["bypassed"] += 1
+            return None
+        index = self._kind_index()
+        names = sorted(index) if kinds is None else sorted(set(kinds))
+        return [index[kind] for kind in names if kind in index]
+
+    def _kind_index(self) -> Dict[str, np.ndarray]:
+        """按类型分组的有序ID，内容变化后惰性重建"""
+        kind_ids = self._kind_ids
+        if kind_ids is None:
+            groups: Dict[str, List[int]] = {}
+            for item_id, item in self._items.items():
+                groups.setdefault(item.kind, []).append(item_id)
+            kind_ids = {kind: np.sort(np.array(ids, dtype=np.int64)) for kind, ids in groups.items()}
+            self._kind_ids = kind_ids
+        return kind_ids
+
+    def items(self) -> Iterable[CatalogItem]:
+        """遍历目录中的内容"""
+        return self._items.values()
+
+    # 变化订阅
+
+    def add_listener(self, listener: Any):
+        """订阅目录变化，目录已加载时立即以当前内容调用on_load"""
+        self._listeners.append(listener)
+        if self.loaded:
+            listener.on_load(self._items.values())
+
+    def _notify(self, event: str, *args: Any):
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                logger.error(f"内容目录订阅者 {type(listener).__name__}.{event} 失败: {str(e)}")
+
+    # 加载与刷新
+
+    def _author(self, authors: Dict[int, CatalogAuthor], user: Optional[User]) -> Optional[CatalogAuthor]:
+        if user is None:
+            return None
+        author = authors.get(user.id)
+        if author is None:
+            author = authors[user.id] = CatalogAuthor(user)
+        else:
+            author.update(user)
+        return author
+
+    def _put(self, items: Dict[int, CatalogItem], authors: Dict[int, CatalogAuthor],
+             row: Item) -> Tuple[Optional[CatalogItem], CatalogItem, List[CatalogItem]]:
+        """写入一条内容，返回旧记录、新记录和被淘汰的记录"""
+        old = items.get(row.id)
+        new = items[row.id] = CatalogItem(row, self._author(authors, row.author))
+        evicted = []
+        while len(items) > self.max_items:
+            # 字典保持插入顺序，全量加载按ID升序写入，第一个即最早的内容
+            evicted.append(items.pop(next(iter(items))))
+        return old, new, evicted
+
+    async def load(self, session_factory: Callable):
+        """全量加载，构建完成后整体替换"""
+        start_time = time.perf_counter()
+        items: Dict[int, CatalogItem] = {}
+        authors: Dict[int, CatalogAuthor] = {}
+        item_watermark = None
+        user_watermark = None
+        evicted = 0
+        last_id = 0
+
+        async with session_factory() as db:
+            # 按ID分页加载
+            while True:
+                query = (
+                    select(Item)
+                    .options(load_only(*CatalogItem.COLUMNS), selectinload(Item.author))
+                    .where(Item.id > last_id)
+                    .order_by(Item.id)
+                    .limit(self.page_size)
+                )
+                rows = (await db.execute(query)).scalars().all()
+                for row in rows:
+                    evicted += len(self._put(items, authors, row)[2])
+                    if row.updated_at is not None and (item_watermark is None or row.updated_at > item_watermark):
+                        item_watermark = row.updated_at
+                    if row.author is not None and row.author.updated_at is not None and (
+                            user_watermark is None or row.author.updated_at > user_watermark):
+                        user_watermark = row.author.updated_at
+                if len(rows) < self.page_size:
+                    break
+                last_id = rows[-1].id
+
+        async with self._lock:
+            self._items = items
+            self._authors = authors
+            self._kind_ids = None
+            self._item_watermark = item_watermark
+            self._user_watermark = user_watermark
+            self.complete = evicted == 0
+            self.loaded = True
+            self.last_refresh_at = self.last_full_load_at = time.time()
+            self._stats["evictions"] += evicted
+            self._notify("on_load", items.values())
+            self._last_refresh_ms = (time.perf_counter() - start_time) * 1000
+
+        logger.info(f"内容目录全量加载完成: {len(items)} 条内容, {len(authors)} 位作者, "
+                    f"淘汰 {evicted} 条, 耗时 {self._last_refresh_ms:.1f}ms")
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """按updated_at水位增量刷新，返回更新的内容数量"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return len(self._items)
+
+        start_time = time.perf_counter()
+        async with self._lock, session_factory() as db:
+            upserts = 0
+
+            # 作者信息变化，原地更新使引用该作者的内容同时可见
+            if self._user_watermark is not None:
+                since = self._user_watermark - timedelta(seconds=self.overlap_seconds)
+                users = (await db.execute(select(User).where(User.updated_at > since))).scalars().all()
+                for user in users:
+                    if user.id in self._authors:
+                        self._authors[user.id].update(user)
+                    if user.updated_at is not None and user.updated_at > self._user_watermark:
+                        self._user_watermark = user.updated_at
+
+            query = select(Item).options(load_only(*CatalogItem.COLUMNS), selectinload(Item.author))
+            if self._item_watermark is not None:
+                since = self._item_watermark - timedelta(seconds=self.overlap_seconds)
+                query = query.where(Item.updated_at > since)
+            rows = (await db.execute(query.order_by(Item.updated_at))).scalars().all()
+
+            evicted = 0
+            for row in rows:
+                current = self._items.get(row.id)
+                if current is not None and current.updated_ts == _epoch(row.updated_at):
+                    # 重叠窗口内未变化的内容
+                    continue
+                old, new, evicted_items = self._put(self._items, self._authors, row)
+                self._notify("on_upsert", old, new)
+                for item in evicted_items:
+                    self._notify("on_evict", item)
+                evicted += len(evicted_items)
+                upserts += 1
+                if row.updated_at is not None and (self._item_watermark is None or row.updated_at > self._item_watermark):
+                    self._item_watermark = row.updated_at
+
+            if upserts:
+                self._kind_ids = None
+            if evicted:
+                self.complete = False
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+            self._stats["upserts"] += upserts
+            self._stats["evictions"] += evicted
+            self._last_refresh_ms = (time.perf_counter() - start_time) * 1000
+
+        if upserts:
+            logger.debug(f"内容目录增量刷新: {upserts} 条内容")
+        return upserts
+
+    async def watch(self, session_factory: Callable, interval_seconds: float,
+                    full_reload_seconds: float = 3600):
+        """定期增量刷新，并按间隔全量重载以清理已删除的内容"""
+        logger.info(f"开始刷新内容目录，间隔 {interval_seconds}s，全量重载间隔 {full_reload_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not self.loaded or (full_reload_seconds > 0 and
+                                       time.time() - self.last_full_load_at >= full_reload_seconds):
+                    await self.load(session_factory)
+                else:
+                    await self.refresh(session_factory)
+            except Exception as e:
+                # 保留当前目录，超过最大陈旧时间后读取回源数据库
+                self._stats["refresh_errors"] += 1
+                logger.error(f"刷新内容目录失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """目录状态和命中统计"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        staleness = self.staleness_seconds
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "complete": self.complete,
+            "size": len(self._items),
+            "authors": len(self._authors),
+            "max_items": self.max_items,
+            "item_watermark": self._item_watermark.isoformat() if self._item_watermark else None,
+            "staleness_s": round(staleness, 3) if staleness is not None else None,
+            "max_staleness_s": self.max_staleness_seconds,
+            "last_refresh_ms": round(self._last_refresh_ms, 2),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            **self._stats,
+        }
+
+# 全局内容目录
+item_catalog = ItemCatalog(
+    max_items=settings.ITEM_CATALOG_MAX_ITEMS,
+    max_staleness_seconds=settings.ITEM_CATALOG_MAX_STALENESS_S,
+)
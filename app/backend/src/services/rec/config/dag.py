@@ -1,22 +1,36 @@
-from typing import Dict, List, Any, Optional, Union, Callable, Type
+from typing import Dict, List, Any, Optional, Union, Callable, Type, Set, Tuple
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
 from pathlib import Path
 import importlib
 import logging
+import hashlib
 import time
+from datetime import datetime
+from sqlalchemy import text
 
+from src.core.config import settings
 from src.core.logger import logger
 from src.services.rec.trace import TraceInfo
+from src.services.rec.frame import ExecutionFrame, combine_inputs
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.hedge import run_hedged, last_good_cache
+from src.services.rec.breaker import breaker_registry
+from src.services.rec.node_cache import node_output_cache
+from src.services.rec.nodes.base_node import RecallNode
+from src.services.rec.config.plan import ExecutionPlan, compile_plan
 
 class Node:
-    """推荐系统DAG节点基类"""
+    """推荐系统DAG节点基类
+    
+    节点实例在并发请求间共享，不能保存请求级状态，输入输出由ExecutionFrame保存
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         self.node_id = node_id
         self.config = config
-        self.inputs = {}
-        self.output = None
         self._validate_config()
     
     def _validate_config(self):
@@ -37,15 +51,21 @@ class DAG:
         self.edges: Dict[str, List[str]] = {}
         self.entry_nodes: List[str] = []
         self.node_configs: Dict[str, Dict[str, Any]] = {}
+        self.plan: Optional[ExecutionPlan] = None
+        # 配置内容摘要，用于区分热加载前后的版本
+        self.version: Optional[str] = None
+        self.loaded_at = datetime.now().isoformat()
         self._load_config()
         self._build_nodes()
     
     def _load_config(self):
         """加载DAG配置"""
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                
+            with open(self.config_path, 'rb') as f:
+                raw = f.read()
+            config = json.loads(raw.decode('utf-8'))
+            self.version = hashlib.sha1(raw).hexdigest()[:12]
+            
             self.dag_config = config.get('dag', {})
             self.node_configs = config.get('nodes', {})
             self.edges = config.get('edges', {})
@@ -55,11 +75,6 @@ class DAG:
             if not self.entry_nodes:
                 raise ValueError(f"DAG {self.dag_id} 没有定义入口节点")
                 
-            # 检查节点配置是否存在
-            for node_id in self.node_configs.keys():
-                if node_id not in self.edges and node_id not in self.entry_nodes:
-                    logger.warning(f"节点 {node_id} 在DAG中未连接")
-            
             # 检查边的有效性
             for src, targets in self.edges.items():
                 if src not in self.node_configs:
@@ -67,14 +82,31 @@ class DAG:
                 for target in targets:
                     if target not in self.node_configs:
                         raise ValueError(f"边的目标节点 {target} 不存在")
+            
+            # 编译执行计划：环检测和无效节点裁剪都在加载时完成
+            self.plan = compile_plan(
+                self.dag_id,
+                list(self.node_configs.keys()),
+                self.edges,
+                self.entry_nodes,
+                config.get('output_node'),
+            )
+            logger.info(f"DAG {self.dag_id} 执行计划: {len(self.plan.order)} 个节点, "
+                        f"{len(self.plan.levels)} 层, 输出节点 {self.plan.output_node}")
         
         except Exception as e:
             logger.error(f"加载DAG配置失败: {str(e)}")
             raise
     
+    @property
+    def output_node(self) -> str:
+        """最终输出节点"""
+        return self.plan.output_node
+    
     def _build_nodes(self):
-        """构建DAG节点"""
-        for node_id, node_config in self.node_configs.items():
+        """构建DAG节点，只实例化执行计划中的节点"""
+        for node_id in self.plan.order:
+            node_config = self.node_configs[node_id]
             try:
                 node_type = node_config.get('type')
                 if not node_type:
@@ -105,31 +137,284 @@ class DAG:
         user_id = context.get('user_id')
         if user_id:
             trace.set_user_id(user_id)
+        trace.set_dag(self.dag_id, self.version)
         
-        results = {}
-        visited = set()
+        # 请求级执行帧，节点对象本身保持无状态
+        frame = ExecutionFrame(self.dag_id)
+        context['frame'] = frame
         
         try:
-            # 从入口节点开始执行
-            for entry_node in self.entry_nodes:
-                await self._execute_node(entry_node, context, results, visited)
+            # 依赖满足的节点并发执行
+            await self._schedule(context, frame)
             
-            # 标记trace完成
-            trace.complete("success")
+            # 标记trace完成，有节点超时或降级时标记为部分结果
+            degraded = trace.global_info.get("timed_out_nodes") or trace.errors
+            trace.complete("partial" if degraded else "success")
         except Exception as e:
             # 标记trace失败
             trace.complete("error")
             raise
         
-        return results
+        return frame.outputs
     
-    async def _execute_node(self, node_id: str, context: Dict[str, Any], 
-                           results: Dict[str, Any], visited: set):
-        """递归执行节点"""
-        # 检查节点是否已执行
-        if node_id in visited:
-            return
+    async def _schedule(self, context: Dict[str, Any], frame: ExecutionFrame):
+        """基于asyncio的调度器：按执行计划，所有依赖已满足的节点同时执行
+        
+        并行分支不能共用请求的AsyncSession，因此同时运行的节点各自从
+        context['session_factory']获取独立会话；只有单独运行的节点才使用请求会话。
+        未提供会话工厂时，使用请求会话的节点通过锁串行执行。
+        
+        同时打开的独立会话（包括对冲请求、节点输出缓存的计算）受settings.REC_BRANCH_SESSIONS限制，超出的分支等待空闲的名额，
+        单个请求占用的连接数见core/config.py。
+        """
+        plan = self.plan
+        pending = {node_id: len(plan.predecessors[node_id]) for node_id in plan.order}
+        ready = list(plan.sources)
+        
+        session_factory = context.get('session_factory')
+        if session_factory is not None and settings.REC_BRANCH_SESSIONS > 0:
+            context = {**context, 'branch_sessions': asyncio.BoundedSemaphore(settings.REC_BRANCH_SESSIONS)}
+        shared_lock = asyncio.Lock()
+        running: Dict[asyncio.Task, str] = {}
+        
+        try:
+            while ready or running:
+                # 同时就绪或已有节点在运行时，新节点使用独立会话
+                isolated = len(ready) + len(running) > 1
+                for node_id in ready:
+                    task = asyncio.create_task(self._execute_node(
+                        node_id, context, frame,
+                        session_factory if isolated else None, shared_lock))
+                    running[task] = node_id
+                ready = []
+                
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = running.pop(task)
+                    # 节点失败时直接抛出异常
+                    task.result()
+                    
+                    for target in plan.successors[node_id]:
+                        pending[target] -= 1
+                        if pending[target] == 0:
+                            ready.append(target)
+        finally:
+            # 出错时取消仍在运行的分支
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.keys(), return_exceptions=True)
+    
+    def _node_timeout_ms(self, node_id: str, context: Dict[str, Any]) -> Optional[float]:
+        """计算节点超时（毫秒）
+        
+        节点在DAG配置中通过timeout_ms声明自己的时间片；召回等源节点还受请求级
+        截止时间context['deadline']约束，取两者中较小的值。
+        """
+        timeout_ms = self.node_configs[node_id].get('timeout_ms')
+        deadline = context.get('deadline')
+        if deadline is not None and not self.plan.predecessors[node_id]:
+            remaining_ms = (deadline - time.monotonic()) * 1000
+            timeout_ms = remaining_ms if timeout_ms is None else min(timeout_ms, remaining_ms)
+        return timeout_ms
+    
+    async def _set_statement_timeout(self, db: Any, timeout_ms: float):
+        """设置当前事务的SQL statement_timeout，与节点超时保持一致"""
+        await db.execute(text(f"SET LOCAL statement_timeout = {max(1, int(timeout_ms))}"))
+    
+    async def _reset_statement_timeout(self, db: Any):
+        """恢复请求会话的statement_timeout，失败时回滚事务"""
+        try:
+            await db.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+        except Exception as e:
+            logger.warning(f"恢复statement_timeout失败: {str(e)}")
+            await self._rollback(db)
+    
+    async def _rollback(self, db: Any):
+        """回滚事务"""
+        try:
+            await db.rollback()
+        except Exception as rollback_error:
+            logger.error(f"回滚事务失败: {str(rollback_error)}")
+    
+    @asynccontextmanager
+    async def _node_session(self, context: Dict[str, Any], session_factory: Optional[Callable],
+                            shared_lock: asyncio.Lock, timeout_ms: Optional[float] = None):
+        """为节点分配数据库会话"""
+        if session_factory is not None:
+            # 并行分支使用独立会话（独立连接），同时打开的数量受请求的名额限制
+            slots = context.get('branch_sessions')
+            if slots is not None:
+                await slots.acquire()
+            try:
+                async with session_factory() as session:
+                    if timeout_ms is not None:
+                        await self._set_statement_timeout(session, timeout_ms)
+                    yield session
+            finally:
+                if slots is not None:
+                    slots.release()
+        else:
+            # 使用请求会话，同一时间只允许一个节点访问
+            async with shared_lock:
+                db = context.get('db')
+                if db is not None and timeout_ms is not None:
+                    await self._set_statement_timeout(db, timeout_ms)
+                try:
+                    yield db
+                except BaseException:
+                    # 节点失败或被取消时回滚，保证后续节点和请求可以继续使用该会话
+                    if db is not None:
+                        await self._rollback(db)
+                    raise
+                if db is not None and timeout_ms is not None:
+                    await self._reset_statement_timeout(db)
+    
+    async def _run_node(self, node: Node, node_id: str, input_data: Any, inputs: Dict[str, Any],
+                        context: Dict[str, Any], session_factory: Optional[Callable],
+                        shared_lock: asyncio.Lock, timeout_ms: Optional[float]) -> Any:
+        """在分配的会话中执行节点处理"""
+        async with self._node_session(context, session_factory, shared_lock, timeout_ms) as db:
+            node_context = {
+                **context,
+                'db': db,
+                'dag_id': self.dag_id,
+                'node_id': node_id,
+                'inputs': inputs
+            }
+            return await node.process(input_data, node_context)
+    
+    def _output_cache_config(self, node_id: str, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """节点的输出缓存配置，只对源节点生效，且需要会话工厂在请求之外执行计算"""
+        cache_config = self.node_configs[node_id].get('output_cache')
+        if not cache_config or not cache_config.get('enabled', True):
+            return None
+        if self.plan.predecessors[node_id] or context.get('session_factory') is None:
+            return None
+        return cache_config
+    
+    async def _invoke_node(self, node: Node, node_id: str, input_data: Any, inputs: Dict[str, Any],
+                           context: Dict[str, Any], session_factory: Optional[Callable],
+                           shared_lock: asyncio.Lock, timeout_ms: Optional[float]) -> Tuple[Any, str]:
+        """执行节点，配置了output_cache的节点先读取节点输出缓存
+        
+        缓存未命中时的计算由所有等待方共享，可能在当前请求结束后才完成（或在后台刷新），
+        因此总是使用独立会话，超时取节点自己的timeout_ms而不是请求剩余时间，
+        也不写入当前请求的trace。缓存的召回结果不含用户的排除集合：计算时按
+        output_cache.overfetch（默认2）倍多取recall_size，读取后排除再截断到recall_size。
+        
+        Returns:
+            Tuple[Any, str]: 输出和来源（primary / hedge / cache，或节点输出缓存的来源）
+        """
+        cache_config = self._output_cache_config(node_id, context)
+        if cache_config is None:
+            return await self._invoke_uncached(node, node_id, input_data, inputs, context,
+                                               session_factory, shared_lock, timeout_ms)
+        
+        cache_factory = context['session_factory']
+        node_timeout_ms = self.node_configs[node_id].get('timeout_ms')
+        compute_context = {**context, 'trace': None, 'exclusion': None,
+                           'recall_overfetch': cache_config.get('overfetch', 2.0)}
+        
+        async def compute() -> Any:
+            output, _ = await asyncio.wait_for(
+                self._invoke_uncached(node, node_id, input_data, inputs, compute_context,
+                                      cache_factory, shared_lock, node_timeout_ms),
+                node_timeout_ms / 1000 if node_timeout_ms is not None else None,
+            )
+            return output
+        
+        key = node_output_cache.make_key(self.dag_id, self.version, node_id,
+                                         cache_config.get('key_fields', ['scene']), context)
+        output, source = await node_output_cache.get_or_compute(
+            key, compute,
+            ttl_seconds=cache_config.get('ttl_seconds', 30),
+            stale_seconds=cache_config.get('stale_seconds', 0),
+            use_l2=cache_config.get('l2', False),
+            stats_key=f"{self.dag_id}.{node_id}",
+        )
         
+        output = await self._apply_exclusion(node, output, context)
+        
+        trace = context.get('trace')
+        if trace:
+            trace.add_node_detail(node_id, "output_cache", source)
+        return output, "cache" if source in ("hit", "stale", "coalesced", "l2_hit") else "primary"
+    
+    @staticmethod
+    async def _apply_exclusion(node: Node, output: Any, context: Dict[str, Any]) -> Any:
+        """对不是本请求计算的召回输出（节点输出缓存、最近一次成功的输出）应用本请求的排除集合，
+        保留recall_size个"""
+        if not isinstance(node, RecallNode) or not isinstance(output, CandidateBatch):
+            return output
+        exclusion = context.get('exclusion')
+        if exclusion is None:
+            return output.head(node.recall_size)
+        return await exclusion.apply(output, node.recall_size)
+    
+    async def _invoke_uncached(self, node: Node, node_id: str, input_data: Any, inputs: Dict[str, Any],
+                               context: Dict[str, Any], session_factory: Optional[Callable],
+                               shared_lock: asyncio.Lock, timeout_ms: Optional[float]) -> Tuple[Any, str]:
+        """执行节点，配置了hedge_after_ms的节点使用对冲执行
+        
+        hedge_strategy为cache时优先使用该用户最近一次成功的输出（应用本请求的排除集合），
+        否则（或没有缓存时）在另一个连接上发起第二次请求。主请求使用独立会话时，
+        使用缓存后主请求继续在后台执行，完成后更新最近一次成功的输出。
+        
+        Returns:
+            Tuple[Any, str]: 输出和来源（primary / hedge / cache）
+        """
+        node_config = self.node_configs[node_id]
+        hedge_after_ms = node_config.get('hedge_after_ms')
+        if hedge_after_ms is None:
+            output = await self._run_node(node, node_id, input_data, inputs, context,
+                                          session_factory, shared_lock, timeout_ms)
+            return output, "primary"
+        
+        hedge_factory = context.get('session_factory')
+        
+        async def attempt(is_hedge: bool) -> Any:
+            # 对冲请求总是使用新的连接
+            return await self._run_node(node, node_id, input_data, inputs, context,
+                                        hedge_factory if is_hedge else session_factory,
+                                        shared_lock, timeout_ms)
+        
+        cached = None
+        on_late_result = None
+        if node_config.get('hedge_strategy', 'duplicate') == 'cache':
+            cache_key = (self.dag_id, node_id, context.get('user_id'))
+            cached = last_good_cache.get(cache_key)
+            if session_factory is not None:
+                # 请求会话在请求结束后关闭，只有独立会话上的主请求可以在后台继续
+                on_late_result = lambda output: last_good_cache.put(cache_key, output)
+        
+        output, winner = await run_hedged(
+            f"{self.dag_id}.{node_id}", attempt, hedge_after_ms,
+            cached=cached, allow_duplicate=hedge_factory is not None,
+            on_late_result=on_late_result,
+        )
+        if winner == "cache":
+            output = await self._apply_exclusion(node, output, context)
+        
+        trace = context.get('trace')
+        if trace:
+            trace.add_node_detail(node_id, "hedge_winner", winner)
+        return output, winner
+    
+    def _keeps_last_good(self, node_id: str) -> bool:
+        """节点是否需要保存最近一次成功的输出（对冲或熔断使用缓存降级）"""
+        node_config = self.node_configs[node_id]
+        breaker_config = node_config.get('circuit_breaker') or {}
+        return (node_config.get('hedge_strategy') == 'cache'
+                or breaker_config.get('fallback') == 'cache')
+    
+    async def _execute_node(self, node_id: str, context: Dict[str, Any],
+                            frame: ExecutionFrame,
+                            session_factory: Optional[Callable], shared_lock: asyncio.Lock):
+        """执行单个节点
+        
+        节点失败、超时或熔断打开时不会中断整个DAG，而是按_degrade降级。
+        """
         # 获取节点
         node = self.nodes.get(node_id)
         if not node:
@@ -138,86 +423,139 @@ class DAG:
         # 获取trace信息
         trace = context.get('trace')
         
-        # 检查依赖节点是否已执行
-        dependencies_met = True
-        for src, targets in self.edges.items():
-            if node_id in targets and src not in visited:
-                dependencies_met = False
-                # 先执行依赖节点
-                await self._execute_node(src, context, results, visited)
+        # 收集输入，保存在执行帧中
+        inputs = frame.gather_inputs(node_id, self.plan.predecessors[node_id])
+        
+        # 按节点声明的方式合并多个输入
+        input_mode = getattr(node, 'input_mode', 'first')
+        input_data = combine_inputs(inputs, input_mode,
+                                    getattr(node, 'input_key', 'id'),
+                                    getattr(node, 'input_join', 'outer'))
+        
+        # 记录节点开始执行
+        if trace:
+            trace.start_node(node_id, node.__class__.__name__)
+            if len(inputs) > 1:
+                trace.add_node_detail(node_id, "input_mode", input_mode)
+            for src, src_output in inputs.items():
+                if isinstance(src_output, (list, CandidateBatch)):
+                    trace.add_node_detail(node_id, f"input_{src}_count", len(src_output))
+        
+        cache_key = (self.dag_id, node_id, context.get('user_id'))
         
-        # 收集输入
-        node.inputs = {}
-        for src, targets in self.edges.items():
-            if node_id in targets and src in results:
-                node.inputs[src] = results[src]
+        # 熔断器打开时跳过节点
+        breaker = breaker_registry.get(self.dag_id, node_id, self.node_configs[node_id].get('circuit_breaker'))
+        if breaker is not None and not breaker.allow():
+            cached = last_good_cache.get(cache_key) if breaker.fallback == 'cache' else None
+            if cached is not None:
+                cached = await self._apply_exclusion(node, cached, context)
+            frame.record(node_id, "circuit_open", 0.0)
+            if trace:
+                trace.add_node_detail(node_id, "circuit_state", breaker.state)
+                trace.add_node_detail(node_id, "circuit_fallback", "cache" if cached is not None else "skip")
+            if cached is not None:
+                frame.set_output(node_id, cached)
+                if trace:
+                    trace.end_node(node_id, "circuit_open", len(cached) if isinstance(cached, (list, CandidateBatch)) else 0)
+            else:
+                self._degrade(node_id, input_data, frame)
+                if trace:
+                    trace.end_node(node_id, "circuit_open")
+            return
         
         # 执行节点
+        start_time = time.perf_counter()
+        timeout_ms = self._node_timeout_ms(node_id, context)
         try:
-            start_time = time.time()
-            node_context = {
-                **context,
-                'dag_id': self.dag_id,
-                'node_id': node_id,
-                'inputs': node.inputs
-            }
-            
-            # 记录节点开始执行
-            if trace:
-                trace.start_node(node_id, node.__class__.__name__)
-                if isinstance(node.inputs, dict):
-                    for src, input_data in node.inputs.items():
-                        if isinstance(input_data, list):
-                            trace.add_node_detail(node_id, f"input_{src}_count", len(input_data))
-            
-            # 执行节点
-            # 获取输入数据
-            input_data = None
-            if node.inputs:
-                # 如果有多个输入，使用第一个输入作为数据
-                input_data = next(iter(node.inputs.values()))
-            
-            # 执行节点处理
-            output = await node.process(input_data, node_context)
-            results[node_id] = output
-            node.output = output
-            
-            # 记录节点执行结果
-            end_time = time.time()
-            duration_ms = int((end_time - start_time) * 1000)
-            logger.debug(f"节点 {node_id} 执行完成，耗时: {duration_ms}ms")
-            
+            # 执行节点处理，超时后取消
+            if timeout_ms is not None and timeout_ms <= 0:
+                raise asyncio.TimeoutError()
+            output, source = await asyncio.wait_for(
+                self._invoke_node(node, node_id, input_data, inputs, context,
+                                  session_factory, shared_lock, timeout_ms),
+                timeout_ms / 1000 if timeout_ms is not None else None,
+            )
+        except asyncio.CancelledError:
+            # 调度器取消分支或进程退出时没有调用结果，归还探测名额，否则熔断器会一直停在半开
+            if breaker is not None:
+                breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            if breaker is not None:
+                breaker.record(False, duration_ms)
+            frame.record(node_id, "timeout", duration_ms)
+            logger.warning(f"节点 {node_id} 超时，预算: {int(timeout_ms or 0)}ms，耗时: {int(duration_ms)}ms")
+            self._degrade(node_id, input_data, frame)
             if trace:
-                output_count = len(output) if isinstance(output, list) else 0
-                trace.end_node(node_id, "success", output_count)
-            
+                trace.mark_timeout(node_id, timeout_ms)
+            return
         except Exception as e:
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            if breaker is not None:
+                breaker.record(False, duration_ms)
             error_msg = f"执行节点 {node_id} 失败: {str(e)}"
             logger.error(error_msg)
+            frame.record(node_id, "error", duration_ms)
+            self._degrade(node_id, input_data, frame)
             
             # 记录错误信息
             if trace:
                 trace.add_error(node_id, error_msg)
                 trace.end_node(node_id, "error")
-                
-            raise
+            return
+        
+        frame.set_output(node_id, output)
+        
+        # 记录节点执行结果
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        frame.record(node_id, "success", duration_ms)
+        logger.debug(f"节点 {node_id} 执行完成，耗时: {int(duration_ms)}ms")
+        if breaker is not None:
+            breaker.record(True, duration_ms)
+        if source != "cache" and self._keeps_last_good(node_id):
+            last_good_cache.put(cache_key, output)
         
-        # 标记为已访问
-        visited.add(node_id)
+        if trace:
+            output_count = len(output) if isinstance(output, (list, CandidateBatch)) else 0
+            trace.end_node(node_id, "success", output_count)
+            if session_factory is not None:
+                trace.add_node_detail(node_id, "isolated_session", True)
+    
+    def _degrade(self, node_id: str, input_data: Any, frame: ExecutionFrame):
+        """节点降级
         
-        # 执行后续节点
-        if node_id in self.edges:
-            for target in self.edges[node_id]:
-                await self._execute_node(target, context, results, visited)
+        源节点（召回分支）不产生输出，下游合并已完成的分支；
+        其他节点将输入原样传递给下游，map方式的输入拼接成列表后传递。
+        """
+        if self.plan.predecessors[node_id]:
+            if getattr(self.nodes[node_id], 'input_mode', 'first') == 'map':
+                input_data = combine_inputs(frame.inputs.get(node_id, {}), 'concat')
+            frame.set_output(node_id, input_data)
 
 class DAGManager:
-    """DAG管理器，负责加载和管理多个DAG"""
+    """DAG管理器，负责加载和管理多个DAG
+    
+    支持热加载：新版本DAG在后台构建、校验并预热后原子替换旧版本，
+    已经拿到旧版本的请求继续在旧版本上执行完成。
+    """
     
-    def __init__(self, config_dir: str):
+    def __init__(self, config_dir: str, session_factory: Optional[Callable] = None):
         self.config_dir = config_dir
+        self.session_factory = session_factory
         self.dags: Dict[str, DAG] = {}
+        # 已加载配置文件的修改时间，用于文件监听
+        self._mtimes: Dict[str, float] = {}
+        self._reload_lock = asyncio.Lock()
         self._load_dags()
     
+    def _config_files(self) -> List[Path]:
+        """DAG配置文件列表"""
+        config_path = Path(self.config_dir)
+        if not config_path.exists() or not config_path.is_dir():
+            return []
+        return sorted(config_path.glob('**/*.json'))
+    
     def _load_dags(self):
         """加载所有DAG配置"""
         config_path = Path(self.config_dir)
@@ -226,11 +564,12 @@ class DAGManager:
             return
         
         # 加载所有json配置文件
-        for file_path in config_path.glob('**/*.json'):
+        for file_path in self._config_files():
             try:
                 dag_id = file_path.stem
+                self._mtimes[dag_id] = file_path.stat().st_mtime
                 self.dags[dag_id] = DAG(dag_id, str(file_path))
-                logger.info(f"成功加载DAG: {dag_id} 从 {file_path}")
+                logger.info(f"成功加载DAG: {dag_id} 版本 {self.dags[dag_id].version} 从 {file_path}")
             except Exception as e:
                 logger.error(f"加载DAG {file_path.name} 失败: {str(e)}")
     
@@ -238,10 +577,99 @@ class DAGManager:
         """获取指定的DAG"""
         return self.dags.get(dag_id)
     
+    def list_dags(self) -> List[Dict[str, Any]]:
+        """已加载DAG的版本信息"""
+        return [
+            {
+                "dag_id": dag_id,
+                "version": dag.version,
+                "loaded_at": dag.loaded_at,
+                "config_path": dag.config_path,
+                "node_count": len(dag.plan.order),
+                "output_node": dag.output_node,
+            }
+            for dag_id, dag in self.dags.items()
+        ]
+    
+    async def reload_dag(self, dag_id: str, warmup_requests: int = 3) -> DAG:
+        """热加载DAG
+        
+        在线程中构建并校验新版本，预热通过后原子替换。构建、校验或预热失败时
+        抛出异常并保留旧版本。
+        
+        Args:
+            dag_id: DAG ID，对应配置目录下的同名json文件
+            warmup_requests: 预热请求数量
+            
+        Returns:
+            DAG: 新版本DAG
+        """
+        file_path = Path(self.config_dir) / f"{dag_id}.json"
+        if not file_path.exists():
+            raise ValueError(f"DAG配置文件 {file_path} 不存在")
+        
+        async with self._reload_lock:
+            mtime = file_path.stat().st_mtime
+            new_dag = await asyncio.to_thread(DAG, dag_id, str(file_path))
+            
+            old_dag = self.dags.get(dag_id)
+            if old_dag and old_dag.version == new_dag.version:
+                self._mtimes[dag_id] = mtime
+                logger.info(f"DAG {dag_id} 配置未变化，版本 {new_dag.version}")
+                return old_dag
+            
+            await self._warm_up(new_dag, warmup_requests)
+            
+            # 原子替换，执行中的请求持有旧版本的引用
+            self.dags[dag_id] = new_dag
+            self._mtimes[dag_id] = mtime
+            logger.info(f"DAG {dag_id} 热加载完成: "
+                        f"{old_dag.version if old_dag else None} -> {new_dag.version}")
+            return new_dag
+    
+    async def _warm_up(self, dag: DAG, requests: int):
+        """使用匿名请求预热新版本DAG，输出节点未成功执行时视为失败"""
+        if requests <= 0 or self.session_factory is None:
+            return
+        
+        for i in range(requests):
+            async with self.session_factory() as db:
+                context = {
+                    "db": db,
+                    "session_factory": self.session_factory,
+                    "user_id": None,
+                    "count": 10,
+                    "offset": 0,
+                    "scene": "warmup",
+                    "debug": False,
+                    "trace": TraceInfo(trace_id=f"warmup-{dag.dag_id}-{dag.version}-{i}"),
+                    "deadline": time.monotonic() + settings.REC_DAG_TIMEOUT_MS / 1000,
+                }
+                await dag.execute(context)
+                status = context['frame'].statuses.get(dag.output_node)
+                if status != "success":
+                    raise RuntimeError(f"DAG {dag.dag_id} 预热失败，输出节点状态: {status}")
+    
+    async def watch(self, interval_seconds: float):
+        """监听配置目录，配置文件变化时自动热加载"""
+        logger.info(f"开始监听DAG配置目录 {self.config_dir}，间隔 {interval_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            for file_path in self._config_files():
+                dag_id = file_path.stem
+                try:
+                    if file_path.stat().st_mtime == self._mtimes.get(dag_id):
+                        continue
+                    await self.reload_dag(dag_id)
+                except Exception as e:
+                    # 保留旧版本，等待下次修改
+                    self._mtimes[dag_id] = file_path.stat().st_mtime
+                    logger.error(f"热加载DAG {dag_id} 失败，继续使用旧版本: {str(e)}")
+    
     async def execute_dag(self, dag_id: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """执行指定的DAG"""
         dag = self.get_dag(dag_id)
         if not dag:
             raise ValueError(f"DAG {dag_id} 不存在")
         
-        return await dag.execute(context)
\ No newline at end of file
+        return await dag.execute(context)
@@ -0,0 +1,139 @@
+from typing import Dict, List, Any, Optional, Tuple, Mapping, Set
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from src.core.logger import logger
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """DAG执行计划，在加载配置时编译一次，请求路径上只读"""
+
+    dag_id: str
+    # 拓扑序
+    order: Tuple[str, ...]
+    # 每个节点的前驱/后继（按配置顺序）
+    predecessors: Mapping[str, Tuple[str, ...]]
+    successors: Mapping[str, Tuple[str, ...]]
+    # 层级分组：同一层的节点之间没有依赖
+    levels: Tuple[Tuple[str, ...], ...]
+    # 最终输出节点
+    output_node: str
+    # 加载时被裁剪掉的节点
+    pruned: Tuple[str, ...] = ()
+
+    @property
+    def sources(self) -> Tuple[str, ...]:
+        """没有前驱的节点"""
+        return tuple(node_id for node_id in self.order if not self.predecessors[node_id])
+
+def _reachable(starts: List[str], adjacency: Dict[str, List[str]]) -> Set[str]:
+    """从起点出发沿邻接表可达的节点集合（包含起点）"""
+    seen = set()
+    stack = list(starts)
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        stack.extend(adjacency.get(node_id, []))
+    return seen
+
+def compile_plan(dag_id: str, node_ids: List[str], edges: Dict[str, List[str]],
+                 entry_nodes: List[str], output_node: Optional[str] = None) -> ExecutionPlan:
+    """编译执行计划：环检测、确定输出节点、裁剪无效节点、计算拓扑序和层级
+
+    Args:
+        dag_id: DAG ID
+        node_ids: 所有节点ID（按配置顺序）
+        edges: 边定义，源节点 -> 目标节点列表
+        entry_nodes: 入口节点
+        output_node: 声明的输出节点，未声明时使用唯一的汇点
+
+    Returns:
+        ExecutionPlan: 执行计划
+    """
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    predecessors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    for src, targets in edges.items():
+        for target in targets:
+            if target not in successors[src]:
+                successors[src].append(target)
+                predecessors[target].append(src)
+
+    # 环检测（Kahn算法）
+    indegree = {node_id: len(predecessors[node_id]) for node_id in node_ids}
+    queue = [node_id for node_id in node_ids if indegree[node_id] == 0]
+    visited = 0
+    while queue:
+        node_id = queue.pop()
+        visited += 1
+        for target in successors[node_id]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    if visited != len(node_ids):
+        cycle_nodes = sorted(node_id for node_id, degree in indegree.items() if degree > 0)
+        raise ValueError(f"DAG {dag_id} 存在环: {cycle_nodes}")
+
+    for entry in entry_nodes:
+        if entry not in successors:
+            raise ValueError(f"入口节点 {entry} 不存在")
+
+    # 入口节点可达的节点
+    reachable = _reachable(entry_nodes, successors)
+
+    # 确定输出节点
+    if output_node is None:
+        sinks = [node_id for node_id in node_ids if node_id in reachable and not successors[node_id]]
+        if len(sinks) != 1:
+            raise ValueError(f"DAG {dag_id} 有多个汇点 {sinks}，请声明output_node")
+        output_node = sinks[0]
+    if output_node not in successors:
+        raise ValueError(f"输出节点 {output_node} 不存在")
+    if output_node not in reachable:
+        raise ValueError(f"输出节点 {output_node} 从入口节点不可达")
+
+    # 只保留入口可达且能到达输出节点的节点
+    contributing = _reachable([output_node], predecessors)
+    kept = reachable & contributing
+    pruned = tuple(node_id for node_id in node_ids if node_id not in kept)
+    if pruned:
+        logger.warning(f"DAG {dag_id} 裁剪未连接到输出的节点: {list(pruned)}")
+
+    # 在保留的子图上计算拓扑序和层级，保持配置顺序稳定
+    kept_predecessors = {
+        node_id: tuple(src for src in predecessors[node_id] if src in kept)
+        for node_id in node_ids if node_id in kept
+    }
+    kept_successors = {
+        node_id: tuple(target for target in successors[node_id] if target in kept)
+        for node_id in node_ids if node_id in kept
+    }
+
+    level_of: Dict[str, int] = {}
+    order: List[str] = []
+    remaining = [node_id for node_id in node_ids if node_id in kept]
+    while remaining:
+        next_remaining = []
+        for node_id in remaining:
+            preds = kept_predecessors[node_id]
+            if all(src in level_of for src in preds):
+                level_of[node_id] = max((level_of[src] + 1 for src in preds), default=0)
+                order.append(node_id)
+            else:
+                next_remaining.append(node_id)
+        remaining = next_remaining
+
+    levels: List[List[str]] = [[] for _ in range(max(level_of.values()) + 1)]
+    for node_id in order:
+        levels[level_of[node_id]].append(node_id)
+
+    return ExecutionPlan(
+        dag_id=dag_id,
+        order=tuple(order),
+        predecessors=MappingProxyType(kept_predecessors),
+        successors=MappingProxyType(kept_successors),
+        levels=tuple(tuple(level) for level in levels),
+        output_node=output_node,
+        pruned=pruned,
+    )
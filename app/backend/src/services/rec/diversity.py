@@ -0,0 +1,102 @@
+from typing import Tuple
+import numpy as np
+
+def similarity_matrix(vectors: np.ndarray, found: np.ndarray) -> np.ndarray:
+    """候选项两两之间的余弦相似度
+
+    缺少向量的候选项与其他候选项的相似度为0（视为与所有候选项都不相似），
+    对角线为1。
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = np.where(found[:, None], vectors / np.maximum(norms, 1e-12), 0.0)
+    sim = unit @ unit.T
+    np.fill_diagonal(sim, 1.0)
+    return sim
+
+def normalize_relevance(scores: np.ndarray) -> np.ndarray:
+    """把排序分数线性缩放到[0, 1]，与余弦相似度可比；NaN和负无穷记为0，正无穷记为1"""
+    scores = np.asarray(scores, dtype=np.float64)
+    finite = np.isfinite(scores)
+    relevance = np.where(scores == np.inf, 1.0, 0.0)
+    if finite.any():
+        low, high = scores[finite].min(), scores[finite].max()
+        relevance[finite] = (scores[finite] - low) / (high - low) if high > low else 1.0
+    return relevance
+
+def mmr_order(sim: np.ndarray, relevance: np.ndarray, k: int, lam: float = 0.7) -> np.ndarray:
+    """最大边际相关（MMR）贪心选择k个候选项
+
+    每次选 lam * 相关性 - (1 - lam) * 与已选项的最大相似度 最高的项，与已选项的最大
+    相似度随每次选择增量更新，每一步只做一次长度为n的向量运算。
+    分数相同时取下标小的，调用方按原始排序排列候选项即可保证先后。
+    """
+    n = len(relevance)
+    k = min(k, n)
+    order = np.empty(k, dtype=np.int64)
+    if k <= 0:
+        return order
+    # 已选项的相关性置为负无穷，不需要单独的掩码
+    gain = lam * relevance
+    penalty = np.full(n, -np.inf)
+    scores = np.empty(n)
+    # 第一项没有已选项，只看相关性
+    pick = int(np.argmax(gain))
+    for t in range(k):
+        order[t] = pick
+        gain[pick] = -np.inf
+        if t + 1 == k:
+            break
+        # penalty = (1 - lam) * 与已选项的最大相似度
+        np.maximum(penalty, (1 - lam) * sim[pick], out=penalty)
+        np.subtract(gain, penalty, out=scores)
+        pick = int(np.argmax(scores))
+    return order
+
+def dpp_order(sim: np.ndarray, relevance: np.ndarray, k: int, theta: float = 0.7,
+              epsilon: float = 1e-6) -> Tuple[np.ndarray, int]:
+    """快速贪心DPP MAP推断选择k个候选项
+
+    核矩阵 L = diag(q) · sim · diag(q)，q = exp(alpha * 相关性)，
+    alpha = theta / (2 * (1 - theta))，theta越大越偏向相关性。每一步选择使
+    log det(L_S) 增量最大的项，按增量Cholesky分解更新各候选项的边际增益，
+    第t步的代价为O(t * n)。
+
+    剩余候选项的边际增益都低于epsilon（与已选项几乎线性相关）时提前结束，
+    调用方按原始排序补齐。
+
+    Returns:
+        选中的下标和其中由DPP选出的数量
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), 0
+    alpha = theta / (2 * (1 - theta)) if theta < 1 else 1e6
+    # 减去最大值避免溢出：核矩阵整体缩放到最大对角元为1，不改变选择顺序，epsilon相对于最相关的项
+    log_q = alpha * relevance
+    q = np.exp(log_q - log_q.max())
+    kernel = sim * q[:, None] * q[None, :]
+    gains = np.diag(kernel).copy()
+    cis = np.zeros((k, n))
+    order = np.empty(k, dtype=np.int64)
+    selected = 0
+    pick = int(np.argmax(gains))
+    while selected < k:
+        if gains[pick] < epsilon:
+            break
+        order[selected] = pick
+        if selected + 1 == k:
+            selected += 1
+            break
+        e = (kernel[pick] - cis[:selected, pick] @ cis[:selected]) / np.sqrt(gains[pick])
+        cis[selected] = e
+        gains -= e * e
+        gains[order[:selected + 1]] = -np.inf
+        selected += 1
+        pick = int(np.argmax(gains))
+    if selected < k:
+        # 按原始顺序补齐
+        rest = np.setdiff1d(np.arange(n), order[:selected], assume_unique=True)[:k - selected]
+        order[selected:] = rest
+    return order, selected
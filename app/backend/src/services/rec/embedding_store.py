@@ -0,0 +1,298 @@
+from typing import Dict, List, Any, Optional, Callable, Iterator, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+
+# 各向量表的导出查询，按ID分页
+EXPORT_QUERIES = {
+    "item": """
+        SELECT item_id AS id, emb, updated_at
+        FROM feature.item_embeddings
+        WHERE item_id > :last_id
+        ORDER BY item_id
+        LIMIT :limit
+    """,
+    "user": """
+        SELECT user_id AS id, user_embedding AS emb, updated_at
+        FROM feature.user_embeddings
+        WHERE user_id > :last_id
+        ORDER BY user_id
+        LIMIT :limit
+    """,
+}
+
+def parse_vector(value: Any) -> Optional[np.ndarray]:
+    """将JSONB向量（列表或JSON字符串）转换为float32数组，无法解析时返回None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    try:
+        vector = np.asarray(value, dtype=np.float32)
+    except (ValueError, TypeError):
+        return None
+    if vector.ndim != 1 or not len(vector) or not np.all(np.isfinite(vector)):
+        return None
+    return vector
+
+class EmbeddingStore:
+    """内存映射的向量存储
+
+    向量按ID排序保存为连续的float32/float16矩阵（.npy），ID单独保存为有序数组，
+    查找用二分而不是字典，两者都以只读方式mmap：多个worker进程共享同一份页缓存，
+    不需要解析JSONB也不复制整表。
+
+    目录中的清单文件（{name}.json）指向当前版本，导出任务写完新版本后用os.replace
+    原子替换清单，读取方发现清单变化后重新映射。
+    """
+
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        self.directory = Path(directory)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors: Optional[np.ndarray] = None
+        self.manifest: Dict[str, Any] = {}
+        self._manifest_mtime: Optional[float] = None
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.directory / f"{self.name}.json"
+
+    @property
+    def loaded(self) -> bool:
+        return self.vectors is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.manifest.get("version")
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.vectors.shape[1] if self.vectors is not None else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def maybe_reload(self) -> bool:
+        """清单变化时重新映射，返回是否切换了版本"""
+        try:
+            mtime = self.manifest_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            if manifest.get("version") == self.version:
+                self._manifest_mtime = mtime
+                return False
+            ids = np.load(self.directory / manifest["ids"], mmap_mode="r")
+            vectors = np.load(self.directory / manifest["vectors"], mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            # 清单被替换的间隙可能读到已清理的旧版本，下次检查时重试
+            logger.warning(f"映射向量存储 {self.name} 失败: {str(e)}")
+            return False
+        # 整体替换引用，正在使用旧映射的请求不受影响
+        self.ids, self.vectors, self.manifest = ids, vectors, manifest
+        self._manifest_mtime = mtime
+        logger.info(f"向量存储 {self.name} 切换到版本 {manifest['version']}: "
+                    f"{len(ids)} 条, 维度 {vectors.shape[1]}, {vectors.dtype}")
+        return True
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """ID对应的行号，不存在的ID为-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        rows = np.minimum(rows, len(self.ids) - 1)
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def get(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """批量读取向量
+
+        Returns:
+            float32向量矩阵（不存在的ID为全0行）和是否存在的掩码
+        """
+        rows = self.rows(ids)
+        found = rows >= 0
+        if self.vectors is None:
+            return np.zeros((len(rows), 0), dtype=np.float32), found
+        vectors = np.zeros((len(rows), self.dim), dtype=np.float32)
+        vectors[found] = self.vectors[rows[found]]
+        return vectors, found
+
+    def get_one(self, item_id: int) -> Optional[np.ndarray]:
+        """读取单个向量，不存在时返回None"""
+        vectors, found = self.get(np.array([item_id]))
+        return vectors[0] if found[0] else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "size": len(self),
+            "dim": self.dim,
+            **{key: self.manifest.get(key) for key in ("version", "dtype", "watermark", "exported_at", "skipped")},
+        }
+
+async def export_store(session_factory: Callable, name: str, directory: str,
+                       dtype: str = "float32", page_size: int = 5000) -> Dict[str, Any]:
+    """从数据库批量导出向量表为新版本文件，并原子替换清单
+
+    向量按页解析为float32数组后拼接，不保留Python列表；维度与第一条有效向量不一致
+    或无法解析的行被跳过。旧版本文件在替换后清理，只保留上一个版本。
+
+    Returns:
+        新版本清单
+    """
+    start_time = time.perf_counter()
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    query = text(EXPORT_QUERIES[name])
+
+    id_pages: List[np.ndarray] = []
+    vector_pages: List[np.ndarray] = []
+    dim = None
+    skipped = 0
+    watermark: Optional[datetime] = None
+    last_id = 0
+    async with session_factory() as db:
+        while True:
+            rows = (await db.execute(query, {"last_id": last_id, "limit": page_size})).fetchall()
+            ids, vectors = [], []
+            for row in rows:
+                vector = parse_vector(row.emb)
+                if vector is not None and dim is None:
+                    dim = len(vector)
+                if vector is None or len(vector) != dim:
+                    skipped += 1
+                    continue
+                ids.append(row.id)
+                vectors.append(vector)
+                if row.updated_at is not None and (watermark is None or row.updated_at > watermark):
+                    watermark = row.updated_at
+            if vectors:
+                id_pages.append(np.array(ids, dtype=np.int64))
+                vector_pages.append(np.stack(vectors).astype(dtype))
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1].id
+
+    ids = np.concatenate(id_pages) if id_pages else np.zeros(0, dtype=np.int64)
+    vectors = np.concatenate(vector_pages) if vector_pages else np.zeros((0, dim or 0), dtype=dtype)
+
+    # 写入新版本文件，清单最后原子替换
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    ids_file = f"{name}-{version}.ids.npy"
+    vectors_file = f"{name}-{version}.vectors.npy"
+    await asyncio.to_thread(np.save, directory / ids_file, ids)
+    await asyncio.to_thread(np.save, directory / vectors_file, vectors)
+    manifest = {
+        "name": name,
+        "version": version,
+        "dtype": str(vectors.dtype),
+        "dim": int(vectors.shape[1]),
+        "count": int(len(ids)),
+        "skipped": skipped,
+        "watermark": watermark.isoformat() if watermark else None,
+        "exported_at": datetime.now().astimezone().isoformat(),
+        "ids": ids_file,
+        "vectors": vectors_file,
+    }
+    manifest_path = directory / f"{name}.json"
+    previous = None
+    if manifest_path.exists():
+        try:
+            previous = json.loads(manifest_path.read_text(encoding="utf-8")).get("version")
+        except ValueError:
+            pass
+    tmp_path = directory / f".{name}.json.{version}.tmp"
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+
+    # 清理早于上一个版本的文件，已映射这些文件的进程不受影响
+    keep = {version, previous}
+    for path in directory.glob(f"{name}-*.npy"):
+        file_version = path.name[len(name) + 1:].split(".")[0]
+        if file_version not in keep:
+            path.unlink(missing_ok=True)
+
+    logger.info(f"导出向量存储 {name} 版本 {version}: {len(ids)} 条, 跳过 {skipped} 条, "
+                f"耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    return manifest
+
+@contextmanager
+def export_lock(directory: str) -> Iterator[bool]:
+    """导出文件锁（非阻塞），多个worker中只有拿到锁的进程执行导出"""
+    path = Path(directory) / ".export.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# 全局向量存储
+item_embedding_store = EmbeddingStore("item", settings.EMBEDDING_STORE_DIR)
+user_embedding_store = EmbeddingStore("user", settings.EMBEDDING_STORE_DIR)
+embedding_stores = {"item": item_embedding_store, "user": user_embedding_store}
+
+# 各存储最近一次导出尝试的时间，导出失败（如向量表不存在）时同样等待一个间隔再重试
+_last_export_attempt: Dict[str, float] = {}
+
+def _export_due(store: EmbeddingStore, interval_seconds: float) -> bool:
+    """距离清单更新和上次导出尝试都超过导出间隔，间隔为0表示不在进程内导出"""
+    if interval_seconds <= 0:
+        return False
+    try:
+        last = store.manifest_path.stat().st_mtime
+    except FileNotFoundError:
+        last = 0.0
+    last = max(last, _last_export_attempt.get(store.name, 0.0))
+    return time.time() - last >= interval_seconds
+
+async def refresh_stores(session_factory: Callable, export_interval_seconds: float):
+    """到期时导出新版本（只有拿到文件锁的worker执行），然后重新映射变化的存储"""
+    for name, store in embedding_stores.items():
+        if _export_due(store, export_interval_seconds):
+            with export_lock(settings.EMBEDDING_STORE_DIR) as acquired:
+                # 拿到锁后再检查一次，其他worker可能刚刚完成导出
+                if acquired and _export_due(store, export_interval_seconds):
+                    _last_export_attempt[name] = time.time()
+                    try:
+                        await export_store(session_factory, name, settings.EMBEDDING_STORE_DIR,
+                                           dtype=settings.EMBEDDING_STORE_DTYPE)
+                    except Exception as e:
+                        logger.error(f"导出向量存储 {name} 失败: {str(e)}")
+        store.maybe_reload()
+
+async def watch_stores(session_factory: Callable, check_interval_seconds: float,
+                       export_interval_seconds: float):
+    """定期检查清单变化，到期时重新导出"""
+    logger.info(f"开始监听向量存储 {settings.EMBEDDING_STORE_DIR}，检查间隔 {check_interval_seconds}s，"
+                f"导出间隔 {export_interval_seconds}s")
+    while True:
+        await asyncio.sleep(check_interval_seconds)
+        try:
+            await refresh_stores(session_factory, export_interval_seconds)
+        except Exception as e:
+            logger.error(f"刷新向量存储失败: {str(e)}")
@@ -0,0 +1,133 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import math
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.negative import negative_feedback, query_blocks
+from src.services.rec.seen import seen_history
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+class RecallExclusion:
+    """一次请求中召回阶段排除的内容：拉黑的内容和作者、最近看过的内容
+
+    请求开始时创建并放入DAG上下文，由所有召回节点共享，排除集合在后台只加载一次：
+    - 显式ID：拉黑的内容，已看记录（见seen）不可用时还包括事件表中看过的内容。
+      SQL召回作为 <> ALL 条件下推，内存索引召回在遍历索引时跳过
+    - 已看记录可用时，看过的内容由布隆过滤器判断，只能检查给定的ID；拉黑的作者
+      也只能在取出候选项后判断。两者存在时按overfetch倍数多取
+
+    加载失败时不排除任何内容，过滤节点仍会过滤拉黑和看过的内容。
+    """
+
+    def __init__(self, session_factory: Callable, user_id: int,
+                 seen_event_types: Iterable[str], seen_window_seconds: float,
+                 block_authors: bool = False, overfetch: float = 2.0):
+        self.session_factory = session_factory
+        self.user_id = user_id
+        self.seen_event_types = list(seen_event_types)
+        self.seen_window_seconds = seen_window_seconds
+        self.block_authors = block_authors
+        self.overfetch = overfetch
+        self.use_seen_history = bool(self.seen_event_types) and seen_history.ready and \
+            seen_history.supports(self.seen_event_types, seen_window_seconds)
+        self._task = asyncio.create_task(self._load())
+        self._task.add_done_callback(self._finish)
+
+    def _finish(self, task: asyncio.Task):
+        # 取走异常，避免没有节点等待时出现未处理异常的警告
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"加载用户 {self.user_id} 的召回排除集合失败: {str(task.exception())}")
+
+    async def _load(self) -> Tuple[np.ndarray, np.ndarray]:
+        """加载显式排除的内容ID和拉黑的作者"""
+        blocks = None
+        if negative_feedback.ready:
+            blocks = negative_feedback.get(self.user_id) or \
+                await negative_feedback.get_or_load(self.session_factory, self.user_id)
+        async with self.session_factory() as db:
+            if blocks is not None:
+                items, authors = blocks.items, blocks.authors
+            else:
+                items, authors = await query_blocks(db, self.user_id)
+            if self.use_seen_history:
+                # 预先加载用户的已看记录，召回节点并发检查时不再访问数据库
+                await seen_history.seen_mask(db, self.user_id, _EMPTY, self.seen_window_seconds)
+            elif self.seen_event_types:
+                since = datetime.now(timezone.utc) - timedelta(seconds=self.seen_window_seconds)
+                rows = (await db.execute(text("""
+                    SELECT DISTINCT item_id
+                    FROM app.events
+                    WHERE user_id = :user_id AND event_type = ANY(:event_types)
+                      AND item_id IS NOT NULL AND ts >= :since
+                """), {"user_id": self.user_id, "event_types": self.seen_event_types,
+                       "since": since})).fetchall()
+                seen = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+                items = np.union1d(items, seen)
+        return items, authors if self.block_authors else _EMPTY
+
+    async def _loaded(self) -> Tuple[np.ndarray, np.ndarray]:
+        try:
+            return await asyncio.shield(self._task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return _EMPTY, _EMPTY
+
+    async def excluded_ids(self) -> List[int]:
+        """显式排除的内容ID，用于SQL条件"""
+        items, _ = await self._loaded()
+        return items.tolist()
+
+    async def excluded_array(self) -> np.ndarray:
+        """显式排除的内容ID（有序数组），用于内存索引召回"""
+        items, _ = await self._loaded()
+        return items
+
+    async def fetch_size(self, size: int, pushed_down: bool = False) -> int:
+        """召回需要读取的数量，使排除后仍有size个候选项
+
+        Args:
+            pushed_down: 显式ID已在查询或索引遍历中排除，不需要为其多取
+        """
+        items, authors = await self._loaded()
+        if not pushed_down:
+            # 每个显式排除的ID最多占用一个位置
+            size += len(items)
+        if self.use_seen_history or len(authors):
+            size = math.ceil(size * self.overfetch)
+        return size
+
+    async def apply(self, candidates: CandidateBatch, size: int) -> CandidateBatch:
+        """去掉排除的候选项，保留前size个"""
+        if not len(candidates):
+            return candidates
+        items, authors = await self._loaded()
+        keep = ~np.isin(candidates.ids, items)
+        if len(authors) and candidates.has_column('author_id'):
+            keep &= ~np.isin(candidates.column('author_id'), authors)
+        if self.use_seen_history and keep.any():
+            # 会话只在用户已看记录被淘汰、需要重新加载时才获取连接
+            async with self.session_factory() as db:
+                seen = await seen_history.seen_mask(db, self.user_id, candidates.ids[keep],
+                                                    self.seen_window_seconds)
+            keep[np.flatnonzero(keep)[seen]] = False
+        return candidates.mask(keep).head(size)
+
+def recall_exclusion(session_factory: Optional[Callable], user_id: Optional[int]) -> Optional[RecallExclusion]:
+    """创建请求的召回排除集合，未启用或未登录时返回None"""
+    if not settings.RECALL_EXCLUSION_ENABLED or not user_id or session_factory is None:
+        return None
+    return RecallExclusion(
+        session_factory,
+        user_id,
+        seen_event_types=[t for t in settings.RECALL_EXCLUSION_SEEN_EVENT_TYPES.split(",") if t],
+        seen_window_seconds=settings.RECALL_EXCLUSION_SEEN_WINDOW_S,
+        block_authors=settings.RECALL_EXCLUSION_BLOCK_AUTHORS,
+        overfetch=settings.RECALL_EXCLUSION_OVERFETCH,
+    )
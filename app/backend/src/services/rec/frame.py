@@ -0,0 +1,115 @@
+from typing import Dict, List, Any, Optional, Iterable
+import time
+
+from src.services.rec.batch import CandidateBatch
+
+# 多输入合并方式
+INPUT_MODES = ("first", "concat", "map", "zip")
+
+def combine_inputs(inputs: Dict[str, Any], mode: str = "first",
+                   key: str = "id", join: str = "outer") -> Any:
+    """按节点声明的方式合并多个前驱的输出
+
+    - first: 第一个前驱的输出（按配置中的边顺序）
+    - concat: 依次拼接各前驱的候选项列表
+    - map: {前驱节点ID: 输出}，混合节点使用
+    - zip: 按key对齐各前驱的候选项，同一个key在多路出现时合并字段，
+      靠前的前驱字段优先；join为inner时只保留所有前驱都有的候选项
+
+    候选项字典只传递引用，只有zip中需要合并字段的候选项会生成新字典。
+    列式批次（CandidateBatch）的concat按列拼接，zip经由字典视图合并。
+
+    Args:
+        inputs: 前驱节点ID -> 输出
+        mode: 合并方式
+        key: zip对齐使用的字段
+        join: zip的连接方式（outer / inner）
+
+    Returns:
+        Any: 合并后的输入
+    """
+    if mode == "map":
+        return inputs
+    if not inputs:
+        return None
+
+    outputs = [output for output in inputs.values() if output is not None]
+    if mode == "first" or len(outputs) <= 1:
+        return outputs[0] if outputs else None
+
+    if any(isinstance(output, CandidateBatch) for output in outputs):
+        batches = [CandidateBatch.ensure(output) for output in outputs]
+        if mode == "concat":
+            return CandidateBatch.concat(batches)
+        if mode == "zip":
+            return CandidateBatch.from_dicts(
+                combine_inputs({str(i): batch.to_dicts() for i, batch in enumerate(batches)},
+                               mode, key, join) or [])
+
+    if mode == "concat":
+        result = []
+        for output in outputs:
+            result.extend(output)
+        return result
+
+    if mode == "zip":
+        merged: Dict[Any, Dict[str, Any]] = {}
+        present: Dict[Any, int] = {}
+        for output in outputs:
+            for item in output:
+                item_key = item.get(key)
+                existing = merged.get(item_key)
+                if existing is None:
+                    merged[item_key] = item
+                    present[item_key] = 1
+                    continue
+                merged[item_key] = {**item, **existing}
+                present[item_key] += 1
+        if join == "inner":
+            return [item for item_key, item in merged.items() if present[item_key] == len(outputs)]
+        return list(merged.values())
+
+    raise ValueError(f"不支持的输入合并方式: {mode}")
+
+class ExecutionFrame:
+    """DAG执行帧，保存单次请求的节点输入、输出和耗时
+
+    节点对象在多个请求间共享且不保存请求状态，所有请求级数据都放在执行帧中，
+    因此同一个DAG实例可以同时服务多个并发请求。
+    """
+
+    def __init__(self, dag_id: str):
+        self.dag_id = dag_id
+        self.start_time = time.perf_counter()
+        # 节点输出
+        self.outputs: Dict[str, Any] = {}
+        # 节点输入，节点ID -> {前驱节点ID: 输出}
+        self.inputs: Dict[str, Dict[str, Any]] = {}
+        # 节点耗时（毫秒）
+        self.timings_ms: Dict[str, float] = {}
+        # 节点状态
+        self.statuses: Dict[str, str] = {}
+
+    def gather_inputs(self, node_id: str, predecessors: Iterable[str]) -> Dict[str, Any]:
+        """收集节点输入，只引用前驱输出，不做复制"""
+        outputs = self.outputs
+        inputs = {src: outputs[src] for src in predecessors if src in outputs}
+        self.inputs[node_id] = inputs
+        return inputs
+
+    def set_output(self, node_id: str, output: Any) -> None:
+        """记录节点输出"""
+        self.outputs[node_id] = output
+
+    def record(self, node_id: str, status: str, duration_ms: float) -> None:
+        """记录节点状态和耗时"""
+        self.statuses[node_id] = status
+        self.timings_ms[node_id] = duration_ms
+
+    def get_output(self, node_id: str) -> Optional[Any]:
+        """获取节点输出"""
+        return self.outputs.get(node_id)
+
+    def elapsed_ms(self) -> float:
+        """执行帧创建以来的耗时（毫秒）"""
+        return (time.perf_counter() - self.start_time) * 1000
@@ -0,0 +1,184 @@
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Hashable, Set, Tuple
+from collections import OrderedDict, defaultdict
+import asyncio
+import time
+
+from src.core.config import settings
+from src.core.logger import logger
+
+def copy_output(output: Any) -> Any:
+    """复制候选列表，避免下游节点修改缓存中的字典
+
+    列式批次按不可变约定传递，下游只会派生新批次，不需要复制。
+    """
+    if isinstance(output, list):
+        return [dict(item) if isinstance(item, dict) else item for item in output]
+    return output
+
+class LastGoodCache:
+    """节点最近一次成功输出的缓存，按(DAG, 节点, 用户)索引，LRU淘汰并带TTL"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存的输出，过期或不存在时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, output = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy_output(output)
+
+    def put(self, key: Hashable, output: Any) -> None:
+        """保存节点输出"""
+        self._entries[key] = (time.monotonic(), copy_output(output))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class HedgeStats:
+    """对冲执行计数器，用于调整hedge_after_ms阈值"""
+
+    FIELDS = ("calls", "fired", "primary_won", "hedge_won", "cache_served", "failed", "late_primary")
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def incr(self, key: str, field: str) -> None:
+        self._counters[key][field] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """导出计数器，附带对冲触发率和胜率"""
+        result = {}
+        for key, counters in self._counters.items():
+            stats = dict(counters)
+            stats["fire_rate"] = round(counters["fired"] / counters["calls"], 4) if counters["calls"] else 0.0
+            wins = counters["hedge_won"] + counters["cache_served"]
+            stats["win_rate"] = round(wins / counters["fired"], 4) if counters["fired"] else 0.0
+            result[key] = stats
+        return result
+
+    def reset(self) -> None:
+        self._counters.clear()
+
+# 全局实例，在所有DAG和请求间共享
+hedge_stats = HedgeStats()
+last_good_cache = LastGoodCache(max_entries=settings.REC_LAST_GOOD_CACHE_SIZE)
+
+# 缓存胜出后仍在后台执行的主请求，保持引用直到结束
+_background_tasks: Set[asyncio.Task] = set()
+
+def _finish_in_background(stats_key: str, task: asyncio.Task, on_late_result: Callable[[Any], None]) -> None:
+    """主请求继续在后台执行，成功时以结果调用on_late_result"""
+    _background_tasks.add(task)
+
+    def done(task: asyncio.Task):
+        _background_tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.warning(f"对冲执行 {stats_key} 的后台主请求失败: {str(error)}")
+            return
+        hedge_stats.incr(stats_key, "late_primary")
+        try:
+            on_late_result(task.result())
+        except Exception as e:
+            logger.error(f"对冲执行 {stats_key} 处理后台主请求结果失败: {str(e)}")
+
+    task.add_done_callback(done)
+
+async def _cancel_all(tasks) -> None:
+    """取消并等待任务结束"""
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def run_hedged(stats_key: str,
+                     attempt: Callable[[bool], Awaitable[Any]],
+                     hedge_after_ms: float,
+                     cached: Optional[Any] = None,
+                     allow_duplicate: bool = True,
+                     on_late_result: Optional[Callable[[Any], None]] = None) -> Tuple[Any, str]:
+    """对冲执行
+
+    主请求在hedge_after_ms内未返回时：有缓存的最近一次成功结果则直接使用缓存，
+    否则在另一个连接上发起第二次请求，取先成功返回的结果，并取消另一个。
+    使用缓存时，给出on_late_result则主请求继续在后台执行，成功后以结果回调
+    （用于刷新缓存），否则取消主请求。
+
+    Args:
+        stats_key: 计数器键
+        attempt: 发起一次执行的函数，参数表示是否为对冲请求
+        hedge_after_ms: 触发对冲的等待时间（毫秒）
+        cached: 最近一次成功的输出，None表示没有
+        allow_duplicate: 是否允许发起第二次请求
+        on_late_result: 使用缓存后主请求在后台完成时的回调
+
+    Returns:
+        Tuple[Any, str]: 输出和胜出方（primary / hedge / cache）
+    """
+    hedge_stats.incr(stats_key, "calls")
+    primary = asyncio.create_task(attempt(False))
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after_ms / 1000)
+    except asyncio.CancelledError:
+        await _cancel_all([primary])
+        raise
+    if done:
+        hedge_stats.incr(stats_key, "primary_won")
+        return primary.result(), "primary"
+
+    hedge_stats.incr(stats_key, "fired")
+
+    # 使用缓存的最近一次成功结果
+    if cached is not None:
+        if on_late_result is not None:
+            _finish_in_background(stats_key, primary, on_late_result)
+        else:
+            await _cancel_all([primary])
+        hedge_stats.incr(stats_key, "cache_served")
+        return cached, "cache"
+
+    if not allow_duplicate:
+        try:
+            result = await primary
+        except asyncio.CancelledError:
+            await _cancel_all([primary])
+            raise
+        hedge_stats.incr(stats_key, "primary_won")
+        return result, "primary"
+
+    # 在另一个连接上发起对冲请求，取先成功的结果
+    hedge = asyncio.create_task(attempt(True))
+    pending = {primary, hedge}
+    last_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                error = task.exception()
+                if error is not None:
+                    last_error = error
+                    logger.warning(f"对冲执行 {stats_key} 的一次请求失败: {str(error)}")
+                    continue
+                winner = "hedge" if task is hedge else "primary"
+                hedge_stats.incr(stats_key, f"{winner}_won")
+                return task.result(), winner
+    finally:
+        await _cancel_all(list(pending))
+
+    hedge_stats.incr(stats_key, "failed")
+    raise last_error or RuntimeError(f"对冲执行 {stats_key} 失败")
@@ -0,0 +1,105 @@
+from typing import Dict, List, Any, Iterable, Optional
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from src.core.logger import logger
+from src.db.models import Item
+from src.services.rec.trace import TraceInfo
+from src.services.rec.catalog import item_catalog, CatalogItem
+
+class HydratedItem:
+    """目录记录加上从数据库加载的标题、正文和原始标签
+
+    属性名与Item模型一致，格式化和接口代码可以直接替换数据库对象使用。
+    """
+
+    __slots__ = ('record', 'title', 'content', 'tags')
+
+    def __init__(self, record: CatalogItem, row: Any):
+        self.record = record
+        self.title = row.title
+        self.content = row.content
+        self.tags = row.tags
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.record, name)
+
+def candidate_ids(candidates: Iterable[Dict[str, Any]]) -> List[int]:
+    """候选项ID列表，忽略无法转换为整数的ID"""
+    ids = []
+    for candidate in candidates:
+        try:
+            ids.append(int(candidate.get('id')))
+        except (ValueError, TypeError) as e:
+            logger.error(f"候选项ID类型转换错误: {str(e)}")
+    return ids
+
+async def load_items(db: AsyncSession, ids: List[int]) -> Dict[int, Any]:
+    """批量加载最终结果的完整内容
+    
+    召回和排序阶段只携带ID、分数和轻量字段，标题、正文等大字段在格式化前
+    对最终的少量结果一次性加载。命中内容目录的内容只查询正文列，作者和媒体
+    使用目录记录；未命中的内容再一次性查询完整记录和作者。
+    
+    Args:
+        db: 数据库会话
+        ids: 内容ID列表
+        
+    Returns:
+        Dict[int, Any]: 内容ID -> 内容（HydratedItem或数据库对象），不存在的ID不包含在结果中
+    """
+    if not ids:
+        return {}
+    records, missing = item_catalog.get_many(ids)
+    items: Dict[int, Any] = {}
+    if records:
+        result = await db.execute(
+            select(Item.id, Item.title, Item.content, Item.tags).where(Item.id.in_(list(records)))
+        )
+        for row in result.all():
+            items[row.id] = HydratedItem(records[row.id], row)
+    if missing:
+        # 作者通过selectinload批量加载
+        query = (
+            select(Item)
+            .options(selectinload(Item.author))
+            .where(Item.id.in_(missing))
+        )
+        result = await db.execute(query)
+        items.update((item.id, item) for item in result.scalars().all())
+    # 恢复输入顺序
+    return {item_id: items[item_id] for item_id in dict.fromkeys(ids) if item_id in items}
+
+async def hydrate_items(db: AsyncSession, candidates: List[Dict[str, Any]],
+                        trace: Optional[TraceInfo] = None,
+                        node_id: str = "hydration") -> Dict[int, Any]:
+    """加载候选项中内容类型结果的完整内容和作者，并在trace中记录加载耗时
+    
+    Args:
+        db: 数据库会话
+        candidates: 最终结果
+        trace: 追踪信息
+        node_id: 记录耗时的trace节点
+        
+    Returns:
+        Dict[int, Any]: 内容ID -> 内容
+    """
+    ids = candidate_ids(candidate for candidate in candidates
+                        if candidate.get('kind', 'content') == 'content')
+    start_time = time.perf_counter()
+    items_db = await load_items(db, ids)
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    
+    if trace:
+        trace.add_node_detail(node_id, "hydration_ms", round(duration_ms, 2))
+        trace.add_node_detail(node_id, "hydrated_count", len(items_db))
+        trace.add_node_detail(node_id, "catalog_hit_count",
+                              sum(isinstance(item, HydratedItem) for item in items_db.values()))
+        trace.add_node_detail(node_id, "missing_count", len(set(ids) - items_db.keys()))
+    return items_db
+
+def author_name(item_db: Any, default: str = "未知作者") -> str:
+    """作者名称，作者不存在时使用默认名称"""
+    return item_db.author.username if item_db.author else default
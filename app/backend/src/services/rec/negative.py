@@ -0,0 +1,216 @@
+from typing import Dict, List, Any, Optional, Callable, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.logger import logger
+
+class UserBlocks:
+    """用户拉黑的内容和作者（有序ID数组）"""
+
+    __slots__ = ("items", "authors", "expires_at")
+
+    def __init__(self, items: np.ndarray, authors: np.ndarray, expires_at: float):
+        self.items = items
+        self.authors = authors
+        self.expires_at = expires_at
+
+    def update(self, kind: str, entity_id: int, active: bool):
+        ids = getattr(self, kind)
+        ids = np.union1d(ids, [entity_id]) if active else ids[ids != entity_id]
+        setattr(self, kind, ids.astype(np.int64))
+
+# 关系的实体类型 -> UserBlocks的字段
+ENTITY_KINDS = {"item": "items", "user": "authors"}
+
+async def query_blocks(db: AsyncSession, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """查询用户拉黑的内容和作者（有序ID数组）"""
+    rows = (await db.execute(text("""
+        SELECT entity_type, entity_id
+        FROM rel.user_entity_relations
+        WHERE user_id = :user_id AND relation_type = 'block' AND status = 'active'
+          AND entity_type IN ('item', 'user')
+    """), {"user_id": user_id})).fetchall()
+    ids = {kind: [] for kind in ENTITY_KINDS.values()}
+    for row in rows:
+        ids[ENTITY_KINDS[row.entity_type]].append(row.entity_id)
+    return (np.unique(np.array(ids["items"], dtype=np.int64)),
+            np.unique(np.array(ids["authors"], dtype=np.int64)))
+
+class NegativeFeedbackCache:
+    """用户负反馈（拉黑的内容、作者）缓存
+
+    按用户惰性加载，LRU保留max_users个用户，加载后ttl_seconds内有效。请求开始时
+    通过prefetch在后台加载，与召回并行，过滤节点用get同步读取。
+
+    /relations/upsert写入拉黑关系时直接更新本进程的缓存；其他进程写入的变化按
+    last_interact_at水位定期拉取，使对应用户的缓存失效。
+    """
+
+    def __init__(self, max_users: int = 100000, ttl_seconds: float = 600,
+                 max_staleness_seconds: float = 60, overlap_seconds: float = 5.0):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self.overlap_seconds = overlap_seconds
+        self._entries: "OrderedDict[int, UserBlocks]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Task] = {}
+        # 正在加载的用户在加载期间收到的写入，None表示加载期间已失效
+        self._pending: Dict[int, Optional[List[Tuple[str, int, bool]]]] = {}
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self._stats = dict.fromkeys(("hits", "misses", "loads", "load_errors", "writes",
+                                     "invalidations", "evictions", "refreshes", "refresh_errors"), 0)
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded:
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def get(self, user_id: int) -> Optional[UserBlocks]:
+        """同步读取，未加载或已过期时返回None"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at <= time.monotonic():
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self._stats["hits"] += 1
+        return entry
+
+    def prefetch(self, session_factory: Callable, user_id: Optional[int]):
+        """在后台加载用户的负反馈，已缓存或正在加载时不做任何事"""
+        if not user_id or not self.ready:
+            return
+        entry = self._entries.get(user_id)
+        if (entry is None or entry.expires_at <= time.monotonic()) and user_id not in self._loading:
+            self._start(session_factory, user_id)
+
+    async def get_or_load(self, session_factory: Callable, user_id: int) -> UserBlocks:
+        """读取缓存，未命中时加载（同一用户同时只加载一次）"""
+        entry = self.get(user_id)
+        if entry is not None:
+            return entry
+        task = self._loading.get(user_id) or self._start(session_factory, user_id)
+        return await asyncio.shield(task)
+
+    def _start(self, session_factory: Callable, user_id: int) -> asyncio.Task:
+        task = asyncio.create_task(self._load_user(session_factory, user_id))
+        self._loading[user_id] = task
+        task.add_done_callback(lambda done: self._finish(user_id, done))
+        return task
+
+    def _finish(self, user_id: int, task: asyncio.Task):
+        if self._loading.get(user_id) is task:
+            del self._loading[user_id]
+            self._pending.pop(user_id, None)
+        # 预取没有等待方，在这里取走异常，避免未处理异常的警告
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["load_errors"] += 1
+            logger.warning(f"加载用户 {user_id} 的负反馈失败: {str(task.exception())}")
+
+    async def _load_user(self, session_factory: Callable, user_id: int) -> UserBlocks:
+        self._stats["loads"] += 1
+        self._pending[user_id] = []
+        async with session_factory() as db:
+            items, authors = await query_blocks(db, user_id)
+        entry = UserBlocks(items, authors, time.monotonic() + self.ttl_seconds)
+        pending = self._pending.pop(user_id, [])
+        if pending is None:
+            # 加载期间被其他进程的写入失效，结果可能已过时，只用于这次请求
+            return entry
+        # 加载期间本进程的写入可能没有被查询读到，在结果上重放（重放是幂等的）
+        for kind, entity_id, active in pending:
+            entry.update(kind, entity_id, active)
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+        return entry
+
+    def apply(self, user_id: int, entity_type: str, entity_id: int, relation_type: str, active: bool = True):
+        """关系写入后同步更新缓存（只处理拉黑关系）"""
+        kind = ENTITY_KINDS.get(entity_type)
+        if relation_type != "block" or kind is None:
+            return
+        self._stats["writes"] += 1
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.update(kind, entity_id, active)
+        if self._pending.get(user_id) is not None:
+            self._pending[user_id].append((kind, entity_id, active))
+
+    def invalidate(self, user_id: int):
+        if self._entries.pop(user_id, None) is not None:
+            self._stats["invalidations"] += 1
+        if user_id in self._pending:
+            self._pending[user_id] = None
+
+    async def load(self, session_factory: Callable):
+        """清空缓存并从当前时间开始拉取变化"""
+        async with self._lock, session_factory() as db:
+            now = (await db.execute(text("SELECT NOW()"))).scalar()
+            self._entries.clear()
+            self._watermark = now
+            self.loaded = True
+            self.last_refresh_at = time.time()
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """拉取水位之后有拉黑关系变化的用户并使其缓存失效，返回用户数量"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return 0
+
+        async with self._lock, session_factory() as db:
+            rows = (await db.execute(text("""
+                SELECT user_id, MAX(last_interact_at) AS changed_at
+                FROM rel.user_entity_relations
+                WHERE relation_type = 'block' AND last_interact_at > :since
+                GROUP BY user_id
+            """), {"since": self._watermark - timedelta(seconds=self.overlap_seconds)})).fetchall()
+            for row in rows:
+                self.invalidate(row.user_id)
+                if row.changed_at > self._watermark:
+                    self._watermark = row.changed_at
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+        return len(rows)
+
+    async def watch(self, session_factory: Callable, interval_seconds: float):
+        """定期拉取其他进程写入的拉黑关系"""
+        logger.info(f"开始拉取拉黑关系变化，间隔 {interval_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.refresh(session_factory)
+            except Exception as e:
+                # 超过最大陈旧时间后过滤节点查询数据库
+                self._stats["refresh_errors"] += 1
+                logger.error(f"拉取拉黑关系变化失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "users": len(self._entries),
+            "loading": len(self._loading),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            **self._stats,
+        }
+
+# 全局负反馈缓存
+negative_feedback = NegativeFeedbackCache(
+    max_users=settings.NEGATIVE_FEEDBACK_MAX_USERS,
+    ttl_seconds=settings.NEGATIVE_FEEDBACK_TTL_S,
+    max_staleness_seconds=settings.NEGATIVE_FEEDBACK_MAX_STALENESS_S,
+)
@@ -0,0 +1,243 @@
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
+from collections import OrderedDict, defaultdict
+import asyncio
+import hashlib
+import json
+import time
+import redis.asyncio as redis
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.hedge import copy_output
+
+class _Entry:
+    __slots__ = ("output", "fresh_until", "stale_until")
+
+    def __init__(self, output: Any, fresh_until: float, stale_until: float):
+        self.output = output
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+class RedisL2:
+    """节点输出的Redis二级缓存，多个worker共享
+
+    输出按字典视图序列化为JSON。Redis不可用时记录日志并在一段时间内跳过，
+    不影响节点执行。其他进程内缓存可以通过get_raw / set_raw存取自己的序列化格式。
+    """
+
+    def __init__(self, url: str, timeout_ms: float = 50, retry_after_seconds: float = 30,
+                 prefix: str = "rec:node:"):
+        self.url = url
+        self.timeout_ms = timeout_ms
+        self.retry_after_seconds = retry_after_seconds
+        self.prefix = prefix
+        self._client = None
+        self._disabled_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _get_client(self):
+        if self._client is None:
+            timeout = self.timeout_ms / 1000
+            self._client = redis.Redis.from_url(self.url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        return self._client
+
+    def _fail(self, action: str, error: Exception):
+        self._disabled_until = time.monotonic() + self.retry_after_seconds
+        logger.warning(f"Redis二级缓存（{self.prefix}）{action}失败，{self.retry_after_seconds}s内跳过: {str(error)}")
+
+    @staticmethod
+    def _dumps(output: Any, fresh_until: float) -> str:
+        if isinstance(output, CandidateBatch):
+            payload = {"format": "batch", "rows": output.to_dicts()}
+        else:
+            payload = {"format": "list", "rows": output}
+        # 记录墙钟时间的新鲜截止时间，其他worker据此判断是否需要重新计算
+        payload["fresh_until"] = time.time() + (fresh_until - time.monotonic())
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _loads(raw: bytes) -> Tuple[Any, float]:
+        payload = json.loads(raw)
+        rows = payload["rows"]
+        output = CandidateBatch.from_dicts(rows) if payload["format"] == "batch" else rows
+        return output, payload["fresh_until"] - time.time()
+
+    async def get_raw(self, key: str) -> Optional[bytes]:
+        """读取原始值，不存在或不可用时返回None"""
+        if not self.available:
+            return None
+        try:
+            return await self._get_client().get(self.prefix + key)
+        except Exception as e:
+            self._fail("读取", e)
+            return None
+
+    async def set_raw(self, key: str, raw: Any, expire_seconds: float):
+        if not self.available:
+            return
+        try:
+            await self._get_client().set(self.prefix + key, raw, ex=max(1, int(expire_seconds)))
+        except Exception as e:
+            self._fail("写入", e)
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """读取输出和剩余新鲜时间（秒），不存在或不可用时返回None"""
+        raw = await self.get_raw(key)
+        if raw is None:
+            return None
+        try:
+            return self._loads(raw)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"节点输出二级缓存 {key} 无法解析: {str(e)}")
+            return None
+
+    async def set(self, key: str, output: Any, fresh_until: float, expire_seconds: float):
+        if self.available:
+            await self.set_raw(key, self._dumps(output, fresh_until), expire_seconds)
+
+class NodeOutputCache:
+    """与用户无关的节点输出缓存
+
+    节点在DAG配置中通过output_cache开启，缓存键由DAG、DAG版本、节点和key_fields
+    指定的上下文字段组成（默认不包含user_id）：
+    - 新鲜期（ttl_seconds）内直接返回缓存
+    - 过期后的stale_seconds内返回旧输出，同时在后台重新计算一次（stale-while-revalidate）
+    - 同一个键同时只有一次计算，并发请求等待同一个结果（single-flight）
+    - 开启l2时先读Redis，计算结果同时写入Redis，多个worker共享
+
+    计算在独立任务中执行，等待方超时或取消不会中断计算，其他等待方仍能拿到结果。
+    """
+
+    def __init__(self, max_entries: int = 1000, l2: Optional[RedisL2] = None):
+        self.max_entries = max_entries
+        self.l2 = l2
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(("hit", "stale", "coalesced", "l2_hit", "miss", "refresh", "error"), 0))
+
+    @staticmethod
+    def make_key(dag_id: str, version: Optional[str], node_id: str, key_fields: List[str],
+                 context: Dict[str, Any]) -> str:
+        fields = json.dumps([context.get(field) for field in key_fields], default=str, sort_keys=True)
+        digest = hashlib.md5(fields.encode("utf-8")).hexdigest()[:12]
+        return f"{dag_id}:{version}:{node_id}:{digest}"
+
+    def _put(self, key: str, output: Any, fresh_until: float, stale_until: float):
+        self._entries[key] = _Entry(output, fresh_until, stale_until)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             ttl_seconds: float, stale_seconds: float = 0,
+                             use_l2: bool = False, stats_key: Optional[str] = None) -> Tuple[Any, str]:
+        """读取缓存或计算
+
+        Returns:
+            Tuple[Any, str]: 输出和来源（hit / stale / coalesced / l2_hit / miss）
+        """
+        stats = self._stats[stats_key or key]
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                stats["hit"] += 1
+                return copy_output(entry.output), "hit"
+            if now < entry.stale_until:
+                if key not in self._inflight:
+                    stats["refresh"] += 1
+                    self._start(key, compute, ttl_seconds, stale_seconds, use_l2, stats, check_l2=False)
+                stats["stale"] += 1
+                return copy_output(entry.output), "stale"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            stats["coalesced"] += 1
+            source = "coalesced"
+        else:
+            task = self._start(key, compute, ttl_seconds, stale_seconds, use_l2, stats, check_l2=use_l2)
+            source = None
+        # 等待方被取消时不取消计算
+        output, computed_source = await asyncio.shield(task)
+        return copy_output(output), source or computed_source
+
+    def _start(self, key: str, compute: Callable[[], Awaitable[Any]], ttl_seconds: float,
+               stale_seconds: float, use_l2: bool, stats: Dict[str, int], check_l2: bool) -> asyncio.Task:
+        task = asyncio.create_task(self._compute(key, compute, ttl_seconds, stale_seconds,
+                                                 use_l2, stats, check_l2))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 后台刷新没有等待方，在这里取走异常，避免未处理异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl_seconds: float,
+                       stale_seconds: float, use_l2: bool, stats: Dict[str, int],
+                       check_l2: bool) -> Tuple[Any, str]:
+        l2 = self.l2 if use_l2 else None
+        if l2 is not None and check_l2:
+            cached = await l2.get(key)
+            if cached is not None and cached[1] > 0:
+                output, remaining = cached
+                now = time.monotonic()
+                self._put(key, output, now + remaining, now + remaining + stale_seconds)
+                stats["l2_hit"] += 1
+                return output, "l2_hit"
+
+        stats["miss"] += 1
+        try:
+            output = await compute()
+        except BaseException as e:
+            stats["error"] += 1
+            if not isinstance(e, asyncio.CancelledError):
+                logger.warning(f"节点输出缓存 {key} 计算失败: {str(e)}")
+            raise
+        now = time.monotonic()
+        fresh_until = now + ttl_seconds
+        self._put(key, output, fresh_until, fresh_until + stale_seconds)
+        if l2 is not None:
+            await l2.set(key, output, fresh_until, ttl_seconds + stale_seconds)
+        return output, "miss"
+
+    def invalidate(self, prefix: str = "") -> int:
+        """删除键以prefix开头的一级缓存，返回删除数量"""
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot(self) -> Dict[str, Any]:
+        result = {}
+        for key, counters in self._stats.items():
+            stats = dict(counters)
+            served = counters["hit"] + counters["stale"] + counters["coalesced"] + counters["l2_hit"]
+            total = served + counters["miss"]
+            stats["hit_rate"] = round(served / total, 4) if total else 0.0
+            result[key] = stats
+        return {
+            "entries": len(self),
+            "inflight": len(self._inflight),
+            "l2_available": self.l2.available if self.l2 is not None else None,
+            "nodes": result,
+        }
+
+# 全局节点输出缓存
+node_output_cache = NodeOutputCache(
+    max_entries=settings.REC_NODE_CACHE_SIZE,
+    l2=RedisL2(settings.REDIS_URL, timeout_ms=settings.REC_NODE_CACHE_REDIS_TIMEOUT_MS)
+    if settings.REC_NODE_CACHE_L2_ENABLED else None,
+)
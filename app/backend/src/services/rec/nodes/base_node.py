@@ -1,19 +1,38 @@
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Optional, Set, Sequence
+import math
+import numpy as np
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.trace import TraceInfo
+from src.services.rec.frame import INPUT_MODES
+from src.services.rec.batch import CandidateBatch, INT_MISSING
+from src.services.rec.catalog import CatalogItem, item_catalog
+from src.db.models import Item
 
 class RecNode:
     """推荐系统节点基类"""
     
+    # 多个前驱时的默认输入合并方式，见frame.combine_inputs
+    default_input_mode = "first"
+    
     def __init__(self, node_id: str, config: Dict[str, Any]):
         self.node_id = node_id
         self.config = config
         self.enabled = config.get('enabled', True)
         
+        # 多输入合并方式
+        self.input_mode = config.get('input_mode', self.default_input_mode)
+        self.input_key = config.get('input_key', 'id')
+        self.input_join = config.get('input_join', 'outer')
+        
         # 检查必要配置
         self._check_required_fields()
+        if self.input_mode not in INPUT_MODES:
+            raise ValueError(f"节点 {self.node_id} 不支持的输入合并方式: {self.input_mode}")
+        if self.input_join not in ("outer", "inner"):
+            raise ValueError(f"节点 {self.node_id} 不支持的输入连接方式: {self.input_join}")
     
     def get_required_fields(self) -> List[str]:
         """获取必要的配置字段，子类可以重写此方法以添加更多字段"""
@@ -46,7 +65,7 @@ class RecNode:
             # 记录开始处理
             if trace:
                 trace.start_node(self.node_id, self.__class__.__name__)
-                if isinstance(data, list):
+                if isinstance(data, (list, CandidateBatch)):
                     trace.set_node_input_count(self.node_id, len(data))
             
             # 处理数据
@@ -55,7 +74,7 @@ class RecNode:
             # 记录处理结果
             if trace:
                 status = "success"
-                output_count = len(result) if isinstance(result, list) else 0
+                output_count = len(result) if isinstance(result, (list, CandidateBatch)) else 0
                 trace.end_node(self.node_id, status, output_count)
             
             return result
@@ -81,19 +100,116 @@ class RecNode:
             return data
 
 class RecallNode(RecNode):
-    """召回节点基类"""
+    """召回节点基类
+    
+    召回只查询排序和过滤需要的轻量字段（见light_columns），标题、正文、媒体等大字段
+    在推荐结果格式化前按最终结果批量加载。
+    
+    上下文中有召回排除集合（见exclusion）时，子类按fetch_size读取，在SQL中排除
+    excluded_ids、在内存索引中跳过excluded_array，召回结果去掉排除的候选项后保留
+    recall_size个。
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
         self.recall_size = config.get('recall_size', 100)
     
+    @staticmethod
+    def light_columns():
+        """召回查询的轻量字段"""
+        return (Item.id, Item.tags, Item.author_id, Item.created_at, Item.kind)
+    
+    @staticmethod
+    def to_candidate(row: Any, **attrs: Any) -> Dict[str, Any]:
+        """将轻量字段行转换为候选项"""
+        return {
+            'id': row.id,
+            'tags': row.tags,
+            'author_id': row.author_id,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'kind': row.kind,
+            **attrs,
+        }
+    
+    @staticmethod
+    def catalog_candidates(items: Sequence[CatalogItem], **columns: Any) -> CandidateBatch:
+        """由内容目录记录直接构建候选批次，标签使用目录中已驻留的ID"""
+        n = len(items)
+        if n == 0:
+            return CandidateBatch.empty()
+        ids = np.fromiter((item.id for item in items), dtype=np.int64, count=n)
+        lengths = np.zeros(n + 1, dtype=np.int64)
+        lengths[1:] = [len(item.tag_ids) for item in items]
+        tag_ids = np.fromiter((tag_id for item in items for tag_id in item.tag_ids),
+                              dtype=np.int32, count=int(lengths.sum()))
+        kinds = np.empty(n, dtype=object)
+        kinds[:] = [item.kind for item in items]
+        batch = CandidateBatch(ids, {
+            'author_id': np.fromiter((INT_MISSING if item.author_id is None else item.author_id
+                                      for item in items), dtype=np.int64, count=n),
+            'created_ts': np.fromiter((item.created_ts for item in items), dtype=np.float64, count=n),
+            'kind': kinds,
+        }, np.cumsum(lengths), tag_ids)
+        return batch.with_columns(**columns) if columns else batch
+    
+    async def load_candidates(self, db: AsyncSession, ids: Sequence[int], **columns: Any) -> CandidateBatch:
+        """按ID构建候选批次
+        
+        优先读取内容目录，未命中的ID一次性查询轻量字段；不存在的ID被丢弃，其余保持
+        输入顺序。columns为与ids对齐的附加列（如召回分数）或广播到所有候选项的标量。
+        """
+        ids = [int(item_id) for item_id in ids]
+        found, missing = item_catalog.get_many(ids)
+        batches = [self.catalog_candidates(list(found.values()))]
+        if missing:
+            result = await db.execute(select(*self.light_columns()).where(Item.id.in_(missing)))
+            batches.append(CandidateBatch.from_dicts([self.to_candidate(row) for row in result.all()]))
+        merged = CandidateBatch.concat(batches)
+        
+        # 恢复输入顺序
+        position = {item_id: i for i, item_id in enumerate(merged.ids.tolist())}
+        keep = [i for i, item_id in enumerate(ids) if item_id in position]
+        batch = merged.take([position[ids[i]] for i in keep])
+        if columns:
+            batch = batch.with_columns(**{
+                name: np.asarray(values)[keep] if isinstance(values, (np.ndarray, list)) else values
+                for name, values in columns.items()
+            })
+        return batch
+    
+    async def fetch_size(self, context: Dict[str, Any], pushed_down: bool = False) -> int:
+        """召回需要读取的数量，有排除集合时多取，使排除后仍有recall_size个候选项
+        
+        计算节点输出缓存时没有排除集合，按上下文中的recall_overfetch多取，
+        读取缓存的请求排除后再截断（见DAG._invoke_node）。
+        
+        Args:
+            pushed_down: 查询或索引遍历中已排除显式ID
+        """
+        exclusion = context.get('exclusion')
+        if exclusion is None:
+            return math.ceil(self.recall_size * context.get('recall_overfetch', 1.0))
+        return await exclusion.fetch_size(self.recall_size, pushed_down)
+    
+    @staticmethod
+    async def excluded_ids(context: Dict[str, Any]) -> List[int]:
+        """需要在SQL查询中排除的内容ID"""
+        exclusion = context.get('exclusion')
+        return await exclusion.excluded_ids() if exclusion is not None else []
+    
+    @staticmethod
+    async def excluded_array(context: Dict[str, Any]) -> Optional[np.ndarray]:
+        """需要在内存索引中跳过的内容ID，没有排除集合时为None"""
+        exclusion = context.get('exclusion')
+        return await exclusion.excluded_array() if exclusion is not None else None
+    
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
         fields.extend(['recall_size'])
         return fields
     
-    async def process(self, data: Any, context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """处理数据，对于召回节点，输入数据通常被忽略"""
+    async def process(self, data: Any, context: Dict[str, Any]) -> CandidateBatch:
+        """处理数据，对于召回节点，输入数据通常被忽略，召回结果转换为列式批次"""
         # 获取数据库会话和用户ID
         db = context.get('db')
         user_id = context.get('user_id')
@@ -102,7 +218,16 @@ class RecallNode(RecNode):
             raise ValueError("缺少数据库会话")
         
         # 调用子类实现的召回方法
-        return await self.recall(db, user_id, context)
+        candidates = CandidateBatch.ensure(await self.recall(db, user_id, context))
+        
+        exclusion = context.get('exclusion')
+        if exclusion is None:
+            return candidates
+        excluded = await exclusion.apply(candidates, self.recall_size)
+        trace = context.get('trace')
+        if trace:
+            trace.add_node_detail(self.node_id, "exclusion", {"fetched": len(candidates), "kept": len(excluded)})
+        return excluded
     
     async def recall(self, db: AsyncSession, user_id: Optional[int], 
                     context: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -121,16 +246,16 @@ class RankNode(RecNode):
         fields.extend(['rank_size'])
         return fields
     
-    async def process(self, candidates: List[Dict[str, Any]], context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """处理数据，对于排序节点，输入数据是候选项列表"""
+    async def process(self, candidates: CandidateBatch, context: Dict[str, Any]) -> CandidateBatch:
+        """处理数据，对于排序节点，输入数据是候选集"""
         # 获取用户ID
         user_id = context.get('user_id')
         
         # 调用子类实现的排序方法
-        return await self.rank(candidates, user_id, context)
+        return await self.rank(CandidateBatch.ensure(candidates), user_id, context)
     
-    async def rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                 context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                 context: Dict[str, Any]) -> CandidateBatch:
         """排序方法，子类必须实现"""
         raise NotImplementedError("子类必须实现rank方法")
 
@@ -140,32 +265,39 @@ class FilterNode(RecNode):
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
     
-    async def process(self, candidates: List[Dict[str, Any]], context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """处理数据，对于过滤节点，输入数据是候选项列表"""
+    async def process(self, candidates: CandidateBatch, context: Dict[str, Any]) -> CandidateBatch:
+        """处理数据，对于过滤节点，输入数据是候选集"""
         # 获取用户ID
         user_id = context.get('user_id')
         
         # 调用子类实现的过滤方法
-        return await self.filter(candidates, user_id, context)
+        return await self.filter(CandidateBatch.ensure(candidates), user_id, context)
     
-    async def filter(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                   context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def filter(self, candidates: CandidateBatch, user_id: Optional[int], 
+                   context: Dict[str, Any]) -> CandidateBatch:
         """过滤方法，子类必须实现"""
         raise NotImplementedError("子类必须实现filter方法")
 
 class BlendNode(RecNode):
     """混合节点基类"""
     
+    # 混合节点需要区分各路来源
+    default_input_mode = "map"
+    
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
     
-    async def process(self, candidates_map: Dict[str, List[Dict[str, Any]]], context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """处理数据，对于混合节点，输入数据是多个候选项列表的映射"""
+    async def process(self, candidates_map: Dict[str, CandidateBatch], context: Dict[str, Any]) -> CandidateBatch:
+        """处理数据，对于混合节点，输入数据是多个候选集的映射"""
+        candidates_map = {
+            source: CandidateBatch.ensure(candidates)
+            for source, candidates in (candidates_map or {}).items()
+        }
         # 调用子类实现的混合方法
         return await self.blend(candidates_map, context)
     
-    async def blend(self, candidates_map: Dict[str, List[Dict[str, Any]]], 
-                  context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def blend(self, candidates_map: Dict[str, CandidateBatch], 
+                  context: Dict[str, Any]) -> CandidateBatch:
         """混合方法，子类必须实现"""
         raise NotImplementedError("子类必须实现blend方法")
 
@@ -1,9 +1,10 @@
 from typing import Dict, List, Any, Optional
 import random
-from collections import defaultdict
+import numpy as np
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import BlendNode
+from src.services.rec.batch import CandidateBatch
 
 class SnakeMergeNode(BlendNode):
     """Snake Merge节点，用于交错合并多个召回源的结果"""
@@ -21,12 +22,12 @@ class SnakeMergeNode(BlendNode):
         fields.extend(['output_size'])
         return fields
     
-    async def blend(self, candidates_map: Dict[str, List[Dict[str, Any]]], 
-                  context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def blend(self, candidates_map: Dict[str, CandidateBatch], 
+                  context: Dict[str, Any]) -> CandidateBatch:
         """交错合并多个召回源的结果"""
-        # 如果没有候选项，返回空列表
+        # 如果没有候选项，返回空批次
         if not candidates_map:
-            return []
+            return CandidateBatch.empty()
         
         # 获取trace信息
         trace = context.get('trace')
@@ -34,19 +35,16 @@ class SnakeMergeNode(BlendNode):
             for source, candidates in candidates_map.items():
                 trace.add_node_detail(self.node_id, f"source_{source}_count", len(candidates))
         
-        # 准备各个来源的候选项队列
-        source_queues = {}
-        for source, candidates in candidates_map.items():
-            if candidates:  # 只处理非空列表
-                source_queues[source] = list(candidates)  # 创建副本，避免修改原始数据
+        # 只处理非空来源
+        source_batches = {source: candidates for source, candidates in candidates_map.items() if len(candidates)}
         
-        # 如果所有来源都没有候选项，返回空列表
-        if not source_queues:
-            return []
+        # 如果所有来源都没有候选项，返回空批次
+        if not source_batches:
+            return CandidateBatch.empty()
         
         # 计算每个来源的权重
         weights = {}
-        for source in source_queues.keys():
+        for source in source_batches.keys():
             weights[source] = self.source_weights.get(source, self.default_weight)
         
         # 归一化权重
@@ -60,20 +58,20 @@ class SnakeMergeNode(BlendNode):
         remaining = self.output_size
         for source, weight in weights.items():
             # 计算目标数量，但不超过该来源的实际候选项数量
-            count = min(int(self.output_size * weight), len(source_queues[source]))
+            count = min(int(self.output_size * weight), len(source_batches[source]))
             target_counts[source] = count
             remaining -= count
         
         # 分配剩余的名额
         if remaining > 0:
             # 按照候选项数量排序，优先分配给候选项较多的来源
-            sorted_sources = sorted(source_queues.keys(), 
-                                   key=lambda s: len(source_queues[s]), 
+            sorted_sources = sorted(source_batches.keys(), 
+                                   key=lambda s: len(source_batches[s]), 
                                    reverse=True)
             
             for source in sorted_sources:
                 # 不超过该来源的实际候选项数量
-                additional = min(remaining, len(source_queues[source]) - target_counts[source])
+                additional = min(remaining, len(source_batches[source]) - target_counts[source])
                 if additional > 0:
                     target_counts[source] += additional
                     remaining -= additional
@@ -86,64 +84,78 @@ class SnakeMergeNode(BlendNode):
             for source, count in target_counts.items():
                 trace.add_node_detail(self.node_id, f"target_{source}_count", count)
         
-        # 执行Snake Merge
-        result = []
-        seen_ids = set()  # 用于去重
-        
         # 确定起始来源
-        sources = list(source_queues.keys())
+        sources = list(source_batches.keys())
         if self.random_start and sources:
             # 随机选择起始来源
             start_idx = random.randint(0, len(sources) - 1)
             sources = sources[start_idx:] + sources[:start_idx]
         
-        # 循环直到达到目标数量或所有来源都耗尽
-        while len(result) < self.output_size and source_queues:
-            for source in list(sources):  # 使用list创建副本，因为我们可能会修改sources
-                if source not in source_queues:
-                    continue
-                
-                queue = source_queues[source]
-                if not queue:  # 该来源已耗尽
-                    del source_queues[source]
-                    continue
-                
-                # 取出候选项
-                candidate = queue.pop(0)
-                
-                # 去重检查
-                if self.deduplicate:
-                    item_id = candidate.get('id')
-                    if item_id in seen_ids:
-                        continue
-                    seen_ids.add(item_id)
-                
-                # 添加来源信息
-                candidate['source'] = source
-                
-                # 添加到结果
-                result.append(candidate)
-                
-                # 检查是否达到该来源的目标数量
-                if len([c for c in result if c.get('source') == source]) >= target_counts.get(source, 0):
-                    del source_queues[source]
-                
-                # 检查是否达到总目标数量
-                if len(result) >= self.output_size:
-                    break
-            
-            # 如果所有来源都已处理完但还未达到目标数量，跳出循环
-            if not source_queues:
-                break
+        # 执行Snake Merge
+        merged = CandidateBatch.concat([source_batches[source] for source in sources])
+        selected, source_index = self._snake_order(
+            [len(source_batches[source]) for source in sources],
+            [target_counts[source] for source in sources],
+            merged.ids,
+        )
+        
+        # 添加来源信息
+        source_names = np.array(sources, dtype=object)
+        result = merged.with_columns(source=source_names[source_index]).take(selected)
         
         # 记录最终结果
         if trace:
-            source_counts = defaultdict(int)
-            for candidate in result:
-                source = candidate.get('source', 'unknown')
-                source_counts[source] += 1
+            final_counts = np.bincount(source_index[selected], minlength=len(sources))
+            for i, source in enumerate(sources):
+                if final_counts[i]:
+                    trace.add_node_detail(self.node_id, f"final_{source}_count", int(final_counts[i]))
+        
+        return result
+    
+    def _snake_order(self, lengths: List[int], targets: List[int], ids: np.ndarray):
+        """计算交错合并选中的下标
+        
+        逐轮从每个来源取一个候选项：第r轮访问各来源的第r个候选项，因此访问顺序就是
+        按(队列位置, 来源顺序)排序。去重时已选过的ID被跳过；来源选满目标数量后不再被
+        访问（目标为0的来源仍会选中一个，与逐项合并的行为一致）。
+        
+        来源何时选满取决于去重，而去重又取决于哪些候选项被访问过，这里从"全部可访问"
+        出发迭代收缩可访问集合直到不动点，每轮都是整列运算，结果与逐项模拟一致。
+        
+        Returns:
+            selected: 选中候选项在合并批次中的下标（按输出顺序）
+            source_index: 合并批次中每个候选项的来源序号
+        """
+        source_index = np.repeat(np.arange(len(lengths)), lengths)
+        queue_position = np.concatenate([np.arange(length) for length in lengths])
+        
+        # 访问顺序
+        visit = np.lexsort((source_index, queue_position))
+        visit_ids = ids[visit]
+        visit_source = source_index[visit]
+        caps = np.maximum(np.asarray(targets), 1)
+        
+        eligible = np.ones(len(visit), dtype=bool)
+        while True:
+            # 可访问候选项中按访问顺序的首次出现
+            if self.deduplicate:
+                candidates = np.flatnonzero(eligible)
+                _, first = np.unique(visit_ids[candidates], return_index=True)
+                accepted = np.zeros(len(visit), dtype=bool)
+                accepted[candidates[first]] = True
+            else:
+                accepted = eligible
             
-            for source, count in source_counts.items():
-                trace.add_node_detail(self.node_id, f"final_{source}_count", count)
+            # 来源选满后，其后续候选项不再被访问
+            next_eligible = eligible.copy()
+            for i, cap in enumerate(caps):
+                source_accepted = np.flatnonzero(accepted & (visit_source == i))
+                if len(source_accepted) >= cap:
+                    next_eligible[(visit_source == i) & (np.arange(len(visit)) > source_accepted[cap - 1])] = False
+            
+            if np.array_equal(next_eligible, eligible):
+                break
+            eligible = next_eligible
         
-        return result[:self.output_size]  # 确保不超过目标数量
\ No newline at end of file
+        selected = visit[np.flatnonzero(accepted & eligible)][:self.output_size]
+        return selected, source_index
@@ -1,29 +1,38 @@
 from typing import Dict, List, Any, Optional, Set
+import numpy as np
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import FilterNode
+from src.services.rec.batch import CandidateBatch
 from src.db.models import UserEntityRelation
+from src.services.rec.negative import negative_feedback
 
 class BasicFilterNode(FilterNode):
-    """基础过滤节点，包含去重、低质量内容过滤、用户拉黑内容过滤等"""
+    """基础过滤节点，包含去重、低质量内容过滤、用户拉黑内容过滤等
+    
+    拉黑列表优先读取负反馈缓存（见negative，请求开始时已在后台预取），
+    缓存不可用时查询关系表。
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
         self.filter_rules = config.get('filter_rules', ['duplicate', 'block', 'low_quality'])
         self.quality_threshold = config.get('quality_threshold', 0.3)
+        # 是否同时过滤拉黑作者的内容（只在使用负反馈缓存时生效）
+        self.block_authors = config.get('block_authors', False)
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
         fields.extend(['filter_rules'])
         return fields
     
-    async def filter(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                   context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def filter(self, candidates: CandidateBatch, user_id: Optional[int], 
+                   context: Dict[str, Any]) -> CandidateBatch:
         """执行过滤逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -46,7 +55,8 @@ class BasicFilterNode(FilterNode):
             db = context.get('db')
             if db:
                 original_count = len(filtered_candidates)
-                filtered_candidates = await self._block_filter(filtered_candidates, user_id, db)
+                filtered_candidates = await self._block_filter(filtered_candidates, user_id, db,
+                                                               context.get('session_factory'))
                 filtered_counts['block'] = original_count - len(filtered_candidates)
         
         # 低质量内容过滤
@@ -68,22 +78,21 @@ class BasicFilterNode(FilterNode):
         
         return filtered_candidates
     
-    def _dedup_filter(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _dedup_filter(self, candidates: CandidateBatch) -> CandidateBatch:
         """去重过滤"""
-        seen_ids = set()
-        result = []
-        
-        for candidate in candidates:
-            item_id = candidate.get('id')
-            if item_id is not None and item_id not in seen_ids:
-                seen_ids.add(item_id)
-                result.append(candidate)
-        
-        return result
+        return candidates.dedup()
     
-    async def _block_filter(self, candidates: List[Dict[str, Any]], user_id: int, 
-                          db: AsyncSession) -> List[Dict[str, Any]]:
+    async def _block_filter(self, candidates: CandidateBatch, user_id: int, 
+                          db: AsyncSession, session_factory: Any = None) -> CandidateBatch:
         """用户拉黑内容过滤"""
+        if negative_feedback.ready and session_factory is not None:
+            # 预取已完成时同步命中，否则等待预取（或加载）完成
+            blocks = negative_feedback.get(user_id) or await negative_feedback.get_or_load(session_factory, user_id)
+            keep = ~np.isin(candidates.ids, blocks.items)
+            if self.block_authors and len(blocks.authors) and candidates.has_column('author_id'):
+                keep &= ~np.isin(candidates.column('author_id'), blocks.authors)
+            return candidates.mask(keep)
+        
         # 查询用户拉黑的内容
         query = select(UserEntityRelation.entity_id).where(
             UserEntityRelation.user_id == user_id,
@@ -93,20 +102,20 @@ class BasicFilterNode(FilterNode):
         )
         
         result = await db.execute(query)
-        blocked_ids = {row[0] for row in result.fetchall()}
+        blocked_ids = np.fromiter((row[0] for row in result.fetchall()), dtype=np.int64)
         
         # 过滤掉拉黑的内容
-        return [candidate for candidate in candidates 
-                if candidate.get('id') not in blocked_ids]
+        return candidates.mask(~np.isin(candidates.ids, blocked_ids))
     
-    def _quality_filter(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _quality_filter(self, candidates: CandidateBatch) -> CandidateBatch:
         """低质量内容过滤"""
         # 这里简化处理，实际应该有更复杂的质量评估逻辑
-        return [candidate for candidate in candidates 
-                if candidate.get('match_score', 0.0) >= self.quality_threshold]
+        return candidates.mask(candidates.scores('match_score') >= self.quality_threshold)
     
-    def _sensitive_filter(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _sensitive_filter(self, candidates: CandidateBatch) -> CandidateBatch:
         """敏感内容过滤"""
         # 这里简化处理，实际应该有更复杂的敏感内容检测逻辑
-        return [candidate for candidate in candidates 
-                if not candidate.get('is_sensitive', False)]
\ No newline at end of file
+        sensitive = candidates.column('is_sensitive')
+        if sensitive is None:
+            return candidates
+        return candidates.mask(~sensitive.astype(bool))
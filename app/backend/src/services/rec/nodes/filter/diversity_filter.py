@@ -3,6 +3,7 @@ from collections import defaultdict
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import FilterNode
+from src.services.rec.batch import CandidateBatch, tag_vocab, topk
 
 class DiversityFilterNode(FilterNode):
     """多样性过滤节点，限制特定字段的最大出现次数"""
@@ -17,11 +18,11 @@ class DiversityFilterNode(FilterNode):
         fields.extend(['diversity_fields'])
         return fields
     
-    async def filter(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                   context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def filter(self, candidates: CandidateBatch, user_id: Optional[int], 
+                   context: Dict[str, Any]) -> CandidateBatch:
         """执行过滤逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -31,18 +32,15 @@ class DiversityFilterNode(FilterNode):
             trace.add_node_detail(self.node_id, "input_size", len(candidates))
         
         # 按分数排序，确保保留分数高的项
-        sorted_candidates = sorted(candidates, 
-                                  key=lambda x: x.get('rank_score', 
-                                                   x.get('pre_rank_score', 
-                                                        x.get('match_score', 0.0))), 
-                                  reverse=True)
+        order = topk(candidates.coalesce(['rank_score', 'pre_rank_score', 'match_score']), len(candidates))
+        field_values = {field: candidates.values(field) for field in self.diversity_fields}
         
         # 字段值计数
         field_counts = {field: defaultdict(int) for field in self.diversity_fields}
         
         # 过滤结果
         result = []
-        for candidate in sorted_candidates:
+        for index in order.tolist():
             # 检查是否超过多样性限制
             should_keep = True
             
@@ -51,13 +49,13 @@ class DiversityFilterNode(FilterNode):
                 
                 if field == 'tags':
                     # 标签是列表，需要特殊处理
-                    for tag in candidate.get('tags', []):
+                    for tag in field_values[field][index]:
                         if field_counts[field][tag] >= max_count:
                             should_keep = False
                             break
                 else:
                     # 其他字段是单值
-                    value = candidate.get(field)
+                    value = field_values[field][index]
                     if value is not None and field_counts[field][value] >= max_count:
                         should_keep = False
                         break
@@ -66,19 +64,23 @@ class DiversityFilterNode(FilterNode):
                 # 更新计数并添加到结果
                 for field in self.diversity_fields:
                     if field == 'tags':
-                        for tag in candidate.get('tags', []):
+                        for tag in field_values[field][index]:
                             field_counts[field][tag] += 1
                     else:
-                        value = candidate.get(field)
+                        value = field_values[field][index]
                         if value is not None:
                             field_counts[field][value] += 1
                 
-                result.append(candidate)
+                result.append(index)
         
         # 记录trace信息
         if trace:
             trace.add_node_detail(self.node_id, "filtered_count", len(candidates) - len(result))
-            trace.add_node_detail(self.node_id, "field_counts", {k: dict(v) for k, v in field_counts.items()})
+            trace.add_node_detail(self.node_id, "field_counts", {
+                field: ({tag_vocab.lookup(tag): count for tag, count in counts.items()}
+                        if field == 'tags' else dict(counts))
+                for field, counts in field_counts.items()
+            })
             trace.add_node_detail(self.node_id, "output_size", len(result))
         
-        return result
\ No newline at end of file
+        return candidates.take(result)
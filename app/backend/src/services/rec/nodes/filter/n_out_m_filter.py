@@ -3,6 +3,7 @@ from collections import defaultdict
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import FilterNode
+from src.services.rec.batch import CandidateBatch
 
 class NOutMFilterNode(FilterNode):
     """N出M过滤节点，实现N出M策略"""
@@ -19,11 +20,11 @@ class NOutMFilterNode(FilterNode):
         fields.extend(['n', 'm', 'key'])
         return fields
     
-    async def filter(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                   context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def filter(self, candidates: CandidateBatch, user_id: Optional[int], 
+                   context: Dict[str, Any]) -> CandidateBatch:
         """执行过滤逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -40,24 +41,18 @@ class NOutMFilterNode(FilterNode):
                 trace.add_node_detail(self.node_id, "error", "invalid_config")
             return candidates
         
-        # 如果需要保持原始顺序，先记录位置
-        if self.preserve_order:
-            for i, candidate in enumerate(candidates):
-                candidate['_original_position'] = i
-        
-        # 应用N出M策略
+        # 应用N出M策略，记录保留的下标
+        values = candidates.values(self.key)
         result = []
         window_counts = defaultdict(int)
         window_size = 0
         
-        for item in candidates:
-            value = item.get(self.key)
-            
+        for index, value in enumerate(values):
             if window_size < self.m:
                 # 当前窗口未满
                 if value is not None and window_counts[value] < self.n:
                     # 可以添加到结果集
-                    result.append(item)
+                    result.append(index)
                     window_counts[value] += 1
                     window_size += 1
                 # 如果不满足条件，跳过此项
@@ -68,17 +63,16 @@ class NOutMFilterNode(FilterNode):
                 
                 # 添加当前项
                 if value is not None:
-                    result.append(item)
+                    result.append(index)
                     window_counts[value] += 1
                     window_size += 1
         
-        # 如果需要保持原始顺序，按原始位置排序
-        if self.preserve_order:
-            result.sort(key=lambda x: x.pop('_original_position'))
+        # 按下标选取，保持原始顺序
+        filtered_candidates = candidates.take(result)
         
         # 记录trace信息
         if trace:
-            trace.add_node_detail(self.node_id, "filtered_count", len(candidates) - len(result))
-            trace.add_node_detail(self.node_id, "output_size", len(result))
+            trace.add_node_detail(self.node_id, "filtered_count", len(candidates) - len(filtered_candidates))
+            trace.add_node_detail(self.node_id, "output_size", len(filtered_candidates))
         
-        return result
\ No newline at end of file
+        return filtered_candidates
@@ -1,14 +1,21 @@
 from typing import Dict, List, Any, Optional, Set
+import numpy as np
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import FilterNode
+from src.services.rec.batch import CandidateBatch
 from src.db.models import Event
+from src.services.rec.seen import seen_history
 
 class UserHistoryFilterNode(FilterNode):
-    """用户历史过滤节点，过滤用户已经看过的内容"""
+    """用户历史过滤节点，过滤用户已经看过的内容
+    
+    已看记录（见seen）可用且按相同的事件类型记录、保留时间覆盖time_window时，
+    在内存中判断；否则查询事件表。
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
@@ -35,10 +42,10 @@ class UserHistoryFilterNode(FilterNode):
             # 默认为1天
             return timedelta(days=1)
     
-    async def filter(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                   context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def filter(self, candidates: CandidateBatch, user_id: Optional[int], 
+                   context: Dict[str, Any]) -> CandidateBatch:
         """执行过滤逻辑"""
-        if not candidates or not user_id:
+        if not len(candidates) or not user_id:
             return candidates
         
         # 获取trace信息
@@ -58,28 +65,37 @@ class UserHistoryFilterNode(FilterNode):
         
         # 计算时间窗口
         time_delta = self._parse_time_window(self.time_window)
-        start_time = datetime.now() - time_delta
         
-        # 查询用户历史交互的内容
+        if seen_history.ready and seen_history.supports(self.event_types, time_delta.total_seconds()):
+            seen = await seen_history.seen_mask(db, user_id, candidates.ids, time_delta.total_seconds())
+            filtered_candidates = candidates.mask(~seen)
+            if trace:
+                trace.add_node_detail(self.node_id, "source", "seen_history")
+        else:
+            history_ids = await self._history_from_db(db, user_id, datetime.now() - time_delta)
+            # 过滤掉用户已经看过的内容
+            filtered_candidates = candidates.mask(~np.isin(candidates.ids, history_ids))
+            if trace:
+                trace.add_node_detail(self.node_id, "source", "db")
+                trace.add_node_detail(self.node_id, "history_count", len(history_ids))
+        
+        # 记录trace信息
+        if trace:
+            trace.add_node_detail(self.node_id, "filtered_count", len(candidates) - len(filtered_candidates))
+            trace.add_node_detail(self.node_id, "output_size", len(filtered_candidates))
+        
+        return filtered_candidates
+    
+    async def _history_from_db(self, db: AsyncSession, user_id: int, start_time: datetime) -> np.ndarray:
+        """查询用户窗口内交互过的内容，只用于已看记录不可用时的降级"""
         query = select(Event.item_id).where(
             and_(
                 Event.user_id == user_id,
                 Event.event_type.in_(self.event_types),
+                Event.item_id.isnot(None),
                 Event.ts >= start_time
             )
         )
         
         result = await db.execute(query)
-        history_ids = {row[0] for row in result.fetchall()}
-        
-        # 过滤掉用户已经看过的内容
-        filtered_candidates = [candidate for candidate in candidates 
-                              if candidate.get('id') not in history_ids]
-        
-        # 记录trace信息
-        if trace:
-            trace.add_node_detail(self.node_id, "history_count", len(history_ids))
-            trace.add_node_detail(self.node_id, "filtered_count", len(candidates) - len(filtered_candidates))
-            trace.add_node_detail(self.node_id, "output_size", len(filtered_candidates))
-        
-        return filtered_candidates
\ No newline at end of file
+        return np.unique(np.fromiter((row[0] for row in result.fetchall()), dtype=np.int64))
@@ -1,9 +1,13 @@
 from typing import Dict, List, Any, Optional
 from datetime import datetime
+import time
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RankNode
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.embedding_store import item_embedding_store, user_embedding_store
 
 class FeatureExtractNode(RankNode):
     """特征抽取节点，为精排准备特征"""
@@ -13,11 +17,11 @@ class FeatureExtractNode(RankNode):
         self.feature_groups = config.get('feature_groups', ['user', 'item', 'context', 'cross'])
         self.cache_ttl = config.get('cache_ttl', 300)  # 缓存有效期（秒）
     
-    async def rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                 context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """抽取特征"""
-        if not candidates:
-            return []
+    async def rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                 context: Dict[str, Any]) -> CandidateBatch:
+        """抽取特征，按列写入候选集"""
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -32,34 +36,36 @@ class FeatureExtractNode(RankNode):
         # 抽取用户特征
         user_features = await self._extract_user_features(user_id, db) if user_id else {}
         
-        # 为每个候选项抽取特征
-        for candidate in candidates:
-            # 抽取物品特征
-            item_features = self._extract_item_features(candidate)
-            
-            # 抽取上下文特征
-            context_features = self._extract_context_features(context)
-            
-            # 构建交叉特征
-            cross_features = self._extract_cross_features(user_features, item_features, context)
-            
-            # 合并所有特征
-            features = {}
-            if 'user' in self.feature_groups:
-                features.update({f"user_{k}": v for k, v in user_features.items()})
-            if 'item' in self.feature_groups:
-                features.update({f"item_{k}": v for k, v in item_features.items()})
-            if 'context' in self.feature_groups:
-                features.update({f"ctx_{k}": v for k, v in context_features.items()})
-            if 'cross' in self.feature_groups:
-                features.update({f"cross_{k}": v for k, v in cross_features.items()})
-            
-            # 将特征添加到候选项
-            candidate['features'] = features
+        # 抽取物品特征（整列计算）
+        item_features = self._extract_item_features(candidates)
+        
+        # 抽取上下文特征
+        context_features = self._extract_context_features(context)
+        
+        # 构建交叉特征
+        cross_features = self._extract_cross_features(user_features, item_features, context)
+        if user_id and 'cross' in self.feature_groups:
+            emb_sim = self._embedding_similarity(user_id, candidates)
+            if emb_sim is not None:
+                cross_features['user_item_emb_sim'] = emb_sim
+        
+        # 合并所有特征
+        features = {}
+        if 'user' in self.feature_groups:
+            features.update({f"user_{k}": v for k, v in user_features.items()})
+        if 'item' in self.feature_groups:
+            features.update({f"item_{k}": v for k, v in item_features.items()})
+        if 'context' in self.feature_groups:
+            features.update({f"ctx_{k}": v for k, v in context_features.items()})
+        if 'cross' in self.feature_groups:
+            features.update({f"cross_{k}": v for k, v in cross_features.items()})
+        
+        # 将特征添加到候选集
+        candidates = candidates.with_features(features)
         
         # 记录trace信息
         if trace:
-            trace.add_node_detail(self.node_id, "feature_count", len(candidates[0]['features']) if candidates else 0)
+            trace.add_node_detail(self.node_id, "feature_count", len(features))
             trace.add_node_detail(self.node_id, "output_size", len(candidates))
         
         return candidates
@@ -74,28 +80,35 @@ class FeatureExtractNode(RankNode):
             'preference_diversity': 0.6,  # 偏好多样性
         }
     
-    def _extract_item_features(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """抽取物品特征"""
+    def _extract_item_features(self, candidates: CandidateBatch) -> Dict[str, Any]:
+        """抽取物品特征，每个特征是与候选集等长的列"""
         features = {
-            'id': item.get('id'),
-            'kind': item.get('kind', 'content'),
-            'tag_count': len(item.get('tags', [])),
+            'id': candidates.ids,
+            'kind': candidates.column('kind') if candidates.has_column('kind') else 'content',
+            'tag_count': candidates.tag_counts(),
         }
         
-        # 添加时间相关特征
-        if 'created_at' in item and item['created_at']:
-            try:
-                created_at = datetime.fromisoformat(item['created_at'])
-                now = datetime.now()
-                # 计算时间差（天）
-                days_diff = (now - created_at).total_seconds() / (24 * 3600)
-                features['days_since_creation'] = days_diff
-                features['is_recent'] = 1 if days_diff < 7 else 0  # 是否为最近7天内的内容
-            except (ValueError, TypeError):
-                pass
+        # 添加时间相关特征（天），缺少创建时间的候选项为nan
+        days_diff = (time.time() - candidates.created_ts) / (24 * 3600)
+        if not np.isnan(days_diff).all():
+            features['days_since_creation'] = days_diff
+            features['is_recent'] = (days_diff < 7).astype(np.int64)  # 是否为最近7天内的内容
         
         return features
     
+    def _embedding_similarity(self, user_id: int, candidates: CandidateBatch) -> Optional[np.ndarray]:
+        """用户向量与内容向量的余弦相似度（从向量存储读取），缺少内容向量的候选项为nan"""
+        if not item_embedding_store.loaded or not user_embedding_store.loaded:
+            return None
+        user_vector = user_embedding_store.get_one(user_id)
+        if user_vector is None or len(user_vector) != item_embedding_store.dim:
+            return None
+        item_vectors, found = item_embedding_store.get(candidates.ids)
+        norms = np.linalg.norm(item_vectors, axis=1) * np.linalg.norm(user_vector)
+        sim = np.full(len(candidates), np.nan)
+        sim[found] = (item_vectors[found] @ user_vector) / np.maximum(norms[found], 1e-12)
+        return sim
+    
     def _extract_context_features(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """抽取上下文特征"""
         # 从上下文中提取相关信息
@@ -112,7 +125,7 @@ class FeatureExtractNode(RankNode):
                                item_features: Dict[str, Any], 
                                context: Dict[str, Any]) -> Dict[str, Any]:
         """构建交叉特征"""
-        # 简化的交叉特征示例
+        # 简化的交叉特征示例，物品特征为列，交叉特征按列计算
         cross_features = {}
         
         # 用户-物品交叉特征
@@ -1,9 +1,10 @@
 from typing import Dict, List, Any, Optional
 import numpy as np
-from datetime import datetime
+import time
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RankNode
+from src.services.rec.batch import CandidateBatch
 
 class PreRankNode(RankNode):
     """粗排节点，使用简单规则或轻量级模型进行初步排序"""
@@ -21,11 +22,11 @@ class PreRankNode(RankNode):
         fields.extend(['model_type'])
         return fields
     
-    async def rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                 context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                 context: Dict[str, Any]) -> CandidateBatch:
         """执行粗排逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -45,47 +46,28 @@ class PreRankNode(RankNode):
             # 默认使用规则排序
             return await self._rule_based_rank(candidates, user_id, context)
     
-    async def _rule_based_rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                             context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def _rule_based_rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                             context: Dict[str, Any]) -> CandidateBatch:
         """基于规则的排序"""
-        now = datetime.now()
+        # 初始分数：使用召回分数
+        base_score = candidates.scores('match_score')
         
-        # 计算每个候选项的分数
-        for candidate in candidates:
-            # 初始分数：使用召回分数
-            base_score = candidate.get('match_score', 0.0)
-            
-            # 计算时间新鲜度分数
-            recency_score = 0.0
-            if 'created_at' in candidate and candidate['created_at']:
-                try:
-                    created_at = datetime.fromisoformat(candidate['created_at'])
-                    # 计算时间差（天）
-                    days_diff = (now - created_at).total_seconds() / (24 * 3600)
-                    # 使用指数衰减函数
-                    recency_score = np.exp(-0.1 * days_diff)  # 10天半衰期
-                except (ValueError, TypeError):
-                    pass
-            
-            # 热度分数（如果有）
-            popularity_score = candidate.get('popularity', 0.0)
-            
-            # 计算最终分数
-            final_score = (
-                base_score * 0.5 +
-                recency_score * self.rule_weights.get('recency', 0.7) +
-                popularity_score * self.rule_weights.get('popularity', 0.3)
-            )
-            
-            # 更新候选项分数
-            candidate['pre_rank_score'] = final_score
+        # 计算时间新鲜度分数，使用指数衰减函数（10天半衰期）
+        days_diff = (time.time() - candidates.created_ts) / (24 * 3600)
+        recency_score = np.where(np.isnan(days_diff), 0.0, np.exp(-0.1 * days_diff))
         
-        # 按分数排序
-        ranked_candidates = sorted(candidates, key=lambda x: x.get('pre_rank_score', 0.0), reverse=True)
+        # 热度分数（如果有）
+        popularity_score = candidates.scores('popularity')
         
-        # 截断结果
-        if len(ranked_candidates) > self.rank_size:
-            ranked_candidates = ranked_candidates[:self.rank_size]
+        # 计算最终分数
+        final_score = (
+            base_score * 0.5 +
+            recency_score * self.rule_weights.get('recency', 0.7) +
+            popularity_score * self.rule_weights.get('popularity', 0.3)
+        )
+        
+        # 按分数排序并截断结果
+        ranked_candidates = candidates.with_columns(pre_rank_score=final_score).sort_by(final_score, self.rank_size)
         
         # 记录trace信息
         if context.get('trace'):
@@ -94,33 +76,22 @@ class PreRankNode(RankNode):
         
         return ranked_candidates
     
-    async def _model_based_rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                              context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def _model_based_rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                              context: Dict[str, Any]) -> CandidateBatch:
         """基于模型的排序（简化版）"""
         # 这里是简化实现，实际应该加载预训练模型并进行预测
         # 由于模型加载和预测逻辑较复杂，这里仅做示例
         
-        # 模拟模型预测
-        for candidate in candidates:
-            # 使用召回分数作为基础
-            base_score = candidate.get('match_score', 0.0)
-            
-            # 模拟模型预测分数（实际应该使用特征向量输入模型）
-            model_score = base_score * (0.5 + np.random.random() * 0.5)
-            
-            # 更新候选项分数
-            candidate['pre_rank_score'] = model_score
-        
-        # 按分数排序
-        ranked_candidates = sorted(candidates, key=lambda x: x.get('pre_rank_score', 0.0), reverse=True)
+        # 模拟模型预测：使用召回分数作为基础（实际应该使用特征向量输入模型）
+        base_score = candidates.scores('match_score')
+        model_score = base_score * (0.5 + np.random.random(len(candidates)) * 0.5)
         
-        # 截断结果
-        if len(ranked_candidates) > self.rank_size:
-            ranked_candidates = ranked_candidates[:self.rank_size]
+        # 按分数排序并截断结果
+        ranked_candidates = candidates.with_columns(pre_rank_score=model_score).sort_by(model_score, self.rank_size)
         
         # 记录trace信息
         if context.get('trace'):
             context['trace'].add_node_detail(self.node_id, "model_type", self.model_type)
             context['trace'].add_node_detail(self.node_id, "output_size", len(ranked_candidates))
         
-        return ranked_candidates
\ No newline at end of file
+        return ranked_candidates
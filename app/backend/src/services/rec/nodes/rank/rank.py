@@ -5,6 +5,7 @@ import numpy as np
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RankNode as BaseRankNode
+from src.services.rec.batch import CandidateBatch
 
 class RankNode(BaseRankNode):
     """精排节点，使用机器学习模型进行精确排序"""
@@ -38,11 +39,11 @@ class RankNode(BaseRankNode):
         except Exception as e:
             logger.error(f"加载模型失败: {str(e)}")
     
-    async def rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                 context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                 context: Dict[str, Any]) -> CandidateBatch:
         """执行精排逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -51,8 +52,8 @@ class RankNode(BaseRankNode):
             trace.add_node_detail(self.node_id, "model_path", self.model_path)
         
         # 检查候选项是否包含特征
-        has_features = all('features' in candidate for candidate in candidates)
-        if not has_features:
+        feature_names = candidates.feature_names()
+        if not feature_names:
             logger.warning("候选项缺少特征，无法进行模型排序，将使用规则排序")
             if trace:
                 trace.add_node_detail(self.node_id, "fallback_reason", "missing_features")
@@ -60,13 +61,9 @@ class RankNode(BaseRankNode):
         
         # 使用模型进行排序
         if self.model:
-            # 实际实现应该使用模型进行预测
+            # 实际实现应该使用模型对特征列进行批量预测
             # 这里简化处理，仅做示例
-            for candidate in candidates:
-                features = candidate.get('features', {})
-                # 模拟模型预测
-                score = np.random.random()  # 实际应该是模型预测结果
-                candidate[self.score_field] = score
+            scores = np.random.random(len(candidates))  # 实际应该是模型预测结果
             
             if trace:
                 trace.add_node_detail(self.node_id, "ranking_method", "model")
@@ -76,12 +73,8 @@ class RankNode(BaseRankNode):
                 trace.add_node_detail(self.node_id, "fallback_reason", "model_not_available")
             return await self._rule_based_rank(candidates)
         
-        # 按分数排序
-        ranked_candidates = sorted(candidates, key=lambda x: x.get(self.score_field, 0.0), reverse=True)
-        
-        # 截断结果
-        if len(ranked_candidates) > self.rank_size:
-            ranked_candidates = ranked_candidates[:self.rank_size]
+        # 按分数排序并截断结果
+        ranked_candidates = candidates.with_columns(**{self.score_field: scores}).sort_by(scores, self.rank_size)
         
         # 记录trace信息
         if trace:
@@ -89,18 +82,10 @@ class RankNode(BaseRankNode):
         
         return ranked_candidates
     
-    async def _rule_based_rank(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def _rule_based_rank(self, candidates: CandidateBatch) -> CandidateBatch:
         """基于规则的排序（备选方案）"""
         # 使用预排序分数或召回分数
-        for candidate in candidates:
-            score = candidate.get('pre_rank_score', candidate.get('match_score', 0.0))
-            candidate[self.score_field] = score
-        
-        # 按分数排序
-        ranked_candidates = sorted(candidates, key=lambda x: x.get(self.score_field, 0.0), reverse=True)
-        
-        # 截断结果
-        if len(ranked_candidates) > self.rank_size:
-            ranked_candidates = ranked_candidates[:self.rank_size]
+        scores = candidates.coalesce(['pre_rank_score', 'match_score'])
         
-        return ranked_candidates
\ No newline at end of file
+        # 按分数排序并截断结果
+        return candidates.with_columns(**{self.score_field: scores}).sort_by(scores, self.rank_size)
@@ -1,11 +1,25 @@
 from typing import Dict, List, Any, Optional, Set
-from collections import defaultdict
+from collections import Counter, defaultdict
+import heapq
+import numpy as np
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RankNode
+from src.services.rec.batch import CandidateBatch, topk
+from src.services.rec.diversity import similarity_matrix, normalize_relevance, mmr_order, dpp_order
+from src.services.rec.embedding_store import item_embedding_store
 
 class ReRankNode(RankNode):
-    """重排节点，考虑多样性和策略约束进行重新排序"""
+    """重排节点，考虑多样性和策略约束进行重新排序
+    
+    model_type:
+    - diversity：按作者、标签等取值的重复次数惩罚（见_diversity_rerank）
+    - mmr / dpp：按内容向量的相似度做最大边际相关或贪心DPP（见diversity），
+      向量存储不可用时退回diversity
+    """
+    
+    # 基于内容向量的重排方式
+    EMBEDDING_MODELS = ('mmr', 'dpp')
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
@@ -14,17 +28,21 @@ class ReRankNode(RankNode):
         self.max_items_per_key = config.get('max_items_per_key', {'author_id': 2, 'tags': 3})
         self.n_out_m = config.get('n_out_m', {'enabled': False, 'n': 1, 'm': 5, 'key': 'author_id'})
         self.model_type = config.get('model_type', 'diversity')
+        # MMR中相关性的权重，其余为与已选项最大相似度的惩罚
+        self.mmr_lambda = config.get('mmr_lambda', 0.7)
+        # DPP中相关性与多样性的权衡，越大越偏向相关性
+        self.dpp_theta = config.get('dpp_theta', 0.7)
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
         fields.extend(['diversity_weight', 'diversity_fields', 'model_type'])
         return fields
     
-    async def rank(self, candidates: List[Dict[str, Any]], user_id: Optional[int], 
-                 context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def rank(self, candidates: CandidateBatch, user_id: Optional[int], 
+                 context: Dict[str, Any]) -> CandidateBatch:
         """执行重排逻辑"""
-        if not candidates:
-            return []
+        if not len(candidates):
+            return candidates
         
         # 获取trace信息
         trace = context.get('trace')
@@ -33,37 +51,40 @@ class ReRankNode(RankNode):
             trace.add_node_detail(self.node_id, "diversity_fields", self.diversity_fields)
             trace.add_node_detail(self.node_id, "model_type", self.model_type)
         
-        # 获取原始排序分数
-        for i, candidate in enumerate(candidates):
-            # 使用排序分数或预排序分数
-            original_score = candidate.get('rank_score', 
-                                         candidate.get('pre_rank_score', 
-                                                     candidate.get('match_score', 0.0)))
-            # 保存原始分数和位置
-            candidate['original_score'] = original_score
-            candidate['original_position'] = i
+        # 使用排序分数或预排序分数，保存原始分数和位置
+        original_score = candidates.coalesce(['rank_score', 'pre_rank_score', 'match_score'])
+        candidates = candidates.with_columns(
+            original_score=original_score,
+            original_position=np.arange(len(candidates)),
+        )
         
         # 应用多样性重排
-        if self.diversity_weight > 0:
-            reranked_candidates = self._diversity_rerank(candidates)
+        order = self._embedding_rerank(candidates, trace) if self.model_type in self.EMBEDDING_MODELS else None
+        if order is not None:
+            if trace:
+                trace.add_node_detail(self.node_id, "rerank_method", self.model_type)
+        elif self.diversity_weight > 0:
+            order = self._diversity_rerank(candidates)
             if trace:
                 trace.add_node_detail(self.node_id, "rerank_method", "diversity")
         else:
-            reranked_candidates = candidates
+            order = list(range(len(candidates)))
             if trace:
                 trace.add_node_detail(self.node_id, "rerank_method", "none")
         
         # 应用N出M策略（如果启用）
         if self.n_out_m.get('enabled', False):
-            reranked_candidates = self._apply_n_out_m(reranked_candidates)
+            order = self._apply_n_out_m(candidates, order)
             if trace:
                 trace.add_node_detail(self.node_id, "n_out_m_applied", True)
                 trace.add_node_detail(self.node_id, "n_out_m_config", self.n_out_m)
         
         # 更新最终排序分数
-        for i, candidate in enumerate(reranked_candidates):
-            candidate['rerank_score'] = candidate.get('original_score', 0.0)
-            candidate['final_position'] = i
+        reranked_candidates = candidates.take(order)
+        reranked_candidates = reranked_candidates.with_columns(
+            rerank_score=reranked_candidates.column('original_score'),
+            final_position=np.arange(len(reranked_candidates)),
+        )
         
         # 记录trace信息
         if trace:
@@ -71,117 +92,143 @@ class ReRankNode(RankNode):
         
         return reranked_candidates
     
-    def _diversity_rerank(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """多样性重排算法"""
-        # 贪心多样性算法
-        # 1. 选择得分最高的项作为第一个结果
-        # 2. 迭代选择后续项时，考虑原始分数和与已选项的多样性
+    def _embedding_rerank(self, candidates: CandidateBatch, trace: Any = None) -> Optional[List[int]]:
+        """基于内容向量的MMR或DPP重排，返回选中候选项的下标，向量不可用时返回None
         
-        if not candidates:
-            return []
+        候选项先按原始分数排序，分数线性缩放到[0, 1]作为相关性，与余弦相似度可比；
+        缺少向量的候选项视为与其他候选项都不相似。
+        """
+        if not item_embedding_store.loaded:
+            return None
+        sorted_indices = topk(candidates.column('original_score'), len(candidates))
+        vectors, found = item_embedding_store.get(candidates.ids[sorted_indices])
+        if not found.any():
+            return None
         
-        # 按原始分数排序
-        sorted_candidates = sorted(candidates, key=lambda x: x.get('original_score', 0.0), reverse=True)
+        sim = similarity_matrix(vectors, found)
+        relevance = normalize_relevance(candidates.column('original_score')[sorted_indices])
+        if self.model_type == 'mmr':
+            order = mmr_order(sim, relevance, self.rank_size, self.mmr_lambda)
+        else:
+            order, selected = dpp_order(sim, relevance, self.rank_size, self.dpp_theta)
+            if trace:
+                trace.add_node_detail(self.node_id, "dpp_selected", selected)
+        if trace:
+            trace.add_node_detail(self.node_id, "embedding_coverage", round(float(found.mean()), 3))
+        return sorted_indices[order].tolist()
+    
+    def _diversity_rerank(self, candidates: CandidateBatch) -> List[int]:
+        """多样性重排算法，返回选中候选项的下标
         
-        # 选择第一个项
-        result = [sorted_candidates[0]]
-        remaining = sorted_candidates[1:]
+        贪心选择：先选原始分数最高的项，之后每次选 原始分数 - 多样性惩罚 * 权重 最高的项，
+        分数相同时取原始排序中靠前的。某个取值（作者、标签等）被选中的次数达到
+        max_items_per_key后，包含它的候选项受到惩罚：单值字段加1，标签字段加达到上限的
+        标签占比。
         
-        # 已选项的特征值集合
-        selected_values = defaultdict(set)
-        for field in self.diversity_fields:
-            if field == 'tags':
-                # 标签是列表，需要特殊处理
-                for tag in result[0].get('tags', []):
-                    selected_values[field].add(tag)
-            else:
-                # 其他字段是单值
-                value = result[0].get(field)
-                if value is not None:
-                    selected_values[field].add(value)
+        惩罚只在某个取值达到上限时变化，因此按取值建立倒排表，只重新计算包含该取值的
+        候选项；候选项按综合分数放在堆中，分数变化时压入新项，过期的堆项在弹出时丢弃。
+        """
+        if not len(candidates):
+            return []
         
-        # 已选项的计数
-        selected_counts = defaultdict(lambda: defaultdict(int))
-        for field in self.diversity_fields:
+        # 按原始分数排序，排序位置用于分数相同时的先后
+        scores = candidates.column('original_score')
+        sorted_indices = topk(scores, len(candidates)).tolist()
+        score_values = scores.tolist()
+        field_values = {field: candidates.values(field) for field in self.diversity_fields}
+        fields = list(dict.fromkeys(self.diversity_fields))
+        n = len(score_values)
+        rank_of = [0] * n
+        for rank, item in enumerate(sorted_indices):
+            rank_of[item] = rank
+        
+        # 取值 -> [(候选项, 该取值在候选项中出现的次数)]
+        postings = {field: defaultdict(list) for field in fields}
+        for field in fields:
+            field_postings = postings[field]
             if field == 'tags':
-                for tag in result[0].get('tags', []):
-                    selected_counts[field][tag] += 1
+                for item, item_tags in enumerate(field_values[field]):
+                    for tag, times in Counter(item_tags).items():
+                        field_postings[tag].append((item, times))
             else:
-                value = result[0].get(field)
-                if value is not None:
-                    selected_counts[field][value] += 1
+                for item, value in enumerate(field_values[field]):
+                    if value is not None:
+                        field_postings[value].append((item, 1))
+        tags_count = [len(item_tags) for item_tags in field_values['tags']] if 'tags' in fields else None
         
-        # 迭代选择后续项
-        while remaining and len(result) < self.rank_size:
-            best_score = -float('inf')
-            best_item = None
-            best_index = -1
-            
-            for i, item in enumerate(remaining):
-                # 计算多样性惩罚
-                diversity_penalty = 0.0
-                
-                for field in self.diversity_fields:
-                    max_items = self.max_items_per_key.get(field, 2)
-                    
-                    if field == 'tags':
-                        # 标签是列表，计算与已选标签的重叠
-                        overlap = 0
-                        for tag in item.get('tags', []):
-                            if tag in selected_values[field]:
-                                count = selected_counts[field][tag]
-                                if count >= max_items:
-                                    overlap += 1
-                        
-                        # 标签重叠率
-                        tags_count = len(item.get('tags', []))
-                        if tags_count > 0:
-                            overlap_ratio = overlap / tags_count
-                            diversity_penalty += overlap_ratio
-                    else:
-                        # 其他字段是单值
-                        value = item.get(field)
-                        if value is not None and value in selected_values[field]:
-                            count = selected_counts[field][value]
-                            if count >= max_items:
-                                diversity_penalty += 1.0
-                
-                # 计算综合分数：原始分数 - 多样性惩罚 * 权重
-                score = item.get('original_score', 0.0) - diversity_penalty * self.diversity_weight
-                
-                if score > best_score:
-                    best_score = score
-                    best_item = item
-                    best_index = i
-            
-            if best_item is None:
-                break
-            
-            # 添加到结果集
-            result.append(best_item)
-            # 从候选集移除
-            remaining.pop(best_index)
-            
-            # 更新已选项的特征值集合和计数
+        # 每个候选项在各字段上命中的已达上限取值数（标签按出现次数计）
+        hits = {field: [0] * n for field in fields}
+        selected_counts = {field: defaultdict(int) for field in fields}
+        saturated = {field: set() for field in fields}
+        selected = [False] * n
+        version = [0] * n
+        
+        def penalty(item: int) -> float:
+            # 与逐项计算的累加顺序一致，保证分数完全相同
+            diversity_penalty = 0.0
             for field in self.diversity_fields:
                 if field == 'tags':
-                    for tag in best_item.get('tags', []):
-                        selected_values[field].add(tag)
+                    if tags_count[item] > 0:
+                        diversity_penalty += hits[field][item] / tags_count[item]
+                elif hits[field][item]:
+                    diversity_penalty += 1.0
+            return diversity_penalty
+        
+        def push(item: int, rank: int):
+            score = score_values[item] - penalty(item) * self.diversity_weight
+            # 与逐项比较一致：NaN和负无穷的分数不会被选中
+            if score > -float('inf'):
+                heapq.heappush(heap, (-score, rank, item, version[item]))
+        
+        def select(item: int):
+            selected[item] = True
+            result.append(item)
+            changed = set()
+            for field in self.diversity_fields:
+                if field == 'tags':
+                    for tag in field_values[field][item]:
                         selected_counts[field][tag] += 1
                 else:
-                    value = best_item.get(field)
+                    value = field_values[field][item]
                     if value is not None:
-                        selected_values[field].add(value)
                         selected_counts[field][value] += 1
+            for field in fields:
+                max_items = self.max_items_per_key.get(field, 2)
+                values = field_values[field][item] if field == 'tags' else [field_values[field][item]]
+                for value in values:
+                    if value is None or value in saturated[field] or selected_counts[field][value] < max_items:
+                        continue
+                    saturated[field].add(value)
+                    for other, times in postings[field][value]:
+                        if not selected[other]:
+                            hits[field][other] += times
+                            changed.add(other)
+            for other in changed:
+                version[other] += 1
+                push(other, rank_of[other])
+        
+        # 其余候选项初始没有惩罚，选择第一个项后更新受影响的候选项
+        heap = []
+        for rank, item in enumerate(sorted_indices[1:], start=1):
+            push(item, rank)
+        result = []
+        select(sorted_indices[0])
+        
+        # 迭代选择后续项
+        while heap and len(result) < self.rank_size:
+            _, _, item, item_version = heapq.heappop(heap)
+            if selected[item] or item_version != version[item]:
+                continue
+            select(item)
         
         return result
     
-    def _apply_n_out_m(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """应用N出M策略"""
+    def _apply_n_out_m(self, candidates: CandidateBatch, order: List[int]) -> List[int]:
+        """应用N出M策略，order为当前排序的下标"""
         # N出M策略：对于某个特征，每M个结果中最多包含N个相同值
         # 例如：1出5策略，每5个结果中最多包含1个相同作者的内容
         
-        if not candidates:
+        if not order:
             return []
         
         n = self.n_out_m.get('n', 1)
@@ -189,20 +236,21 @@ class ReRankNode(RankNode):
         key = self.n_out_m.get('key', 'author_id')
         
         if n >= m or n <= 0 or m <= 0:
-            return candidates  # 无效配置，直接返回原始结果
+            return order  # 无效配置，直接返回原始结果
         
+        values = candidates.values(key)
         result = []
         window_counts = defaultdict(int)
         window_size = 0
         
-        for item in candidates:
-            value = item.get(key)
+        for index in order:
+            value = values[index]
             
             if window_size < m:
                 # 当前窗口未满
                 if value is not None and window_counts[value] < n:
                     # 可以添加到结果集
-                    result.append(item)
+                    result.append(index)
                     window_counts[value] += 1
                     window_size += 1
             else:
@@ -212,8 +260,8 @@ class ReRankNode(RankNode):
                 
                 # 添加当前项
                 if value is not None:
-                    result.append(item)
+                    result.append(index)
                     window_counts[value] += 1
                     window_size += 1
         
-        return result
\ No newline at end of file
+        return result
@@ -24,29 +24,26 @@ class AdRecallNode(RecallNode):
         
         # 简化版广告召回，实际实现可能更复杂
         query = (
-            select(Item)
+            select(*self.light_columns())
             .where(Item.kind == 'ad')
-            .limit(self.recall_size)
+            .limit(await self.fetch_size(context, pushed_down=True))
         )
+        excluded_ids = await self.excluded_ids(context)
+        if excluded_ids:
+            query = query.where(Item.id.not_in(excluded_ids))
         
         try:
             result = await db.execute(query)
-            items = result.scalars().all()
+            items = result.all()
             
             # 构建候选项列表
             candidates = []
             for item in items:
-                candidates.append({
-                    'id': item.id,
-                    'title': item.title,
-                    'content': item.content,
-                    'tags': item.tags,
-                    'author_id': item.author_id,
-                    'created_at': item.created_at.isoformat() if item.created_at else None,
-                    'kind': item.kind,
-                    'match_score': 1.0,  # 简化处理，实际应基于定向和出价计算
-                    'recall_type': 'ad'
-                })
+                candidates.append(self.to_candidate(
+                    item,
+                    match_score=1.0,  # 简化处理，实际应基于定向和出价计算
+                    recall_type='ad',
+                ))
             
             # 记录trace信息
             if trace:
@@ -58,8 +55,5 @@ class AdRecallNode(RecallNode):
             error_msg = f"广告召回失败: {str(e)}"
             logger.error(error_msg)
             
-            if trace:
-                trace.add_error(self.node_id, error_msg)
-            
-            # 出错时返回空列表
-            return []
\ No newline at end of file
+            # 抛出异常，由DAG执行器统一降级并计入节点熔断器
+            raise
\ No newline at end of file
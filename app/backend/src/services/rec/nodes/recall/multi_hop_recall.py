@@ -1,18 +1,32 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
+import numpy as np
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RecallNode
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.related import item_related_index
+from src.services.rec.relation_graph import relation_graph
 
 class MultiHopRecallNode(RecallNode):
-    """基于多跳关系的召回节点"""
+    """基于多跳关系的召回节点
+    
+    按以下顺序选择数据源（都要求按相同的关系类型构建）：
+    - 内存关系图（见relation_graph）：在用户-内容图上有界随机游走，不访问数据库
+    - 相关内容表（见related）：从用户最近互动的内容出发在内存中逐跳展开
+    - 递归SQL：在关系表上展开
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
         self.max_hops = config.get('max_hops', 2)
         self.relation_types = config.get('relation_types', ['like', 'favorite'])
         self.hop_decay = config.get('hop_decay', 0.5)
+        # 作为起点的用户最近互动内容数量
+        self.max_seed_items = config.get('max_seed_items', 50)
+        # 每一跳继续展开的内容数量
+        self.frontier_size = config.get('frontier_size', 200)
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
@@ -20,7 +34,7 @@ class MultiHopRecallNode(RecallNode):
         return fields
     
     async def recall(self, db: AsyncSession, user_id: Optional[int], 
-                    context: Dict[str, Any]) -> List[Dict[str, Any]]:
+                    context: Dict[str, Any]) -> Union[CandidateBatch, List[Dict[str, Any]]]:
         """基于多跳关系网络进行召回"""
         if not user_id:
             # 未登录用户，返回空列表
@@ -33,6 +47,82 @@ class MultiHopRecallNode(RecallNode):
             trace.add_node_detail(self.node_id, "max_hops", self.max_hops)
             trace.add_node_detail(self.node_id, "relation_types", self.relation_types)
         
+        if relation_graph.ready and relation_graph.supports(self.relation_types):
+            candidates = await self._recall_from_graph(db, user_id, await self.fetch_size(context, pushed_down=True),
+                                                       await self.excluded_array(context))
+            if trace:
+                trace.add_node_detail(self.node_id, "source", "graph")
+                trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
+            logger.debug(f"多跳召回数量: {len(candidates)}")
+            return candidates
+        
+        if item_related_index.ready and item_related_index.supports(self.relation_types):
+            candidates = await self._recall_from_related(db, user_id, await self.fetch_size(context, pushed_down=True),
+                                                         await self.excluded_array(context))
+            if trace:
+                trace.add_node_detail(self.node_id, "source", "related")
+                trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
+            logger.debug(f"多跳召回数量: {len(candidates)}")
+            return candidates
+        
+        if trace:
+            trace.add_node_detail(self.node_id, "source", "db")
+        return await self._recall_from_db(db, user_id, trace, await self.fetch_size(context, pushed_down=True),
+                                          await self.excluded_ids(context))
+    
+    async def _seed_items(self, db: AsyncSession, user_id: int) -> List[int]:
+        """用户最近互动的内容（第1跳）"""
+        result = await db.execute(text("""
+            SELECT entity_id
+            FROM rel.user_entity_relations
+            WHERE user_id = :user_id
+              AND entity_type = 'item'
+              AND relation_type = ANY(:relation_types)
+              AND status = 'active'
+            ORDER BY last_interact_at DESC
+            LIMIT :limit
+        """), {
+            'user_id': user_id,
+            'relation_types': list(self.relation_types),
+            'limit': self.max_seed_items * len(self.relation_types),
+        })
+        # 同一内容可能有多种关系，保留最近的一次
+        return list(dict.fromkeys(row[0] for row in result.fetchall()))[:self.max_seed_items]
+    
+    async def _recall_from_graph(self, db: AsyncSession, user_id: int, limit: int,
+                                 excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """在内存关系图上游走"""
+        item_ids, weights = relation_graph.expand(user_id, self.max_hops, self.hop_decay,
+                                                  self.frontier_size, self.max_seed_items)
+        if not len(item_ids):
+            return CandidateBatch.empty()
+        return await self._load_content(db, item_ids, weights, limit, excluded)
+    
+    async def _recall_from_related(self, db: AsyncSession, user_id: int, limit: int,
+                                   excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """在相关内容表上逐跳展开"""
+        seeds = await self._seed_items(db, user_id)
+        if not seeds:
+            return CandidateBatch.empty()
+        item_ids, weights = item_related_index.expand(seeds, self.max_hops, self.hop_decay, self.frontier_size)
+        return await self._load_content(db, item_ids, weights, limit, excluded)
+    
+    async def _load_content(self, db: AsyncSession, item_ids: np.ndarray, weights: np.ndarray,
+                            limit: int, excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """加载展开结果中的内容，跳过排除的内容，按权重保留limit个"""
+        if excluded is not None and len(excluded):
+            keep = ~np.isin(item_ids, excluded)
+            item_ids, weights = item_ids[keep], weights[keep]
+        # 多取一些，过滤非内容类型后再截断
+        batch = await self.load_candidates(db, item_ids[:limit * 2], match_score=weights[:limit * 2],
+                                           recall_type='multi_hop')
+        if batch.has_column('kind'):
+            batch = batch.mask(batch.column('kind') == 'content')
+        return batch.head(limit)
+    
+    async def _recall_from_db(self, db: AsyncSession, user_id: int, trace: Any, limit: int,
+                              excluded_ids: List[int]) -> List[Dict[str, Any]]:
+        """递归SQL展开，只用于关系图和相关内容表都不可用时的降级"""
         # 多跳召回的基本思路：
         # 1. 找出用户直接交互过的内容（第1跳）
         # 2. 找出与这些内容有相同交互的其他用户（第2跳）
@@ -54,7 +144,7 @@ class MultiHopRecallNode(RecallNode):
             WHERE 
                 r.user_id = :user_id
                 AND r.entity_type = 'item'
-                AND r.relation_type IN :relation_types
+                AND r.relation_type = ANY(:relation_types)
                 AND r.status = 'active'
         ),
         -- 递归查询多跳关系
@@ -76,8 +166,8 @@ class MultiHopRecallNode(RecallNode):
                 h.hop < :max_hops
                 AND r1.entity_type = 'item'
                 AND r2.entity_type = 'item'
-                AND r1.relation_type IN :relation_types
-                AND r2.relation_type IN :relation_types
+                AND r1.relation_type = ANY(:relation_types)
+                AND r2.relation_type = ANY(:relation_types)
                 AND r1.status = 'active'
                 AND r2.status = 'active'
                 AND r2.entity_id != h.item_id
@@ -90,6 +180,7 @@ class MultiHopRecallNode(RecallNode):
                 SUM(weight) as total_weight
             FROM 
                 hops
+            {exclude_condition}
             GROUP BY 
                 item_id
             ORDER BY 
@@ -99,8 +190,6 @@ class MultiHopRecallNode(RecallNode):
         -- 获取内容详情
         SELECT 
             i.id,
-            i.title,
-            i.content,
             i.tags,
             i.author_id,
             i.created_at,
@@ -114,16 +203,18 @@ class MultiHopRecallNode(RecallNode):
             i.kind = 'content'
         ORDER BY 
             match_score DESC
-        """
+        """.format(exclude_condition="WHERE item_id <> ALL(:excluded_ids)" if excluded_ids else "")
         
         # 准备参数
         params = {
             'user_id': user_id,
-            'relation_types': tuple(self.relation_types),
+            'relation_types': list(self.relation_types),
             'max_hops': self.max_hops,
             'hop_decay': self.hop_decay,
-            'limit': self.recall_size
+            'limit': limit
         }
+        if excluded_ids:
+            params['excluded_ids'] = excluded_ids
         
         try:
             # 执行查询
@@ -156,8 +247,5 @@ class MultiHopRecallNode(RecallNode):
             error_msg = f"多跳召回失败: {str(e)}"
             logger.error(error_msg)
             
-            if trace:
-                trace.add_error(self.node_id, error_msg)
-            
-            # 出错时返回空列表
-            return []
\ No newline at end of file
+            # 抛出异常，由DAG执行器统一降级并计入节点熔断器
+            raise
\ No newline at end of file
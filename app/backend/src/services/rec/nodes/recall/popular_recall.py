@@ -1,25 +1,35 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
+import numpy as np
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RecallNode
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.catalog import item_catalog
+from src.services.rec.popularity import popularity_counters
 
 class PopularRecallNode(RecallNode):
-    """基于热度的召回节点"""
+    """基于热度的召回节点
+    
+    优先读取进程内热度计数预先计算的热门列表（见popularity），计数不可用或时间窗口
+    未被维护时按时间窗口聚合app.events。
+    """
+    
+    DEFAULT_WEIGHTS = {
+        'pv': 1.0,
+        'like': 3.0,
+        'comment': 5.0,
+        'share': 7.0,
+        'favorite': 10.0
+    }
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
         self.time_window = config.get('time_window', '1d')
         self.metrics = config.get('metrics', ['pv', 'like', 'comment'])
-        self.weights = config.get('weights', {
-            'pv': 1.0,
-            'like': 3.0,
-            'comment': 5.0,
-            'share': 7.0,
-            'favorite': 10.0
-        })
+        self.weights = config.get('weights', dict(self.DEFAULT_WEIGHTS))
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
@@ -40,7 +50,7 @@ class PopularRecallNode(RecallNode):
             return timedelta(days=1)
     
     async def recall(self, db: AsyncSession, user_id: Optional[int], 
-                    context: Dict[str, Any]) -> List[Dict[str, Any]]:
+                    context: Dict[str, Any]) -> Union[CandidateBatch, List[Dict[str, Any]]]:
         """基于内容热度进行召回"""
         # 获取trace信息
         trace = context.get('trace')
@@ -48,6 +58,45 @@ class PopularRecallNode(RecallNode):
             trace.add_node_detail(self.node_id, "time_window", self.time_window)
             trace.add_node_detail(self.node_id, "metrics", self.metrics)
         
+        if popularity_counters.ready and popularity_counters.has_window(self.time_window):
+            # 未配置权重的指标使用默认权重，与数据库查询一致
+            weights = popularity_counters.weight_vector(self.metrics, {**self.DEFAULT_WEIGHTS, **self.weights})
+            if not any(weights):
+                if trace:
+                    trace.add_node_detail(self.node_id, "error", "no_valid_event_types")
+                return []
+            candidates = await self._recall_from_counters(db, weights, await self.fetch_size(context, pushed_down=True),
+                                                          await self.excluded_array(context))
+            if trace:
+                trace.add_node_detail(self.node_id, "source", "counters")
+                trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
+            logger.debug(f"热门召回数量: {len(candidates)}")
+            return candidates
+        
+        if trace:
+            trace.add_node_detail(self.node_id, "source", "db")
+        return await self._recall_from_db(db, trace, await self.fetch_size(context, pushed_down=True),
+                                          await self.excluded_ids(context))
+    
+    async def _recall_from_counters(self, db: AsyncSession, weights: tuple, limit: int,
+                                    excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """读取预先计算的热门列表，跳过排除的内容"""
+        item_ids, scores = popularity_counters.top(self.time_window, weights, limit, exclude=excluded)
+        item_ids, scores = item_ids.tolist(), scores.tolist()
+        if len(item_ids) < limit:
+            # 与数据库查询一致：有热度的内容不足时用其他内容补齐，分数为0
+            seen = set(item_ids)
+            for item in item_catalog.list_by_kind('content', limit + len(seen), exclude=excluded) or []:
+                if len(item_ids) >= limit:
+                    break
+                if item.id not in seen:
+                    item_ids.append(item.id)
+                    scores.append(0.0)
+        return await self.load_candidates(db, item_ids, match_score=np.array(scores), recall_type='popular')
+    
+    async def _recall_from_db(self, db: AsyncSession, trace: Any, limit: int,
+                              excluded_ids: List[int]) -> List[Dict[str, Any]]:
+        """按时间窗口聚合事件表，只用于热度计数不可用时的降级"""
         # 解析时间窗口
         delta = self._parse_time_window(self.time_window)
         start_time = datetime.now() - delta
@@ -84,15 +133,13 @@ class PopularRecallNode(RecallNode):
                 app.events e
             WHERE 
                 e.ts >= :start_time
-                AND e.event_type IN :event_types
+                AND e.event_type = ANY(:event_types)
             GROUP BY 
                 e.item_id, e.event_type
         ),
         item_scores AS (
             SELECT 
                 i.id,
-                i.title,
-                i.content,
                 i.tags,
                 i.author_id,
                 i.created_at,
@@ -113,26 +160,29 @@ class PopularRecallNode(RecallNode):
                 event_counts ec ON i.id = ec.item_id
             WHERE
                 i.kind = 'content'
+                {exclude_condition}
             GROUP BY 
-                i.id, i.title, i.content, i.tags, i.author_id, i.created_at, i.kind
+                i.id, i.tags, i.author_id, i.created_at, i.kind
             ORDER BY 
                 popularity_score DESC
             LIMIT :limit
         )
         SELECT * FROM item_scores
-        """
+        """.format(exclude_condition="AND i.id <> ALL(:excluded_ids)" if excluded_ids else "")
         
         # 准备参数
         params = {
             'start_time': start_time,
-            'event_types': tuple(event_types),
+            'event_types': event_types,
             'pv_weight': self.weights.get('pv', 1.0),
             'like_weight': self.weights.get('like', 3.0),
             'comment_weight': self.weights.get('comment', 5.0),
             'share_weight': self.weights.get('share', 7.0),
             'favorite_weight': self.weights.get('favorite', 10.0),
-            'limit': self.recall_size
+            'limit': limit
         }
+        if excluded_ids:
+            params['excluded_ids'] = excluded_ids
         
         try:
             # 执行查询
@@ -165,8 +215,5 @@ class PopularRecallNode(RecallNode):
             error_msg = f"热门召回失败: {str(e)}"
             logger.error(error_msg)
             
-            if trace:
-                trace.add_error(self.node_id, error_msg)
-            
-            # 出错时返回空列表
-            return []
\ No newline at end of file
+            # 抛出异常，由DAG执行器统一降级并计入节点熔断器
+            raise
\ No newline at end of file
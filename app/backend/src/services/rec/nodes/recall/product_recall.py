@@ -24,29 +24,26 @@ class ProductRecallNode(RecallNode):
         
         # 简化版商品召回，实际实现可能更复杂
         query = (
-            select(Item)
+            select(*self.light_columns())
             .where(Item.kind == 'product')
-            .limit(self.recall_size)
+            .limit(await self.fetch_size(context, pushed_down=True))
         )
+        excluded_ids = await self.excluded_ids(context)
+        if excluded_ids:
+            query = query.where(Item.id.not_in(excluded_ids))
         
         try:
             result = await db.execute(query)
-            items = result.scalars().all()
+            items = result.all()
             
             # 构建候选项列表
             candidates = []
             for item in items:
-                candidates.append({
-                    'id': item.id,
-                    'title': item.title,
-                    'content': item.content,
-                    'tags': item.tags,
-                    'author_id': item.author_id,
-                    'created_at': item.created_at.isoformat() if item.created_at else None,
-                    'kind': item.kind,
-                    'match_score': 1.0,  # 简化处理
-                    'recall_type': 'product'
-                })
+                candidates.append(self.to_candidate(
+                    item,
+                    match_score=1.0,  # 简化处理
+                    recall_type='product',
+                ))
             
             # 记录trace信息
             if trace:
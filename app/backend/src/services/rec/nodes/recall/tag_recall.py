@@ -1,9 +1,13 @@
-from typing import Dict, List, Any, Optional
-from sqlalchemy import select, text, or_
+from typing import Dict, List, Any, Optional, Union
+import numpy as np
+from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RecallNode
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.catalog import item_catalog
+from src.services.rec.tag_index import tag_index
 from src.db.models import Item, User
 
 class TagRecallNode(RecallNode):
@@ -14,6 +18,8 @@ class TagRecallNode(RecallNode):
         self.tag_weight_decay = config.get('tag_weight_decay', 0.9)
         self.min_tag_match = config.get('min_tag_match', 1)
         self.max_tag_match = config.get('max_tag_match', 3)
+        # 每个标签最多读取的倒排项（最新的若干条），0表示全部
+        self.max_postings_per_tag = config.get('max_postings_per_tag', 0)
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
@@ -21,7 +27,7 @@ class TagRecallNode(RecallNode):
         return fields
     
     async def recall(self, db: AsyncSession, user_id: Optional[int], 
-                    context: Dict[str, Any]) -> List[Dict[str, Any]]:
+                    context: Dict[str, Any]) -> Union[CandidateBatch, List[Dict[str, Any]]]:
         """基于用户兴趣标签进行召回"""
         if not user_id:
             # 未登录用户，返回空列表
@@ -53,32 +59,69 @@ class TagRecallNode(RecallNode):
         if trace:
             trace.add_node_detail(self.node_id, "user_tags", user_tags)
         
-        # 构建标签匹配查询
-        # 使用PostgreSQL的jsonb操作符进行标签匹配
-        # 这里假设tags字段是jsonb数组类型
-        candidates = []
-        
         # 限制使用的标签数量
         used_tags = user_tags[:self.max_tag_match]
         
-        # 构建查询条件：至少匹配一个标签
-        conditions = []
-        for tag in used_tags:
-            # 使用jsonb包含操作符
-            conditions.append(text(f"tags @> '[\"{ tag }\"]'::jsonb"))
+        # 优先使用内存中的标签倒排索引，目录不可用时查询数据库
+        if tag_index.loaded and item_catalog.ready:
+            candidates = self._recall_from_index(used_tags, await self.fetch_size(context, pushed_down=True),
+                                                 await self.excluded_array(context))
+            source = "index"
+        else:
+            candidates = await self._recall_from_db(db, used_tags, await self.fetch_size(context, pushed_down=True),
+                                                    await self.excluded_ids(context))
+            source = "db"
+        
+        # 记录trace信息
+        if trace:
+            trace.add_node_detail(self.node_id, "source", source)
+            trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
+        
+        logger.debug(f"标签召回数量: {len(candidates)}")
+        return candidates
+    
+    def _recall_from_index(self, used_tags: List[str], limit: int,
+                           excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """在标签倒排索引上按加权匹配分数取top-k，跳过排除的内容"""
+        item_ids, scores, masks = tag_index.top_k(
+            used_tags,
+            limit,
+            decay=self.tag_weight_decay,
+            min_match=self.min_tag_match,
+            max_postings_per_tag=self.max_postings_per_tag,
+            exclude=excluded,
+        )
+        items, _ = item_catalog.get_many(item_ids.tolist())
+        keep = [i for i, item_id in enumerate(item_ids.tolist()) if item_id in items]
+        matched_tags = [[tag for bit, tag in enumerate(used_tags) if int(masks[i]) >> bit & 1] for i in keep]
+        return self.catalog_candidates(
+            [items[int(item_ids[i])] for i in keep],
+            match_score=scores[keep],
+            matched_tags=matched_tags,
+            recall_type='tag',
+        )
+    
+    async def _recall_from_db(self, db: AsyncSession, used_tags: List[str], limit: int,
+                              excluded_ids: List[int]) -> List[Dict[str, Any]]:
+        """查询数据库召回，只用于目录不可用时的降级"""
+        # 构建查询条件：至少匹配一个标签（jsonb包含操作符）
+        conditions = [Item.tags.contains([tag]) for tag in used_tags]
         
         # 组合查询条件
         query = (
-            select(Item)
+            select(*self.light_columns())
             .where(or_(*conditions))
             .where(Item.kind == 'content')
-            .limit(self.recall_size)
+            .limit(limit)
         )
+        if excluded_ids:
+            query = query.where(Item.id.not_in(excluded_ids))
         
         result = await db.execute(query)
-        items = result.scalars().all()
+        items = result.all()
         
         # 计算每个项目的标签匹配分数
+        candidates = []
         for item in items:
             item_tags = item.tags if isinstance(item.tags, list) else []
             
@@ -95,29 +138,13 @@ class TagRecallNode(RecallNode):
             
             # 只有当匹配标签数量达到最小要求时才添加到候选集
             if len(matched_tags) >= self.min_tag_match:
-                candidates.append({
-                    'id': item.id,
-                    'title': item.title,
-                    'content': item.content,
-                    'tags': item.tags,
-                    'author_id': item.author_id,
-                    'created_at': item.created_at.isoformat() if item.created_at else None,
-                    'kind': item.kind,
-                    'match_score': match_score,
-                    'matched_tags': matched_tags,
-                    'recall_type': 'tag'
-                })
+                candidates.append(self.to_candidate(
+                    item,
+                    match_score=match_score,
+                    matched_tags=matched_tags,
+                    recall_type='tag',
+                ))
         
         # 按匹配分数排序
         candidates.sort(key=lambda x: x['match_score'], reverse=True)
-        
-        # 截断结果
-        if len(candidates) > self.recall_size:
-            candidates = candidates[:self.recall_size]
-        
-        # 记录trace信息
-        if trace:
-            trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
-        
-        logger.debug(f"标签召回数量: {len(candidates)}")
         return candidates
\ No newline at end of file
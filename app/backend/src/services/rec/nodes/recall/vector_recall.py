@@ -1,26 +1,38 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
+import json
+import numpy as np
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import RecallNode
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.ann import l2_score
+from src.services.rec.vector_index import item_vector_index
+from src.services.rec.embedding_store import user_embedding_store, parse_vector
 
 class VectorRecallNode(RecallNode):
-    """基于向量的召回节点"""
+    """基于向量的召回节点
+    
+    优先使用进程内的IVF向量索引（见vector_index），索引不可用时使用pgvector查询。
+    分数越大越相似：cosine为余弦相似度，l2为1/(1+欧氏距离)，min_score对两者都是最低分数。
+    """
     
     def __init__(self, node_id: str, config: Dict[str, Any]):
         super().__init__(node_id, config)
         self.vector_field = config.get('vector_field', 'emb')
         self.distance_metric = config.get('distance_metric', 'cosine')
         self.min_score = config.get('min_score', 0.7)
+        # 扫描的倒排列表数量，越大召回率越高、耗时越长
+        self.nprobe = config.get('nprobe', 8)
     
     def get_required_fields(self) -> List[str]:
         fields = super().get_required_fields()
         fields.extend(['vector_field', 'distance_metric'])
         return fields
     
-    async def recall(self, db: AsyncSession, user_id: Optional[int], 
-                    context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def recall(self, db: AsyncSession, user_id: Optional[int],
+                    context: Dict[str, Any]) -> Union[CandidateBatch, List[Dict[str, Any]]]:
         """基于向量相似度进行召回"""
         if not user_id:
             # 未登录用户，返回空列表
@@ -33,102 +45,126 @@ class VectorRecallNode(RecallNode):
             trace.add_node_detail(self.node_id, "distance_metric", self.distance_metric)
             trace.add_node_detail(self.node_id, "min_score", self.min_score)
         
-        # 获取用户向量
-        # 这里假设有一个用户向量表或视图
-        # 实际实现可能需要根据项目具体情况调整
-        user_vector_query = """
-        SELECT user_id, user_embedding as emb
-        FROM feature.user_embeddings
-        WHERE user_id = :user_id
-        """
-        
         try:
-            result = await db.execute(text(user_vector_query), {'user_id': user_id})
-            user_vector_row = result.fetchone()
+            # 获取用户向量，优先读取向量存储
+            query = user_embedding_store.get_one(user_id) if user_embedding_store.loaded else None
+            if query is not None:
+                # 与JSONB读出的格式一致，降级查询时直接作为参数
+                user_vector = json.dumps(query.tolist())
+            else:
+                user_vector = await self._load_user_vector(db, user_id)
+                if user_vector is None:
+                    # 用户没有向量表示，返回空列表
+                    if trace:
+                        trace.add_node_detail(self.node_id, "error", "user_vector_not_found")
+                    return []
+                query = parse_vector(user_vector)
             
-            if not user_vector_row:
-                # 用户没有向量表示，返回空列表
-                if trace:
-                    trace.add_node_detail(self.node_id, "error", "user_vector_not_found")
-                return []
-            
-            user_vector = user_vector_row._mapping['emb']
-            
-            # 使用pgvector进行向量检索
-            # 根据距离度量选择操作符
-            operator = "<=>" if self.distance_metric == "cosine" else "<->"
-            
-            vector_query = f"""
-            SELECT 
-                i.id,
-                i.title,
-                i.content,
-                i.tags,
-                i.author_id,
-                i.created_at,
-                i.kind,
-                ie.emb {operator} :user_vector AS similarity_score
-            FROM 
-                feature.item_embeddings ie
-            JOIN 
-                app.items i ON ie.item_id = i.id
-            WHERE 
-                i.kind = 'content'
-                AND (ie.emb {operator} :user_vector) < :threshold
-            ORDER BY 
-                similarity_score
-            LIMIT :limit
-            """
-            
-            # 准备参数
-            # 对于余弦相似度，阈值是1-min_score（因为余弦距离=1-余弦相似度）
-            threshold = 1 - self.min_score if self.distance_metric == "cosine" else self.min_score
-            
-            params = {
-                'user_vector': user_vector,
-                'threshold': threshold,
-                'limit': self.recall_size
-            }
-            
-            # 执行查询
-            result = await db.execute(text(vector_query), params)
-            rows = result.fetchall()
-            
-            # 构建候选项列表
-            candidates = []
-            for row in rows:
-                # 将行转换为字典
-                item = dict(row._mapping)
-                
-                # 添加召回类型
-                item['recall_type'] = 'vector'
-                
-                # 对于余弦相似度，转换回相似度分数（而非距离）
-                similarity = item.pop('similarity_score', 0.0)
-                if self.distance_metric == "cosine":
-                    item['match_score'] = 1 - similarity
-                else:
-                    item['match_score'] = similarity
-                
-                # 格式化日期时间
-                if 'created_at' in item and item['created_at']:
-                    item['created_at'] = item['created_at'].isoformat()
-                
-                candidates.append(item)
+            # 优先使用进程内向量索引
+            if item_vector_index.ready and query is not None and len(query) == item_vector_index.index.dim:
+                candidates = await self._recall_from_index(db, query, await self.fetch_size(context, pushed_down=True),
+                                                           await self.excluded_array(context))
+                source = "index"
+            else:
+                candidates = await self._recall_from_db(db, user_vector,
+                                                        await self.fetch_size(context, pushed_down=True),
+                                                        await self.excluded_ids(context))
+                source = "db"
             
             # 记录trace信息
             if trace:
+                trace.add_node_detail(self.node_id, "source", source)
                 trace.add_node_detail(self.node_id, "candidates_count", len(candidates))
             
             logger.debug(f"向量召回数量: {len(candidates)}")
             return candidates
-            
+        
         except Exception as e:
             error_msg = f"向量召回失败: {str(e)}"
             logger.error(error_msg)
             
-            if trace:
-                trace.add_error(self.node_id, error_msg)
-            
-            # 出错时返回空列表
-            return []
\ No newline at end of file
+            # 抛出异常，由DAG执行器统一降级并计入节点熔断器
+            raise
+    
+    async def _load_user_vector(self, db: AsyncSession, user_id: int) -> Any:
+        """从数据库读取用户向量，不存在时返回None"""
+        # 这里假设有一个用户向量表或视图
+        # 实际实现可能需要根据项目具体情况调整
+        user_vector_query = """
+        SELECT user_id, user_embedding as emb
+        FROM feature.user_embeddings
+        WHERE user_id = :user_id
+        """
+        result = await db.execute(text(user_vector_query), {'user_id': user_id})
+        user_vector_row = result.fetchone()
+        return user_vector_row._mapping['emb'] if user_vector_row else None
+    
+    async def _recall_from_index(self, db: AsyncSession, query: np.ndarray, limit: int,
+                                 excluded: Optional[np.ndarray]) -> CandidateBatch:
+        """在进程内向量索引上查询近似最近邻，跳过排除的内容"""
+        item_ids, scores = item_vector_index.search(
+            query,
+            limit,
+            metric=self.distance_metric,
+            nprobe=self.nprobe,
+            min_score=self.min_score,
+            exclude=excluded,
+        )
+        return await self.load_candidates(db, item_ids, match_score=scores, recall_type='vector')
+    
+    async def _recall_from_db(self, db: AsyncSession, user_vector: Any, limit: int,
+                              excluded_ids: List[int]) -> List[Dict[str, Any]]:
+        """使用pgvector查询，只用于向量索引不可用时的降级"""
+        # 根据距离度量选择操作符
+        operator = "<=>" if self.distance_metric == "cosine" else "<->"
+        
+        vector_query = f"""
+        SELECT
+            i.id,
+            i.tags,
+            i.author_id,
+            i.created_at,
+            i.kind,
+            ie.emb {operator} :user_vector AS distance
+        FROM
+            feature.item_embeddings ie
+        JOIN
+            app.items i ON ie.item_id = i.id
+        WHERE
+            i.kind = 'content'
+            AND (ie.emb {operator} :user_vector) <= :threshold
+            {"AND i.id <> ALL(:excluded_ids)" if excluded_ids else ""}
+        ORDER BY
+            distance
+        LIMIT :limit
+        """
+        
+        # 准备参数
+        # 将最低分数换算为最大距离：余弦距离=1-余弦相似度，l2分数=1/(1+距离)
+        if self.distance_metric == "cosine":
+            threshold = 1 - self.min_score
+        else:
+            threshold = 1 / self.min_score - 1 if self.min_score > 0 else float('inf')
+        
+        params = {
+            'user_vector': user_vector,
+            'threshold': threshold,
+            'limit': limit
+        }
+        if excluded_ids:
+            params['excluded_ids'] = excluded_ids
+        
+        # 执行查询
+        result = await db.execute(text(vector_query), params)
+        rows = result.fetchall()
+        
+        # 构建候选项列表
+        candidates = []
+        for row in rows:
+            distance = row.distance or 0.0
+            if self.distance_metric == "cosine":
+                match_score = 1 - distance
+            else:
+                match_score = float(l2_score(distance))
+            candidates.append(self.to_candidate(row, match_score=match_score, recall_type='vector'))
+        return candidates
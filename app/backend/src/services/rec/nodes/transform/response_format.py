@@ -1,11 +1,11 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 import uuid
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.services.rec.nodes.base_node import TransformNode
-from src.db.models import Item
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.hydration import hydrate_items, author_name
 from src.db.schemas import FeedItem
 
 class ResponseFormatNode(TransformNode):
@@ -16,8 +16,11 @@ class ResponseFormatNode(TransformNode):
         self.generate_reason = config.get('generate_reason', True)
         self.include_tracking = config.get('include_tracking', True)
     
-    async def transform(self, candidates: List[Dict[str, Any]], context: Dict[str, Any]) -> List[FeedItem]:
+    async def transform(self, candidates: Union[CandidateBatch, List[Dict[str, Any]]],
+                        context: Dict[str, Any]) -> List[FeedItem]:
         """将推荐结果转换为API响应格式"""
+        if isinstance(candidates, CandidateBatch):
+            candidates = candidates.to_dicts()
         if not candidates:
             return []
         
@@ -31,6 +34,9 @@ class ResponseFormatNode(TransformNode):
         if not db:
             raise ValueError("缺少数据库会话")
         
+        # 一次性加载最终结果的完整内容和作者
+        items_db = await hydrate_items(db, candidates, trace, self.node_id)
+        
         # 转换结果
         feed_items: List[FeedItem] = []
         
@@ -69,10 +75,11 @@ class ResponseFormatNode(TransformNode):
             # 根据类型设置不同的内容
             kind = item.get('kind', 'content')
             if kind == "content":
-                # 查询完整的内容信息
-                item_query = select(Item).where(Item.id == item.get('id'))
-                item_result = await db.execute(item_query)
-                item_db = item_result.scalar_one_or_none()
+                # 完整的内容信息
+                try:
+                    item_db = items_db.get(int(item.get('id')))
+                except (ValueError, TypeError):
+                    item_db = None
                 
                 if item_db:
                     feed_item.content = {
@@ -80,7 +87,7 @@ class ResponseFormatNode(TransformNode):
                         "description": item_db.content,
                         "author": {
                             "id": item_db.author_id,
-                            "name": "未知作者"  # 简化处理，实际应该查询作者信息
+                            "name": author_name(item_db)
                         },
                         "created_at": item_db.created_at.isoformat() if item_db.created_at else None,
                         "media": item_db.media,
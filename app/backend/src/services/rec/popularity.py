@@ -0,0 +1,292 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from datetime import datetime, timedelta, timezone
+from math import gcd
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.batch import topk
+
+# 参与热度统计的事件类型
+EVENT_TYPES = ("impression", "like", "comment", "share", "favorite")
+# 召回节点配置中的指标名称到事件类型
+METRIC_EVENTS = {"pv": "impression", "like": "like", "comment": "comment", "share": "share", "favorite": "favorite"}
+
+def parse_window(window: str) -> int:
+    """解析时间窗口字符串（如1h、7d）为秒数，无法解析时按1天处理"""
+    units = {"h": 3600, "d": 86400}
+    try:
+        return int(window[:-1]) * units[window[-1]]
+    except (ValueError, KeyError, IndexError):
+        return 86400
+
+class WindowCounter:
+    """单个时间窗口的滑动计数
+
+    窗口切分为固定数量的时间桶，每个桶保存该时段内的增量（槽位、事件类型、次数），
+    counts矩阵是窗口内所有桶的累计值；桶滑出窗口时从counts中减去。
+    窗口的实际覆盖范围在window和window+桶宽之间。
+    """
+
+    def __init__(self, name: str, window_seconds: int, buckets: int):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds // buckets
+        self.counts = np.zeros((0, len(EVENT_TYPES)), dtype=np.int64)
+        self._deltas: Dict[int, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {}
+
+    def _grow(self, slots: int):
+        if slots <= len(self.counts):
+            return
+        counts = np.zeros((max(slots, len(self.counts) * 2, 1024), len(EVENT_TYPES)), dtype=np.int64)
+        counts[:len(self.counts)] = self.counts
+        self.counts = counts
+
+    def add(self, slots: np.ndarray, types: np.ndarray, bucket_ts: np.ndarray, counts: np.ndarray, now: float):
+        """累加一批聚合后的事件，bucket_ts为各行所在基础桶的起始时间（秒）"""
+        self.expire(now)
+        buckets = bucket_ts // self.bucket_seconds
+        live = buckets > self._current(now) - self.buckets
+        if not live.any():
+            return
+        slots, types, buckets, counts = slots[live], types[live], buckets[live], counts[live]
+        self._grow(int(slots.max()) + 1)
+        np.add.at(self.counts, (slots, types), counts)
+        for bucket in np.unique(buckets).tolist():
+            mask = buckets == bucket
+            self._deltas.setdefault(bucket, []).append((slots[mask], types[mask], counts[mask]))
+
+    def expire(self, now: float):
+        """减去滑出窗口的桶"""
+        oldest = self._current(now) - self.buckets + 1
+        for bucket in [bucket for bucket in self._deltas if bucket < oldest]:
+            for slots, types, counts in self._deltas.pop(bucket):
+                np.subtract.at(self.counts, (slots, types), counts)
+
+    def _current(self, now: float) -> int:
+        return int(now) // self.bucket_seconds
+
+class PopularityCounters:
+    """内容热度计数
+
+    按events.id水位定期拉取新事件，在数据库中按（内容、事件类型、基础时间桶）聚合后
+    写入各时间窗口（默认1h、1d、7d）的滑动计数；所有worker各自拉取，不依赖写入路径。
+    热度分数为各事件类型次数的加权和，每个窗口、每组权重的top-N列表在刷新后预先计算，
+    召回节点直接读取。
+
+    只统计内容类型（kind='content'）的事件。ID在事务提交前已分配，提交顺序与ID顺序
+    不一致时少量事件可能被跳过，全量重载时修正。
+    """
+
+    def __init__(self, windows: Iterable[str] = ("1h", "1d", "7d"), buckets: int = 24,
+                 top_n: int = 1000, max_staleness_seconds: float = 300):
+        self.windows = {window: WindowCounter(window, parse_window(window), buckets) for window in windows}
+        self.top_n = top_n
+        self.max_staleness_seconds = max_staleness_seconds
+        # 基础桶宽为各窗口桶宽的最大公约数，数据库按基础桶聚合
+        self.base_bucket_seconds = 0
+        for counter in self.windows.values():
+            self.base_bucket_seconds = gcd(self.base_bucket_seconds, counter.bucket_seconds)
+        self._slot_of: Dict[int, int] = {}
+        self._item_ids = np.zeros(0, dtype=np.int64)
+        self._last_id = 0
+        self._lock = asyncio.Lock()
+        self._top: Dict[Tuple[str, Tuple[float, ...]], Tuple[np.ndarray, np.ndarray]] = {}
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self.last_full_load_at: Optional[float] = None
+        self._stats = dict.fromkeys(("queries", "refreshes", "refresh_errors", "events"), 0)
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded:
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def has_window(self, window: str) -> bool:
+        return window in self.windows
+
+    @staticmethod
+    def weight_vector(metrics: Iterable[str], weights: Dict[str, float]) -> Tuple[float, ...]:
+        """节点的指标和权重配置转换为按EVENT_TYPES排列的权重，未选中的指标权重为0"""
+        vector = dict.fromkeys(EVENT_TYPES, 0.0)
+        for metric in metrics:
+            event_type = METRIC_EVENTS.get(metric)
+            if event_type is not None:
+                vector[event_type] = float(weights.get(metric, 0.0))
+        return tuple(vector[event_type] for event_type in EVENT_TYPES)
+
+    def top(self, window: str, weights: Tuple[float, ...], n: int,
+            exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """窗口内热度分数最高的n个内容（分数大于0），按分数从高到低排序
+
+        同一组权重第一次查询时计算并缓存，之后每次刷新后重新计算。exclude中的内容
+        被跳过：每个排除的ID最多占用缓存列表中的一个位置，缓存列表不够长时重新计算。
+        """
+        self._stats["queries"] += 1
+        key = (window, weights)
+        skip = len(exclude) if exclude is not None else 0
+        if n + skip > self.top_n:
+            return self._compute_top(window, weights, n, exclude)
+        if key not in self._top:
+            self._top[key] = self._compute_top(window, weights, self.top_n)
+        item_ids, scores = self._top[key]
+        if skip:
+            keep = ~np.isin(item_ids, exclude)
+            item_ids, scores = item_ids[keep], scores[keep]
+        return item_ids[:n], scores[:n]
+
+    def _compute_top(self, window: str, weights: Tuple[float, ...], n: int,
+                     exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        counts = self.windows[window].counts[:len(self._item_ids)]
+        scores = counts @ np.asarray(weights, dtype=np.float64)
+        slots = np.flatnonzero(scores > 0)
+        if exclude is not None and len(exclude):
+            slots = slots[~np.isin(self._item_ids[slots], exclude)]
+        order = slots[topk(scores[slots], n)]
+        return self._item_ids[order], scores[order]
+
+    def _slots(self, item_ids: np.ndarray) -> np.ndarray:
+        slots = np.empty(len(item_ids), dtype=np.int64)
+        new_ids = []
+        for i, item_id in enumerate(item_ids.tolist()):
+            slot = self._slot_of.get(item_id)
+            if slot is None:
+                slot = self._slot_of[item_id] = len(self._item_ids) + len(new_ids)
+                new_ids.append(item_id)
+            slots[i] = slot
+        if new_ids:
+            self._item_ids = np.concatenate([self._item_ids, np.array(new_ids, dtype=np.int64)])
+        return slots
+
+    def _apply(self, rows: List[Any], now: float):
+        """写入一批聚合行（item_id, event_type, bucket, count）"""
+        if not rows:
+            return
+        type_index = {event_type: i for i, event_type in enumerate(EVENT_TYPES)}
+        item_ids = np.array([row.item_id for row in rows], dtype=np.int64)
+        types = np.array([type_index[row.event_type] for row in rows], dtype=np.int64)
+        bucket_ts = np.array([int(row.bucket) for row in rows], dtype=np.int64) * self.base_bucket_seconds
+        counts = np.array([row.count for row in rows], dtype=np.int64)
+        slots = self._slots(item_ids)
+        for counter in self.windows.values():
+            counter.add(slots, types, bucket_ts, counts, now)
+        self._stats["events"] += int(counts.sum())
+
+    async def _fetch(self, db: Any, since: Optional[datetime], last_id: int, max_id: int) -> List[Any]:
+        query = """
+            SELECT e.item_id, e.event_type,
+                   FLOOR(EXTRACT(EPOCH FROM e.ts) / :bucket_seconds)::BIGINT AS bucket,
+                   COUNT(*) AS count
+            FROM app.events e
+            JOIN app.items i ON i.id = e.item_id AND i.kind = 'content'
+            WHERE e.id > :last_id AND e.id <= :max_id
+              AND e.event_type = ANY(:event_types)
+        """
+        params = {
+            "bucket_seconds": self.base_bucket_seconds,
+            "last_id": last_id,
+            "max_id": max_id,
+            "event_types": list(EVENT_TYPES),
+        }
+        if since is not None:
+            query += " AND e.ts >= :since"
+            params["since"] = since
+        query += " GROUP BY e.item_id, e.event_type, bucket"
+        return (await db.execute(text(query), params)).fetchall()
+
+    def _recompute_top(self):
+        self._top = {key: self._compute_top(key[0], key[1], self.top_n) for key in self._top}
+
+    async def load(self, session_factory: Callable):
+        """从最长窗口的起点全量统计，完成后整体替换"""
+        start_time = time.perf_counter()
+        fresh = PopularityCounters(self.windows.keys(), next(iter(self.windows.values())).buckets,
+                                   self.top_n, self.max_staleness_seconds)
+        longest = max(counter.window_seconds for counter in self.windows.values())
+        # 多取一个桶宽，保证最早的桶完整
+        since = datetime.now(timezone.utc) - timedelta(
+            seconds=longest + max(counter.bucket_seconds for counter in self.windows.values()))
+        async with session_factory() as db:
+            max_id = (await db.execute(text("SELECT COALESCE(MAX(id), 0) FROM app.events"))).scalar()
+            rows = await fresh._fetch(db, since, 0, max_id)
+        fresh._apply(rows, time.time())
+
+        async with self._lock:
+            self.windows = fresh.windows
+            self._slot_of, self._item_ids = fresh._slot_of, fresh._item_ids
+            self._last_id = max_id
+            self._stats["events"] = fresh._stats["events"]
+            self._recompute_top()
+            self.loaded = True
+            self.last_refresh_at = self.last_full_load_at = time.time()
+
+        logger.info(f"内容热度计数全量加载完成: {len(self._item_ids)} 条内容, {self._stats['events']} 个事件, "
+                    f"耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """拉取水位之后的新事件并重新计算top-N，返回聚合行数"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return len(self._item_ids)
+
+        async with self._lock, session_factory() as db:
+            max_id = (await db.execute(text("SELECT COALESCE(MAX(id), 0) FROM app.events"))).scalar()
+            rows = await self._fetch(db, None, self._last_id, max_id) if max_id > self._last_id else []
+            now = time.time()
+            self._apply(rows, now)
+            for counter in self.windows.values():
+                counter.expire(now)
+            self._last_id = max(self._last_id, max_id)
+            self._recompute_top()
+            self.last_refresh_at = now
+            self._stats["refreshes"] += 1
+        return len(rows)
+
+    async def watch(self, session_factory: Callable, interval_seconds: float,
+                    full_reload_seconds: float = 86400):
+        """定期增量刷新，并按间隔全量重载"""
+        logger.info(f"开始刷新内容热度计数，间隔 {interval_seconds}s，全量重载间隔 {full_reload_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not self.loaded or (full_reload_seconds > 0 and
+                                       time.time() - self.last_full_load_at >= full_reload_seconds):
+                    await self.load(session_factory)
+                else:
+                    await self.refresh(session_factory)
+            except Exception as e:
+                # 保留当前计数，超过最大陈旧时间后召回节点查询数据库
+                self._stats["refresh_errors"] += 1
+                logger.error(f"刷新内容热度计数失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "last_event_id": self._last_id,
+            "items": len(self._item_ids),
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            "windows": {
+                name: {
+                    "bucket_seconds": counter.bucket_seconds,
+                    "buckets": len(counter._deltas),
+                    "events": int(counter.counts.sum()),
+                }
+                for name, counter in self.windows.items()
+            },
+            "top_lists": len(self._top),
+            **self._stats,
+        }
+
+# 全局内容热度计数
+popularity_counters = PopularityCounters(
+    windows=[window.strip() for window in settings.POPULARITY_WINDOWS.split(",") if window.strip()],
+    top_n=settings.POPULARITY_TOP_N,
+    max_staleness_seconds=settings.POPULARITY_MAX_STALENESS_S,
+)
@@ -0,0 +1,332 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Sequence, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.batch import topk
+
+def _csr(groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """已按分组排序的数组的行偏移"""
+    return np.concatenate([[0], np.cumsum(np.bincount(groups, minlength=n_groups))])
+
+def _gather(offsets: np.ndarray, rows: np.ndarray, caps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """取出多行CSR的前caps个元素（caps与rows一一对应）
+
+    Returns:
+        元素下标和每个元素所属的行在rows中的位置
+    """
+    lengths = np.minimum(offsets[rows + 1] - offsets[rows], caps)
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    starts = np.repeat(offsets[rows] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return starts + np.arange(total), owner
+
+def compute_related(user_ids: np.ndarray, item_ids: np.ndarray, strengths: np.ndarray,
+                    interact_ts: np.ndarray, top_k: int = 50, max_user_items: int = 200,
+                    max_item_users: int = 500, alpha: float = 0.5,
+                    targets: Optional[np.ndarray] = None) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """按共同互动计算每个内容的top-k相关内容
+
+    两个内容的相关分数为共同互动用户的加权和，按Adamic-Adar对活跃用户降权，
+    再按两个内容的互动人数做流行度惩罚：
+        sim(i, j) = Σ_u s_ui * s_uj / log(1 + deg(u)) / (deg(i) * deg(j)) ** alpha
+    每个用户只取最近的max_user_items个内容，每个内容只取最近的max_item_users个用户，
+    控制热门内容和重度用户带来的计算量。每个内容的分数按最大值归一化到(0, 1]。
+
+    Args:
+        user_ids, item_ids, strengths, interact_ts: 关系数组（同一用户和内容的多条关系会合并）
+        targets: 只计算这些内容，None表示全部
+
+    Returns:
+        内容ID -> (相关内容ID, 分数)，按分数从高到低排序
+    """
+    items, item_index = np.unique(item_ids, return_inverse=True)
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    n_items, n_users = len(items), len(users)
+    if not n_items:
+        return {}
+
+    # 合并同一用户和内容的多条关系（如同时点赞和收藏），强度相加，时间取最近
+    pair = user_index.astype(np.int64) * n_items + item_index
+    pairs, inverse = np.unique(pair, return_inverse=True)
+    strength = np.bincount(inverse, weights=strengths)
+    latest = np.full(len(pairs), -np.inf)
+    np.maximum.at(latest, inverse, interact_ts)
+    pair_user, pair_item = pairs // n_items, pairs % n_items
+
+    user_degree = np.bincount(pair_user, minlength=n_users)
+    item_degree = np.bincount(pair_item, minlength=n_items)
+    user_weight = 1.0 / np.log1p(user_degree)
+
+    # 用户 -> 内容（从新到旧），内容 -> 用户（从新到旧）
+    by_user = np.lexsort((-latest, pair_user))
+    user_offsets = _csr(pair_user[by_user], n_users)
+    user_items, user_strength = pair_item[by_user], strength[by_user]
+    by_item = np.lexsort((-latest, pair_item))
+    item_offsets = _csr(pair_item[by_item], n_items)
+    item_users, item_strength = pair_user[by_item], strength[by_item]
+
+    if targets is None:
+        target_index = np.arange(n_items)
+    else:
+        target_index = np.intersect1d(items, np.asarray(targets, dtype=np.int64), return_indices=True)[1]
+
+    related: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+    for a in target_index.tolist():
+        start, end = item_offsets[a], min(item_offsets[a + 1], item_offsets[a] + max_item_users)
+        users_a, strength_a = item_users[start:end], item_strength[start:end]
+        positions, owner = _gather(user_offsets, users_a, np.full(len(users_a), max_user_items))
+        neighbors = user_items[positions]
+        weights = (strength_a * user_weight[users_a])[owner] * user_strength[positions]
+        keep = neighbors != a
+        if not keep.any():
+            continue
+        neighbors, inverse = np.unique(neighbors[keep], return_inverse=True)
+        scores = np.bincount(inverse, weights=weights[keep])
+        scores /= (item_degree[a] * item_degree[neighbors]) ** alpha
+        order = topk(scores, top_k)
+        scores = scores[order]
+        related[int(items[a])] = (items[neighbors[order]], (scores / scores[0]).astype(np.float32))
+    return related
+
+async def build_item_related(session_factory: Callable, relation_types: Sequence[str],
+                             top_k: int = 50, since: Optional[datetime] = None,
+                             batch_size: int = 1000, **params: Any) -> int:
+    """从关系表计算相关内容并写入feature.item_related
+
+    since为None时全量计算并删除不再有相关内容的行；否则只重新计算该时间之后
+    有关系变化的内容（关系图仍全量读取）。
+
+    Returns:
+        写入的内容数量
+    """
+    start_time = time.perf_counter()
+    async with session_factory() as db:
+        # 以数据库时间为准，全量计算后删除本次没有写入的行
+        started_at = (await db.execute(text("SELECT NOW()"))).scalar()
+        rows = (await db.execute(text("""
+            SELECT user_id, entity_id, strength, last_interact_at
+            FROM rel.user_entity_relations
+            WHERE entity_type = 'item' AND status = 'active' AND relation_type = ANY(:relation_types)
+        """), {"relation_types": list(relation_types)})).fetchall()
+        targets = None
+        if since is not None:
+            changed = (await db.execute(text("""
+                SELECT DISTINCT entity_id
+                FROM rel.user_entity_relations
+                WHERE entity_type = 'item' AND relation_type = ANY(:relation_types) AND last_interact_at > :since
+            """), {"relation_types": list(relation_types), "since": since})).fetchall()
+            targets = np.array(sorted(row[0] for row in changed), dtype=np.int64)
+
+    if not rows or (targets is not None and not len(targets)):
+        return 0
+    user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    item_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    strengths = np.fromiter((row[2] if row[2] is not None else 1.0 for row in rows), dtype=np.float64, count=len(rows))
+    interact_ts = np.fromiter((row[3].timestamp() if row[3] is not None else 0.0 for row in rows),
+                              dtype=np.float64, count=len(rows))
+    del rows
+    related = await asyncio.to_thread(compute_related, user_ids, item_ids, strengths, interact_ts,
+                                      top_k=top_k, targets=targets, **params)
+
+    upsert = text("""
+        INSERT INTO feature.item_related (item_id, related_ids, scores, updated_at)
+        VALUES (:item_id, :related_ids, :scores, NOW())
+        ON CONFLICT (item_id) DO UPDATE
+        SET related_ids = EXCLUDED.related_ids, scores = EXCLUDED.scores, updated_at = EXCLUDED.updated_at
+    """)
+    entries = [
+        {"item_id": item_id, "related_ids": ids.tolist(), "scores": scores.tolist()}
+        for item_id, (ids, scores) in related.items()
+    ]
+    async with session_factory() as db:
+        for start in range(0, len(entries), batch_size):
+            await db.execute(upsert, entries[start:start + batch_size])
+        if since is None:
+            await db.execute(text("DELETE FROM feature.item_related WHERE updated_at < :started_at"),
+                             {"started_at": started_at})
+        await db.commit()
+
+    logger.info(f"相关内容计算完成（{'全量' if since is None else '增量'}）: {len(entries)} 个内容, "
+                f"耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    return len(entries)
+
+class ItemRelatedIndex:
+    """相关内容表的内存缓存
+
+    从feature.item_related全量加载，之后按updated_at水位增量刷新。多跳召回在这里
+    按跳数展开：从用户最近互动的内容出发，每一跳沿相关内容扩散并乘以hop_decay。
+    """
+
+    def __init__(self, relation_types: Iterable[str] = ("like", "favorite"),
+                 max_staleness_seconds: float = 3600, overlap_seconds: float = 5.0,
+                 page_size: int = 5000):
+        self.relation_types = set(relation_types)
+        self.max_staleness_seconds = max_staleness_seconds
+        self.overlap_seconds = overlap_seconds
+        self.page_size = page_size
+        self._related: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self.last_full_load_at: Optional[float] = None
+        self._stats = dict.fromkeys(("queries", "refreshes", "refresh_errors", "upserts"), 0)
+
+    def __len__(self) -> int:
+        return len(self._related)
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded or not self._related:
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def supports(self, relation_types: Iterable[str]) -> bool:
+        """相关内容是否按这些关系类型计算"""
+        return set(relation_types) == self.relation_types
+
+    def get(self, item_id: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        return self._related.get(item_id)
+
+    def expand(self, seeds: Sequence[int], max_hops: int, hop_decay: float,
+               frontier_size: int = 200) -> Tuple[np.ndarray, np.ndarray]:
+        """从种子内容按跳数展开
+
+        种子内容本身为第1跳，权重1.0；第h跳的内容权重为上一跳权重 * hop_decay * 相关分数，
+        多条路径的权重相加，种子内容不会在之后的跳中重复出现。每一跳只保留权重最高的
+        frontier_size个内容继续展开。
+
+        Returns:
+            内容ID和权重，按权重从高到低排序
+        """
+        self._stats["queries"] += 1
+        seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+        total_ids, total_weights = [seeds], [np.ones(len(seeds))]
+        frontier_ids, frontier_weights = seeds, np.ones(len(seeds))
+        for _ in range(max_hops - 1):
+            ids, weights = [], []
+            for item_id, weight in zip(frontier_ids.tolist(), frontier_weights.tolist()):
+                entry = self._related.get(item_id)
+                if entry is not None:
+                    ids.append(entry[0])
+                    weights.append(entry[1] * (weight * hop_decay))
+            if not ids:
+                break
+            hop_ids, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+            hop_weights = np.bincount(inverse, weights=np.concatenate(weights))
+            keep = ~np.isin(hop_ids, seeds)
+            hop_ids, hop_weights = hop_ids[keep], hop_weights[keep]
+            total_ids.append(hop_ids)
+            total_weights.append(hop_weights)
+            order = topk(hop_weights, frontier_size)
+            frontier_ids, frontier_weights = hop_ids[order], hop_weights[order]
+
+        item_ids, inverse = np.unique(np.concatenate(total_ids), return_inverse=True)
+        weights = np.bincount(inverse, weights=np.concatenate(total_weights))
+        order = np.lexsort((item_ids, -weights))
+        return item_ids[order], weights[order]
+
+    def _apply(self, related: Dict[int, Tuple[np.ndarray, np.ndarray]], rows: List[Any]) -> Optional[datetime]:
+        watermark = None
+        for row in rows:
+            related[row.item_id] = (np.asarray(row.related_ids, dtype=np.int64),
+                                    np.asarray(row.scores, dtype=np.float32))
+            if row.updated_at is not None and (watermark is None or row.updated_at > watermark):
+                watermark = row.updated_at
+        return watermark
+
+    async def load(self, session_factory: Callable):
+        """全量加载，完成后整体替换"""
+        start_time = time.perf_counter()
+        related: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        watermark = None
+        last_id = 0
+        query = text("""
+            SELECT item_id, related_ids, scores, updated_at
+            FROM feature.item_related
+            WHERE item_id > :last_id
+            ORDER BY item_id
+            LIMIT :limit
+        """)
+        async with session_factory() as db:
+            while True:
+                rows = (await db.execute(query, {"last_id": last_id, "limit": self.page_size})).fetchall()
+                page_watermark = self._apply(related, rows)
+                if page_watermark is not None and (watermark is None or page_watermark > watermark):
+                    watermark = page_watermark
+                if len(rows) < self.page_size:
+                    break
+                last_id = rows[-1].item_id
+
+        async with self._lock:
+            self._related = related
+            self._watermark = watermark
+            self.loaded = True
+            self.last_refresh_at = self.last_full_load_at = time.time()
+
+        logger.info(f"相关内容表加载完成: {len(related)} 个内容, "
+                    f"耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """按updated_at水位增量刷新，返回更新的内容数量"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return len(self)
+
+        query = "SELECT item_id, related_ids, scores, updated_at FROM feature.item_related"
+        params = {}
+        if self._watermark is not None:
+            query += " WHERE updated_at > :since"
+            params["since"] = self._watermark - timedelta(seconds=self.overlap_seconds)
+
+        async with self._lock, session_factory() as db:
+            rows = (await db.execute(text(query), params)).fetchall()
+            watermark = self._apply(self._related, rows)
+            if watermark is not None and (self._watermark is None or watermark > self._watermark):
+                self._watermark = watermark
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+            self._stats["upserts"] += len(rows)
+        return len(rows)
+
+    async def watch(self, session_factory: Callable, interval_seconds: float,
+                    full_reload_seconds: float = 86400):
+        """定期增量刷新，并按间隔全量重载以清理已删除的行"""
+        logger.info(f"开始刷新相关内容表，间隔 {interval_seconds}s，全量重载间隔 {full_reload_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not self.loaded or (full_reload_seconds > 0 and
+                                       time.time() - self.last_full_load_at >= full_reload_seconds):
+                    await self.load(session_factory)
+                else:
+                    await self.refresh(session_factory)
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                logger.error(f"刷新相关内容表失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "items": len(self),
+            "relation_types": sorted(self.relation_types),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            **self._stats,
+        }
+
+# 相关内容按这些关系类型计算，多跳召回配置相同的关系类型时使用
+RELATED_RELATION_TYPES = [t.strip() for t in settings.ITEM_RELATED_RELATION_TYPES.split(",") if t.strip()]
+
+# 全局相关内容表缓存
+item_related_index = ItemRelatedIndex(
+    relation_types=RELATED_RELATION_TYPES,
+    max_staleness_seconds=settings.ITEM_RELATED_MAX_STALENESS_S,
+)
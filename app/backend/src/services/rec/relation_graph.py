@@ -0,0 +1,435 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.batch import topk
+from src.services.rec.related import _csr, _gather
+
+class _Graph:
+    """不可变的CSR关系图
+
+    用户和内容ID映射为连续下标（int32），两个方向各保存一份CSR：
+    用户 -> 内容、内容 -> 用户，每行按互动时间从新到旧排列，
+    边上保存强度（float32）、关系类型编码（int8）和互动时间（uint32秒）。
+    被更新或取消的边把强度置0（墓碑），压缩时清除。
+    """
+
+    __slots__ = ("users", "items", "user_offsets", "user_items", "user_strength", "user_rel", "user_ts",
+                 "item_offsets", "item_users", "item_strength", "item_rel", "item_ts")
+
+    def __init__(self, user_ids: np.ndarray, item_ids: np.ndarray, codes: np.ndarray,
+                 strengths: np.ndarray, ts: np.ndarray):
+        self.users, user_index = np.unique(user_ids, return_inverse=True)
+        self.items, item_index = np.unique(item_ids, return_inverse=True)
+        user_index = user_index.astype(np.int32)
+        item_index = item_index.astype(np.int32)
+        strengths = strengths.astype(np.float32)
+        codes = codes.astype(np.int8)
+        ts = ts.astype(np.uint32)
+        recency = -ts.astype(np.int64)
+
+        by_user = np.lexsort((recency, user_index))
+        self.user_offsets = _csr(user_index[by_user], len(self.users))
+        self.user_items = item_index[by_user]
+        self.user_strength = strengths[by_user]
+        self.user_rel = codes[by_user]
+        self.user_ts = ts[by_user]
+
+        by_item = np.lexsort((recency, item_index))
+        self.item_offsets = _csr(item_index[by_item], len(self.items))
+        self.item_users = user_index[by_item]
+        self.item_strength = strengths[by_item]
+        self.item_rel = codes[by_item]
+        self.item_ts = ts[by_item]
+
+    @classmethod
+    def empty(cls) -> "_Graph":
+        return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8),
+                   np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint32))
+
+    @property
+    def edges(self) -> int:
+        return len(self.user_items)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    @staticmethod
+    def _find(ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """ID到下标，不存在的为-1"""
+        if not len(ids):
+            return np.full(len(values), -1, dtype=np.int64)
+        index = np.searchsorted(ids, values)
+        clipped = np.minimum(index, len(ids) - 1)
+        return np.where(ids[clipped] == values, clipped, -1)
+
+    def user_index(self, user_ids: np.ndarray) -> np.ndarray:
+        return self._find(self.users, user_ids)
+
+    def item_index(self, item_ids: np.ndarray) -> np.ndarray:
+        return self._find(self.items, item_ids)
+
+    def tombstone(self, user_id: int, item_id: int, code: int) -> bool:
+        """把一条边的强度置0，边不存在时返回False"""
+        u = int(self.user_index(np.array([user_id]))[0])
+        i = int(self.item_index(np.array([item_id]))[0])
+        if u < 0 or i < 0:
+            return False
+        start, end = self.user_offsets[u], self.user_offsets[u + 1]
+        hit = np.flatnonzero((self.user_items[start:end] == i) & (self.user_rel[start:end] == code))
+        if not len(hit):
+            return False
+        self.user_strength[start + hit] = 0
+        start, end = self.item_offsets[i], self.item_offsets[i + 1]
+        hit = np.flatnonzero((self.item_users[start:end] == u) & (self.item_rel[start:end] == code))
+        self.item_strength[start + hit] = 0
+        return True
+
+    def alive_edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """未被置0的边（用户ID、内容ID、关系类型、强度、时间）"""
+        owner = np.repeat(np.arange(len(self.users)), np.diff(self.user_offsets))
+        alive = self.user_strength > 0
+        return (self.users[owner[alive]], self.items[self.user_items[alive]], self.user_rel[alive],
+                self.user_strength[alive], self.user_ts[alive])
+
+class RelationGraph:
+    """用户-内容关系图的内存副本，供多跳召回在内存中游走
+
+    从rel.user_entity_relations加载有效的内容关系（按relation_types过滤）构建CSR，
+    之后按last_interact_at水位增量刷新。/relations/upsert写入的关系通过apply立即追加，
+    新边先放在增量表中，累计超过compact_threshold条后与CSR合并重建。
+
+    多跳查询是从用户最近互动内容出发的有界随机游走（截断的个性化PageRank）：
+    种子内容为第1跳，权重1.0；每一跳沿 内容 -> 用户 -> 内容 按强度归一化转移，
+    并乘以hop_decay，共max_hops跳，与递归SQL的跳数和衰减含义一致。
+    每行只取最近的max_item_users / max_user_items条边，每一跳只保留frontier_size个节点。
+    """
+
+    def __init__(self, relation_types: Iterable[str] = ("like", "favorite"),
+                 max_user_items: int = 200, max_item_users: int = 500,
+                 compact_threshold: int = 50000, max_staleness_seconds: float = 600,
+                 overlap_seconds: float = 5.0, page_size: int = 50000):
+        self.relation_types = sorted(set(relation_types))
+        self._codes = {relation_type: code for code, relation_type in enumerate(self.relation_types)}
+        self.max_user_items = max_user_items
+        self.max_item_users = max_item_users
+        self.compact_threshold = compact_threshold
+        self.max_staleness_seconds = max_staleness_seconds
+        self.overlap_seconds = overlap_seconds
+        self.page_size = page_size
+        self._graph = _Graph.empty()
+        # 增量边：用户ID -> {(内容ID, 关系类型编码): (强度, 时间)}，内容侧同理
+        self._user_delta: Dict[int, Dict[Tuple[int, int], Tuple[float, int]]] = {}
+        self._item_delta: Dict[int, Dict[Tuple[int, int], Tuple[float, int]]] = {}
+        self._delta_edges = 0
+        # 重建期间写入的关系，重建完成后在新图上重放
+        self._journal: Optional[List[Tuple[int, int, str, float, bool, int]]] = None
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self.last_full_load_at: Optional[float] = None
+        self._stats = dict.fromkeys(("queries", "refreshes", "refresh_errors", "appends", "compactions"), 0)
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded or not (self._graph.edges or self._delta_edges):
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def supports(self, relation_types: Iterable[str]) -> bool:
+        """关系图是否按这些关系类型加载"""
+        return sorted(set(relation_types)) == self.relation_types
+
+    def apply(self, user_id: int, item_id: int, relation_type: str, strength: float = 1.0,
+              active: bool = True, interact_ts: Optional[float] = None) -> bool:
+        """写入或取消一条关系，不在relation_types中的关系忽略
+
+        Returns:
+            bool: 是否影响关系图
+        """
+        code = self._codes.get(relation_type)
+        if code is None:
+            return False
+        ts = int(interact_ts if interact_ts is not None else time.time())
+        if self._journal is not None:
+            self._journal.append((user_id, item_id, relation_type, strength, active, ts))
+        self._apply(user_id, item_id, code, strength, active, ts)
+        self._stats["appends"] += 1
+        return True
+
+    def _apply(self, user_id: int, item_id: int, code: int, strength: float, active: bool, ts: int):
+        self._graph.tombstone(user_id, item_id, code)
+        user_edges = self._user_delta.setdefault(user_id, {})
+        item_edges = self._item_delta.setdefault(item_id, {})
+        existed = user_edges.pop((item_id, code), None) is not None
+        item_edges.pop((user_id, code), None)
+        self._delta_edges -= existed
+        if active and strength and strength > 0:
+            user_edges[(item_id, code)] = (float(strength), ts)
+            item_edges[(user_id, code)] = (float(strength), ts)
+            self._delta_edges += 1
+        if not user_edges:
+            del self._user_delta[user_id]
+        if not item_edges:
+            del self._item_delta[item_id]
+
+    def seed_items(self, user_id: int, limit: int) -> np.ndarray:
+        """用户最近互动的内容（第1跳），同一内容多种关系只算一次"""
+        graph = self._graph
+        ids, ts = [], []
+        u = int(graph.user_index(np.array([user_id]))[0])
+        if u >= 0:
+            start, end = graph.user_offsets[u], graph.user_offsets[u + 1]
+            alive = graph.user_strength[start:end] > 0
+            ids.append(graph.items[graph.user_items[start:end][alive]])
+            ts.append(graph.user_ts[start:end][alive].astype(np.int64))
+        delta = self._user_delta.get(user_id)
+        if delta:
+            ids.append(np.array([item_id for item_id, _ in delta], dtype=np.int64))
+            ts.append(np.array([edge[1] for edge in delta.values()], dtype=np.int64))
+        if not ids:
+            return np.zeros(0, dtype=np.int64)
+        ids, ts = np.concatenate(ids), np.concatenate(ts)
+        ids = ids[np.argsort(-ts, kind="stable")]
+        return np.array(list(dict.fromkeys(ids.tolist()))[:limit], dtype=np.int64)
+
+    def _step(self, ids: np.ndarray, mass: np.ndarray, from_items: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """沿一个方向走一步：每个节点的质量按边强度分给最近的邻居
+
+        Returns:
+            邻居ID和分到的质量（未排序）
+        """
+        graph = self._graph
+        if from_items:
+            rows, offsets, neighbors, neighbor_ids, strength = (
+                graph.item_index(ids), graph.item_offsets, graph.item_users, graph.users, graph.item_strength)
+            delta, cap = self._item_delta, self.max_item_users
+        else:
+            rows, offsets, neighbors, neighbor_ids, strength = (
+                graph.user_index(ids), graph.user_offsets, graph.user_items, graph.items, graph.user_strength)
+            delta, cap = self._user_delta, self.max_user_items
+
+        # 增量边是最新的，先取；CSR中的边补足到cap
+        delta_owner, delta_neighbors, delta_strength = [], [], []
+        caps = np.full(len(ids), cap)
+        for position, node_id in enumerate(ids.tolist()):
+            edges = delta.get(node_id)
+            if not edges:
+                continue
+            recent = sorted(edges.items(), key=lambda edge: -edge[1][1])[:cap]
+            caps[position] -= len(recent)
+            for (neighbor, _), (edge_strength, _) in recent:
+                delta_owner.append(position)
+                delta_neighbors.append(neighbor)
+                delta_strength.append(edge_strength)
+
+        found = np.flatnonzero(rows >= 0)
+        positions, owner = _gather(offsets, rows[found], caps[found])
+        owner = np.concatenate([found[owner], np.array(delta_owner, dtype=np.int64)])
+        targets = np.concatenate([neighbor_ids[neighbors[positions]], np.array(delta_neighbors, dtype=np.int64)])
+        weights = np.concatenate([strength[positions].astype(np.float64), np.array(delta_strength)])
+        if not len(targets):
+            return targets, weights
+
+        row_sum = np.bincount(owner, weights=weights, minlength=len(ids))
+        weights = mass[owner] * weights / np.maximum(row_sum[owner], 1e-12)
+        targets, inverse = np.unique(targets, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights)
+        keep = weights > 0
+        return targets[keep], weights[keep]
+
+    def expand(self, user_id: int, max_hops: int, hop_decay: float, frontier_size: int = 200,
+               max_seed_items: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        """从用户最近互动的内容出发按跳数游走
+
+        种子内容为第1跳，权重1.0；第h跳的内容权重为上一跳权重 * hop_decay * 转移概率，
+        多条路径的权重相加。种子内容不会在之后的跳中出现，查询用户本身不参与游走。
+
+        Returns:
+            内容ID和权重，按权重从高到低排序（包括种子内容）
+        """
+        self._stats["queries"] += 1
+        seeds = self.seed_items(user_id, max_seed_items)
+        if not len(seeds):
+            return seeds, np.zeros(0)
+        total_ids, total_weights = [seeds], [np.ones(len(seeds))]
+        frontier_ids, frontier_weights = seeds, np.ones(len(seeds))
+        for _ in range(max_hops - 1):
+            users, user_weights = self._step(frontier_ids, frontier_weights, from_items=True)
+            keep = users != user_id
+            users, user_weights = users[keep], user_weights[keep]
+            if not len(users):
+                break
+            order = topk(user_weights, frontier_size)
+            hop_ids, hop_weights = self._step(users[order], user_weights[order], from_items=False)
+            keep = ~np.isin(hop_ids, seeds)
+            hop_ids, hop_weights = hop_ids[keep], hop_weights[keep] * hop_decay
+            if not len(hop_ids):
+                break
+            total_ids.append(hop_ids)
+            total_weights.append(hop_weights)
+            order = topk(hop_weights, frontier_size)
+            frontier_ids, frontier_weights = hop_ids[order], hop_weights[order]
+
+        item_ids, inverse = np.unique(np.concatenate(total_ids), return_inverse=True)
+        weights = np.bincount(inverse, weights=np.concatenate(total_weights))
+        order = np.lexsort((item_ids, -weights))
+        return item_ids[order], weights[order]
+
+    def _delta_arrays(self) -> Tuple[np.ndarray, ...]:
+        edges = [(user_id, item_id, code, strength, ts)
+                 for user_id, user_edges in self._user_delta.items()
+                 for (item_id, code), (strength, ts) in user_edges.items()]
+        if not edges:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8),
+                    np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint32))
+        user_ids, item_ids, codes, strengths, ts = zip(*edges)
+        return (np.array(user_ids, dtype=np.int64), np.array(item_ids, dtype=np.int64),
+                np.array(codes, dtype=np.int8), np.array(strengths, dtype=np.float32),
+                np.array(ts, dtype=np.uint32))
+
+    async def _rebuild(self, build: Callable[[], _Graph]):
+        """在线程中构建新图并替换，期间通过apply写入的关系在新图上重放"""
+        self._journal = []
+        try:
+            graph = await asyncio.to_thread(build)
+        except BaseException:
+            self._journal = None
+            raise
+        journal, self._journal = self._journal, None
+        self._graph = graph
+        self._user_delta, self._item_delta, self._delta_edges = {}, {}, 0
+        for user_id, item_id, relation_type, strength, active, ts in journal:
+            self._apply(user_id, item_id, self._codes[relation_type], strength, active, ts)
+
+    async def compact(self):
+        """把增量边合并进CSR"""
+        base = self._graph.alive_edges()
+        delta = self._delta_arrays()
+        await self._rebuild(lambda: _Graph(*(np.concatenate(pair) for pair in zip(base, delta))))
+        self._stats["compactions"] += 1
+
+    async def load(self, session_factory: Callable):
+        """全量加载，完成后整体替换"""
+        start_time = time.perf_counter()
+        user_ids, item_ids, codes, strengths, ts = [], [], [], [], []
+        watermark = None
+        cursor = (0, 0, "")
+        query = text("""
+            SELECT user_id, entity_id, relation_type, strength, last_interact_at
+            FROM rel.user_entity_relations
+            WHERE entity_type = 'item' AND status = 'active' AND relation_type = ANY(:relation_types)
+              AND (user_id, entity_id, relation_type) > (:user_id, :entity_id, :relation_type)
+            ORDER BY user_id, entity_id, relation_type
+            LIMIT :limit
+        """)
+        async with self._lock:
+            async with session_factory() as db:
+                while True:
+                    rows = (await db.execute(query, {
+                        "relation_types": list(self.relation_types),
+                        "user_id": cursor[0], "entity_id": cursor[1], "relation_type": cursor[2],
+                        "limit": self.page_size,
+                    })).fetchall()
+                    for row in rows:
+                        user_ids.append(row.user_id)
+                        item_ids.append(row.entity_id)
+                        codes.append(self._codes[row.relation_type])
+                        strengths.append(row.strength if row.strength is not None else 1.0)
+                        ts.append(row.last_interact_at.timestamp() if row.last_interact_at is not None else 0)
+                        if row.last_interact_at is not None and (watermark is None or row.last_interact_at > watermark):
+                            watermark = row.last_interact_at
+                    if len(rows) < self.page_size:
+                        break
+                    cursor = (rows[-1].user_id, rows[-1].entity_id, rows[-1].relation_type)
+
+            arrays = (np.array(user_ids, dtype=np.int64), np.array(item_ids, dtype=np.int64),
+                      np.array(codes, dtype=np.int8), np.array(strengths, dtype=np.float32),
+                      np.array(ts, dtype=np.uint32))
+            del user_ids, item_ids, codes, strengths, ts
+            await self._rebuild(lambda: _Graph(*arrays))
+            self._watermark = watermark
+            self.loaded = True
+            self.last_refresh_at = self.last_full_load_at = time.time()
+
+        logger.info(f"关系图加载完成: {len(self._graph.users)} 个用户, {len(self._graph.items)} 个内容, "
+                    f"{self._graph.edges} 条边, 耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """按last_interact_at水位拉取变化的关系（包括取消的），返回拉取的行数"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return self._graph.edges
+
+        query = """
+            SELECT user_id, entity_id, relation_type, status, strength, last_interact_at
+            FROM rel.user_entity_relations
+            WHERE entity_type = 'item' AND relation_type = ANY(:relation_types)
+        """
+        params: Dict[str, Any] = {"relation_types": list(self.relation_types)}
+        if self._watermark is not None:
+            query += " AND last_interact_at > :since"
+            params["since"] = self._watermark - timedelta(seconds=self.overlap_seconds)
+
+        async with self._lock:
+            async with session_factory() as db:
+                rows = (await db.execute(text(query), params)).fetchall()
+            for row in rows:
+                ts = row.last_interact_at.timestamp() if row.last_interact_at is not None else None
+                self.apply(row.user_id, row.entity_id, row.relation_type,
+                           row.strength if row.strength is not None else 1.0,
+                           active=row.status == "active", interact_ts=ts)
+                if row.last_interact_at is not None and (self._watermark is None or row.last_interact_at > self._watermark):
+                    self._watermark = row.last_interact_at
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+            if self._delta_edges >= self.compact_threshold:
+                await self.compact()
+        return len(rows)
+
+    async def watch(self, session_factory: Callable, interval_seconds: float,
+                    full_reload_seconds: float = 86400):
+        """定期增量刷新，并按间隔全量重载"""
+        logger.info(f"开始刷新关系图，间隔 {interval_seconds}s，全量重载间隔 {full_reload_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not self.loaded or (full_reload_seconds > 0 and
+                                       time.time() - self.last_full_load_at >= full_reload_seconds):
+                    await self.load(session_factory)
+                else:
+                    await self.refresh(session_factory)
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                logger.error(f"刷新关系图失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        graph = self._graph
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "users": len(graph.users),
+            "items": len(graph.items),
+            "edges": graph.edges,
+            "tombstones": int((graph.user_strength == 0).sum()),
+            "delta_edges": self._delta_edges,
+            "memory_bytes": graph.nbytes,
+            "relation_types": self.relation_types,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            **self._stats,
+        }
+
+# 全局关系图，多跳召回配置相同的关系类型时使用
+relation_graph = RelationGraph(
+    relation_types=[t.strip() for t in settings.RELATION_GRAPH_RELATION_TYPES.split(",") if t.strip()],
+    max_staleness_seconds=settings.RELATION_GRAPH_MAX_STALENESS_S,
+)
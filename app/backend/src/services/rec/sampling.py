@@ -0,0 +1,94 @@
+from typing import Dict, List, Any, Optional, Sequence, Union
+import hashlib
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.catalog import item_catalog
+
+def seed_value(seed: Union[int, str, None]) -> Optional[int]:
+    """把配置或cursor中的种子转换为整数，字符串按MD5取值，保证各进程一致"""
+    if seed is None or seed == "":
+        return None
+    if isinstance(seed, int):
+        return seed
+    return int(hashlib.md5(str(seed).encode("utf-8")).hexdigest()[:15], 16)
+
+def sample_positions(n: int, count: int, offset: int = 0, seed: Optional[int] = None) -> np.ndarray:
+    """从[0, n)中无放回抽取位置
+
+    有种子时取种子确定的随机排列中第offset到offset+count个位置：部分Fisher–Yates
+    只交换前offset+count个位置，被交换的位置记在字典中，不需要复制整个数组。
+    同一种子的各页首尾相接、互不重复。无种子时忽略offset。
+    """
+    if seed is None:
+        return np.random.default_rng().choice(n, size=min(count, n), replace=False)
+    end = min(offset + count, n)
+    if offset >= end:
+        return np.zeros(0, dtype=np.int64)
+    draws = np.random.default_rng(seed).random(end).tolist()
+    swapped = {}
+    positions = np.empty(end - offset, dtype=np.int64)
+    for k in range(end):
+        j = min(k + int(draws[k] * (n - k)), n - 1)
+        value = swapped.get(j, j)
+        swapped[j] = swapped.get(k, k)
+        if k >= offset:
+            positions[k - offset] = value
+    return positions
+
+async def _sample_from_db(db: AsyncSession, kinds: Optional[Sequence[str]], count: int,
+                          offset: int, seed: Optional[int]) -> List[int]:
+    """目录不可用时用TABLESAMPLE抽取一批ID，再在内存中按种子排列
+
+    抽样比例只取决于表的估计行数，同一种子的各页得到同一批样本，分页仍然稳定。
+    """
+    estimated = (await db.execute(text(
+        "SELECT reltuples FROM pg_class WHERE oid = 'app.items'::regclass"
+    ))).scalar() or 0
+    target = settings.RANDOM_SAMPLE_DB_ROWS
+    where = " WHERE kind = ANY(:kinds)" if kinds else ""
+    params: Dict[str, Any] = {"kinds": list(kinds)} if kinds else {}
+    if estimated > target:
+        params["percent"] = round(100.0 * target / estimated, 4)
+        params["repeat"] = float(seed % 2147483647) if seed is not None else float(np.random.default_rng().integers(2147483647))
+        query = f"SELECT id FROM app.items TABLESAMPLE SYSTEM (:percent) REPEATABLE (:repeat){where} ORDER BY id"
+    else:
+        query = f"SELECT id FROM app.items{where} ORDER BY id"
+    ids = [row[0] for row in (await db.execute(text(query), params)).fetchall()]
+    return [ids[i] for i in sample_positions(len(ids), count, offset, seed).tolist()]
+
+async def sample_item_ids(db: AsyncSession, kinds: Optional[Sequence[str]], count: int,
+                          offset: int = 0, seed: Union[int, str, None] = None,
+                          exclude: Optional[np.ndarray] = None) -> List[int]:
+    """随机抽取内容ID
+
+    优先在内容目录的按类型ID数组上抽样，目录不完整时回退到TABLESAMPLE。
+
+    Args:
+        kinds: 内容类型，None或空表示全部类型
+        seed: 随机种子，相同种子和offset得到相同的结果，用于分页
+        exclude: 跳过的内容ID。无种子时多抽同样数量后跳过，仍返回count个；有种子时
+            只在第offset到offset+count个位置中跳过，保证各页的位置区间不变
+    """
+    seed = seed_value(seed)
+    skip = len(exclude) if exclude is not None else 0
+    size = count + skip if seed is None else count
+    pools = item_catalog.kind_pools(kinds or None)
+    if pools is None:
+        logger.debug("内容目录不可用，随机抽样回退到TABLESAMPLE")
+        ids = await _sample_from_db(db, kinds, size, offset, seed)
+    else:
+        sizes = np.array([len(pool) for pool in pools], dtype=np.int64)
+        positions = sample_positions(int(sizes.sum()), size, offset, seed)
+        # 在多个类型的ID数组拼接成的虚拟数组上定位，避免拼接
+        bounds = np.cumsum(sizes)
+        owners = np.searchsorted(bounds, positions, side="right")
+        local = positions - (bounds - sizes)[owners]
+        ids = [int(pools[owner][index]) for owner, index in zip(owners.tolist(), local.tolist())]
+    if skip:
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[~np.isin(ids, exclude)][:count].tolist()
+    return ids
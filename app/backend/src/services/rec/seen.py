@@ -0,0 +1,388 @@
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import math
+import time
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.node_cache import RedisL2
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+def _probe(item_ids: np.ndarray, hashes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """计算内容在布隆过滤器中的位置
+
+    splitmix64哈希拆成两个32位哈希做双重哈希。位数组长度为2的幂，位置对长度取模
+    只影响字节下标，同一组哈希可用于所有过滤器。不足8个哈希时补齐为8列（掩码为0），
+    每个内容的8个掩码字节可以作为一个uint64整体比较。
+
+    Returns:
+        字节下标（未取模）和字节内的位掩码，形状均为(内容数, 8)
+    """
+    x = np.asarray(item_ids, dtype=np.int64).astype(np.uint64) + _GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    x = x ^ (x >> np.uint64(31))
+    h1 = (x & np.uint64(0xFFFFFFFF)).astype(np.int64)
+    h2 = ((x >> np.uint64(32)) | np.uint64(1)).astype(np.int64)
+    positions = h1[:, None] + np.arange(hashes, dtype=np.int64) * h2[:, None]
+    byte = np.zeros((len(h1), 8), dtype=np.int64)
+    mask = np.zeros((len(h1), 8), dtype=np.uint8)
+    byte[:, :hashes] = positions >> 3
+    mask[:, :hashes] = np.left_shift(1, positions & 7)
+    return byte, mask
+
+class BloomFilter:
+    """定长布隆过滤器，位数组为2的幂"""
+
+    __slots__ = ("bits", "capacity", "count")
+
+    def __init__(self, capacity: int, error_rate: float, hashes: int,
+                 bits: Optional[np.ndarray] = None, count: int = 0):
+        self.capacity = capacity
+        if bits is None:
+            # 哈希个数固定时达到目标误判率需要的每项位数
+            bits_per_item = -hashes / math.log(1 - error_rate ** (1 / hashes))
+            size = 1 << max(6, math.ceil(math.log2(capacity * bits_per_item)))
+            bits = np.zeros(size // 8, dtype=np.uint8)
+        self.bits = bits
+        self.count = count
+
+    def contains(self, byte: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        found = self.bits.take(byte & (len(self.bits) - 1))
+        found &= mask
+        return found.view(np.uint64).ravel() == mask.view(np.uint64).ravel()
+
+    def add(self, byte: np.ndarray, mask: np.ndarray):
+        np.bitwise_or.at(self.bits, (byte & (len(self.bits) - 1)).ravel(), mask.ravel())
+        self.count += len(byte)
+
+class SeenBucket:
+    """一个时间桶内看过的内容
+
+    可扩展布隆过滤器：写满后追加容量翻倍、误判率减半的过滤器（从error_rate / 2开始），
+    总误判率不超过error_rate，内存随实际写入量增长。
+    """
+
+    __slots__ = ("filters",)
+
+    def __init__(self, filters: Optional[List[BloomFilter]] = None):
+        self.filters = filters or []
+
+    def contains(self, byte: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        found = self.filters[0].contains(byte, mask) if self.filters else np.zeros(len(byte), dtype=bool)
+        for bloom in self.filters[1:]:
+            found |= bloom.contains(byte, mask)
+        return found
+
+    def add(self, byte: np.ndarray, mask: np.ndarray, hashes: int, initial_capacity: int, error_rate: float):
+        fresh = ~self.contains(byte, mask)
+        byte, mask = byte[fresh], mask[fresh]
+        while len(byte):
+            if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+                capacity = self.filters[-1].capacity * 2 if self.filters else initial_capacity
+                self.filters.append(BloomFilter(capacity, error_rate / 2 ** (len(self.filters) + 1), hashes))
+            bloom = self.filters[-1]
+            room = bloom.capacity - bloom.count
+            bloom.add(byte[:room], mask[:room])
+            byte, mask = byte[room:], mask[room:]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.bits.nbytes for bloom in self.filters)
+
+class _UserSeen:
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        self.buckets: Dict[int, SeenBucket] = {}
+
+    def add(self, bucket_ids: np.ndarray, item_ids: np.ndarray, hashes: int,
+            initial_capacity: int, error_rate: float):
+        byte, mask = _probe(item_ids, hashes)
+        for bucket_id in np.unique(bucket_ids).tolist():
+            rows = bucket_ids == bucket_id
+            bucket = self.buckets.get(bucket_id)
+            if bucket is None:
+                bucket = self.buckets[bucket_id] = SeenBucket()
+            bucket.add(byte[rows], mask[rows], hashes, initial_capacity, error_rate)
+
+    def contains(self, item_ids: np.ndarray, first_bucket: int, hashes: int) -> np.ndarray:
+        byte, mask = _probe(item_ids, hashes)
+        found = np.zeros(len(item_ids), dtype=bool)
+        for bucket_id, bucket in self.buckets.items():
+            if bucket_id >= first_bucket:
+                found |= bucket.contains(byte, mask)
+        return found
+
+    def expire(self, first_bucket: int):
+        for bucket_id in [bucket_id for bucket_id in self.buckets if bucket_id < first_bucket]:
+            del self.buckets[bucket_id]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bucket.nbytes for bucket in self.buckets.values())
+
+    def dumps(self, last_event_id: int, hashes: int) -> bytes:
+        header = {
+            "last_event_id": last_event_id,
+            "hashes": hashes,
+            "buckets": [[bucket_id, [[bloom.capacity, bloom.count, bloom.bits.nbytes] for bloom in bucket.filters]]
+                        for bucket_id, bucket in self.buckets.items()],
+        }
+        payload = b"".join(bloom.bits.tobytes() for bucket in self.buckets.values() for bloom in bucket.filters)
+        return json.dumps(header).encode("utf-8") + b"\n" + payload
+
+    @classmethod
+    def loads(cls, raw: bytes, hashes: int) -> Tuple["_UserSeen", int]:
+        """解析快照，哈希个数与当前配置不同时抛出ValueError"""
+        header, payload = raw.split(b"\n", 1)
+        header = json.loads(header)
+        if header["hashes"] != hashes:
+            raise ValueError(f"哈希个数不一致: {header['hashes']} != {hashes}")
+        seen = cls()
+        offset = 0
+        for bucket_id, filters in header["buckets"]:
+            blooms = []
+            for capacity, count, nbytes in filters:
+                bits = np.frombuffer(payload, dtype=np.uint8, count=nbytes, offset=offset).copy()
+                blooms.append(BloomFilter(capacity, 0.0, hashes, bits=bits, count=count))
+                offset += nbytes
+            seen.buckets[bucket_id] = SeenBucket(blooms)
+        return seen, header["last_event_id"]
+
+class SeenHistory:
+    """用户看过的内容（按时间分桶的布隆过滤器）
+
+    每个用户按bucket_seconds分桶，每个桶是一个可扩展布隆过滤器，超出窗口的桶整体丢弃。
+    查询按桶粒度覆盖时间窗口（最多多包含一个桶的更早记录），布隆过滤器的误判
+    会多过滤少量没看过的内容，不会漏过看过的内容。
+
+    用户首次查询时从app.events加载窗口内的记录（开启l2时先读Redis中的快照，
+    再补齐快照之后的事件），之后常驻内存并按LRU淘汰：
+    - 本进程写入的事件在/events接口中直接记录
+    - 其他进程写入的事件按events.id水位定期拉取
+    """
+
+    def __init__(self, event_types: Iterable[str] = ("impression", "click"),
+                 window_seconds: float = 7 * 86400, bucket_seconds: float = 86400,
+                 max_users: int = 50000, initial_capacity: int = 256, error_rate: float = 0.01,
+                 max_staleness_seconds: float = 60, l2: Optional[RedisL2] = None):
+        self.event_types = set(event_types)
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.max_users = max_users
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        # 最多8个哈希，误判率更低时通过增加位数达到
+        self.hashes = min(8, max(1, math.ceil(-math.log2(error_rate))))
+        self.max_staleness_seconds = max_staleness_seconds
+        self.l2 = l2
+        self._users: "OrderedDict[int, _UserSeen]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._last_id = 0
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self._stats = dict.fromkeys(("queries", "user_hits", "user_loads", "l2_hits", "records",
+                                     "evictions", "refreshes", "refresh_errors", "events"), 0)
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded:
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def supports(self, event_types: Iterable[str], window_seconds: float) -> bool:
+        """是否按这些事件类型记录，且保留的时间足够覆盖窗口"""
+        return set(event_types) == self.event_types and window_seconds <= self.window_seconds
+
+    def _bucket(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds)
+
+    def _add(self, seen: _UserSeen, item_ids: np.ndarray, ts: np.ndarray):
+        seen.add((ts // self.bucket_seconds).astype(np.int64), item_ids, self.hashes,
+                 self.initial_capacity, self.error_rate)
+
+    def record(self, user_id: Optional[int], item_id: Optional[int], event_type: str,
+               ts: Optional[float] = None) -> bool:
+        """事件写入后记录，只更新已在内存中的用户（其他用户首次查询时从数据库加载）"""
+        if user_id is None or item_id is None or event_type not in self.event_types:
+            return False
+        seen = self._users.get(user_id)
+        if seen is None:
+            return False
+        self._add(seen, np.array([item_id], dtype=np.int64), np.array([ts if ts is not None else time.time()]))
+        self._stats["records"] += 1
+        return True
+
+    async def seen_mask(self, db: AsyncSession, user_id: int, item_ids: np.ndarray,
+                        window_seconds: float) -> np.ndarray:
+        """候选项是否在窗口内看过"""
+        self._stats["queries"] += 1
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            await asyncio.shield(loading)
+        seen = self._users.get(user_id)
+        if seen is None:
+            seen = await self._load_user(db, user_id)
+        else:
+            self._users.move_to_end(user_id)
+            self._stats["user_hits"] += 1
+        return seen.contains(np.asarray(item_ids, dtype=np.int64), self._bucket(time.time() - window_seconds),
+                             self.hashes)
+
+    async def _load_user(self, db: AsyncSession, user_id: int) -> _UserSeen:
+        """加载用户窗口内的记录
+
+        先放入空记录再查询，查询期间拉取或写入的事件直接记在这条记录上，不会遗漏；
+        重复写入对布隆过滤器没有影响。
+        """
+        seen = _UserSeen()
+        self._users[user_id] = seen
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self._stats["evictions"] += 1
+        done = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = done
+        try:
+            await self._fill(db, user_id, seen)
+        except BaseException:
+            if self._users.get(user_id) is seen:
+                del self._users[user_id]
+            raise
+        finally:
+            if self._loading.get(user_id) is done:
+                del self._loading[user_id]
+            # 等待方随后检查用户是否已加载，失败时自行重新加载
+            if not done.done():
+                done.set_result(None)
+        return seen
+
+    async def _fill(self, db: AsyncSession, user_id: int, seen: _UserSeen):
+        self._stats["user_loads"] += 1
+        last_id = self._last_id
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.window_seconds + self.bucket_seconds)
+        query = """
+            SELECT item_id, EXTRACT(EPOCH FROM ts) AS ts
+            FROM app.events
+            WHERE user_id = :user_id AND event_type = ANY(:event_types) AND item_id IS NOT NULL AND ts >= :since
+        """
+        params: Dict[str, Any] = {"user_id": user_id, "event_types": sorted(self.event_types), "since": since}
+
+        cached = await self.l2.get_raw(str(user_id)) if self.l2 is not None else None
+        if cached is not None:
+            try:
+                snapshot, snapshot_id = _UserSeen.loads(cached, self.hashes)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"用户 {user_id} 的已看记录快照无法解析: {str(e)}")
+            else:
+                # 快照之后的事件从数据库补齐
+                for bucket_id, bucket in snapshot.buckets.items():
+                    target = seen.buckets.setdefault(bucket_id, SeenBucket())
+                    target.filters = bucket.filters + target.filters
+                query += " AND id > :since_id"
+                params["since_id"] = snapshot_id
+                self._stats["l2_hits"] += 1
+
+        rows = (await db.execute(text(query), params)).fetchall()
+        if rows:
+            self._add(seen, np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+                      np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(rows)))
+        seen.expire(self._bucket(time.time() - self.window_seconds))
+        if self.l2 is not None and (cached is None or rows):
+            await self.l2.set_raw(str(user_id), seen.dumps(last_id, self.hashes), self.bucket_seconds)
+
+    async def load(self, session_factory: Callable):
+        """清空内存并从当前的events.id开始拉取，用户的历史在首次查询时加载"""
+        async with self._lock, session_factory() as db:
+            max_id = (await db.execute(text("SELECT COALESCE(MAX(id), 0) FROM app.events"))).scalar()
+            self._users.clear()
+            self._last_id = max_id
+            self.loaded = True
+            self.last_refresh_at = time.time()
+        logger.info(f"已看记录从事件 {max_id} 开始拉取")
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """拉取水位之后的事件，记录到已在内存中的用户，返回拉取的事件数"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return 0
+
+        async with self._lock, session_factory() as db:
+            max_id = (await db.execute(text("SELECT COALESCE(MAX(id), 0) FROM app.events"))).scalar()
+            rows = []
+            if max_id > self._last_id:
+                rows = (await db.execute(text("""
+                    SELECT user_id, item_id, EXTRACT(EPOCH FROM ts) AS ts
+                    FROM app.events
+                    WHERE id > :last_id AND id <= :max_id AND event_type = ANY(:event_types)
+                      AND user_id IS NOT NULL AND item_id IS NOT NULL
+                """), {"last_id": self._last_id, "max_id": max_id,
+                       "event_types": sorted(self.event_types)})).fetchall()
+            by_user: Dict[int, List[Tuple[int, float]]] = {}
+            for row in rows:
+                if row[0] in self._users:
+                    by_user.setdefault(row[0], []).append((row[1], float(row[2])))
+            for user_id, events in by_user.items():
+                seen = self._users.get(user_id)
+                if seen is not None:
+                    item_ids, ts = zip(*events)
+                    self._add(seen, np.array(item_ids, dtype=np.int64), np.array(ts))
+            first_bucket = self._bucket(time.time() - self.window_seconds)
+            for seen in self._users.values():
+                seen.expire(first_bucket)
+            self._last_id = max(self._last_id, max_id)
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+            self._stats["events"] += len(rows)
+        return len(rows)
+
+    async def watch(self, session_factory: Callable, interval_seconds: float):
+        """定期拉取新事件"""
+        logger.info(f"开始拉取已看记录，间隔 {interval_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.refresh(session_factory)
+            except Exception as e:
+                # 超过最大陈旧时间后过滤节点查询数据库
+                self._stats["refresh_errors"] += 1
+                logger.error(f"拉取已看记录失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "users": len(self._users),
+            "loading": len(self._loading),
+            "memory_bytes": sum(seen.nbytes for seen in self._users.values()),
+            "event_types": sorted(self.event_types),
+            "window_seconds": self.window_seconds,
+            "bucket_seconds": self.bucket_seconds,
+            "last_event_id": self._last_id,
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            "l2_available": self.l2.available if self.l2 is not None else None,
+            **self._stats,
+        }
+
+# 全局已看记录
+seen_history = SeenHistory(
+    event_types=[t.strip() for t in settings.SEEN_HISTORY_EVENT_TYPES.split(",") if t.strip()],
+    window_seconds=settings.SEEN_HISTORY_WINDOW_S,
+    bucket_seconds=settings.SEEN_HISTORY_BUCKET_S,
+    max_users=settings.SEEN_HISTORY_MAX_USERS,
+    error_rate=settings.SEEN_HISTORY_ERROR_RATE,
+    max_staleness_seconds=settings.SEEN_HISTORY_MAX_STALENESS_S,
+    l2=RedisL2(settings.REDIS_URL, timeout_ms=settings.REC_NODE_CACHE_REDIS_TIMEOUT_MS, prefix="rec:seen:")
+    if settings.SEEN_HISTORY_L2_ENABLED else None,
+)
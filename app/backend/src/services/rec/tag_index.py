@@ -0,0 +1,178 @@
+from typing import Dict, List, Any, Optional, Iterable, Set, Tuple
+import numpy as np
+
+from src.core.logger import logger
+from src.services.rec.batch import tag_vocab
+from src.services.rec.catalog import CatalogItem, item_catalog
+
+class TagIndex:
+    """标签倒排索引
+
+    词表标签ID -> 倒排列表，倒排列表按内容新鲜度（created_at）从新到旧排序。
+    每个内容分配一个槽位，倒排列表保存槽位，槽位数组保存内容ID和创建时间。
+    订阅内容目录的变化增量更新：变化的标签只标记为脏，查询时再重建有序数组。
+    """
+
+    def __init__(self, kinds: Iterable[str] = ("content",)):
+        self.kinds = set(kinds)
+        self._reset()
+
+    def _reset(self):
+        self._slot_of: Dict[int, int] = {}
+        self._slot_item_ids: List[int] = []
+        self._slot_created: List[float] = []
+        self._slot_tags: List[Tuple[int, ...]] = []
+        self._members: Dict[int, Set[int]] = {}
+        self._postings: Dict[int, np.ndarray] = {}
+        self._dirty: Set[int] = set()
+        self._item_ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._arrays_dirty = False
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return sum(1 for tags in self._slot_tags if tags)
+
+    # 目录订阅
+
+    def on_load(self, items: Iterable[CatalogItem]):
+        """目录全量加载后重建索引"""
+        self._reset()
+        for item in items:
+            self._add(item)
+        self.loaded = True
+        logger.info(f"标签倒排索引重建完成: {len(self)} 条内容, {len(self._members)} 个标签")
+
+    def on_upsert(self, old: Optional[CatalogItem], new: CatalogItem):
+        if old is not None:
+            self._remove(old)
+        self._add(new)
+
+    def on_evict(self, item: CatalogItem):
+        self._remove(item)
+
+    def _add(self, item: CatalogItem):
+        if item.kind not in self.kinds or not item.tag_ids:
+            return
+        slot = self._slot_of.get(item.id)
+        if slot is None:
+            slot = self._slot_of[item.id] = len(self._slot_item_ids)
+            self._slot_item_ids.append(item.id)
+            self._slot_created.append(item.created_ts)
+            self._slot_tags.append(item.tag_ids)
+        else:
+            self._slot_created[slot] = item.created_ts
+            self._slot_tags[slot] = item.tag_ids
+        self._arrays_dirty = True
+        for tag_id in set(item.tag_ids):
+            self._members.setdefault(tag_id, set()).add(slot)
+            self._dirty.add(tag_id)
+
+    def _remove(self, item: CatalogItem):
+        # 槽位保留给同一内容再次写入时复用，全量重建时回收
+        slot = self._slot_of.get(item.id)
+        if slot is None:
+            return
+        for tag_id in set(self._slot_tags[slot]):
+            members = self._members.get(tag_id)
+            if members is not None:
+                members.discard(slot)
+                self._dirty.add(tag_id)
+        self._slot_tags[slot] = ()
+
+    # 查询
+
+    def _posting(self, tag_id: int) -> np.ndarray:
+        """标签的倒排列表（槽位，从新到旧）"""
+        if self._arrays_dirty:
+            self._item_ids = np.array(self._slot_item_ids, dtype=np.int64)
+            self._created = np.array(self._slot_created, dtype=np.float64)
+            self._arrays_dirty = False
+        if tag_id in self._dirty:
+            slots = np.fromiter(self._members.get(tag_id, ()), dtype=np.int64)
+            # 按创建时间倒序，时间相同按槽位
+            self._postings[tag_id] = slots[np.lexsort((slots, -self._created[slots]))]
+            self._dirty.discard(tag_id)
+        return self._postings.get(tag_id, np.empty(0, dtype=np.int64))
+
+    def posting_size(self, tag: str) -> int:
+        tag_id = tag_vocab.get(tag)
+        return len(self._members.get(tag_id, ())) if tag_id is not None else 0
+
+    def top_k(self, tags: List[str], k: int, decay: float = 0.9, min_match: int = 1,
+              max_postings_per_tag: int = 0, exclude: Optional[np.ndarray] = None
+              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """按加权标签匹配分数召回top-k
+
+        第i个标签的权重为decay**i，内容分数为匹配标签的权重之和。分数相同时
+        较新的内容在前。最多使用前63个标签（匹配标签掩码为int64）。
+
+        Args:
+            tags: 用户标签，按重要性排序
+            k: 返回数量
+            decay: 标签权重衰减
+            min_match: 最少匹配标签数
+            max_postings_per_tag: 每个标签最多读取的倒排项（最新的若干条），0表示全部
+            exclude: 跳过的内容ID，在取top-k之前去掉
+
+        Returns:
+            内容ID、匹配分数、匹配标签掩码（第i位表示匹配第i个标签）
+        """
+        postings = []
+        for i, tag in enumerate(tags[:63]):
+            tag_id = tag_vocab.get(tag)
+            if tag_id is None:
+                continue
+            posting = self._posting(tag_id)
+            if max_postings_per_tag > 0:
+                posting = posting[:max_postings_per_tag]
+            if len(posting):
+                postings.append((i, posting))
+
+        if not postings or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)
+
+        total = sum(len(posting) for _, posting in postings)
+        if total * 8 >= len(self._created):
+            # 倒排项较多时在全部槽位上累加，倒排列表内槽位不重复，可以直接按下标累加
+            slots = np.arange(len(self._created))
+            scores = np.zeros(len(slots))
+            match_counts = np.zeros(len(slots), dtype=np.int32)
+            masks = np.zeros(len(slots), dtype=np.int64)
+            for i, posting in postings:
+                scores[posting] += decay ** i
+                match_counts[posting] += 1
+                masks[posting] |= 1 << i
+        else:
+            # 倒排项较少时只在命中的槽位上聚合
+            concat = np.concatenate([posting for _, posting in postings])
+            slots, inverse = np.unique(concat, return_inverse=True)
+            weights = np.concatenate([np.full(len(posting), decay ** i) for i, posting in postings])
+            bits = np.concatenate([np.full(len(posting), 1 << i, dtype=np.int64) for i, posting in postings])
+            scores = np.bincount(inverse, weights=weights)
+            match_counts = np.bincount(inverse)
+            masks = np.zeros(len(slots), dtype=np.int64)
+            np.bitwise_or.at(masks, inverse, bits)
+
+        keep = np.flatnonzero(match_counts >= max(min_match, 1))
+        if exclude is not None and len(exclude):
+            keep = keep[~np.isin(self._item_ids[slots[keep]], exclude)]
+        if len(keep) > k:
+            # 先按分数取出top-k所需的候选，再精确排序
+            kth = -np.partition(-scores[keep], k - 1)[k - 1]
+            keep = keep[scores[keep] >= kth]
+        order = keep[np.lexsort((slots[keep], -self._created[slots[keep]], -scores[keep]))][:k]
+        return self._item_ids[slots[order]], scores[order], masks[order]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "items": len(self),
+            "tags": len(self._members),
+            "slots": len(self._slot_item_ids),
+            "dirty_tags": len(self._dirty),
+        }
+
+# 全局标签倒排索引，订阅内容目录
+tag_index = TagIndex()
+item_catalog.add_listener(tag_index)
@@ -75,10 +75,24 @@ class TraceInfo:
         if node_id in self.node_infos:
             self.node_infos[node_id]["status"] = "error"
     
+    def mark_timeout(self, node_id: str, timeout_ms: Optional[float] = None) -> None:
+        """记录节点超时"""
+        self.global_info.setdefault("timed_out_nodes", []).append(node_id)
+        if node_id in self.node_infos:
+            self.node_infos[node_id]["end_time"] = time.time()
+            self.node_infos[node_id]["status"] = "timeout"
+            if timeout_ms is not None:
+                self.node_infos[node_id]["details"]["timeout_ms"] = int(timeout_ms)
+    
     def set_user_id(self, user_id: Optional[int]) -> None:
         """设置用户ID"""
         self.global_info["user_id"] = user_id
     
+    def set_dag(self, dag_id: str, version: Optional[str]) -> None:
+        """设置执行的DAG及其版本"""
+        self.global_info["dag_id"] = dag_id
+        self.global_info["dag_version"] = version
+    
     def complete(self, status: str = "success") -> None:
         """完成追踪"""
         self.end_time = time.time()
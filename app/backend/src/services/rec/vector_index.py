@@ -0,0 +1,201 @@
+from typing import Dict, List, Any, Optional, Callable, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import time
+import numpy as np
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.logger import logger
+from src.services.rec.ann import IVFIndex
+from src.services.rec.embedding_store import item_embedding_store, parse_vector
+
+class ItemVectorIndex:
+    """内容向量索引
+
+    从向量存储或feature.item_embeddings全量加载内容类型的向量并训练IVF索引，之后按updated_at
+    水位增量写入。全量加载在新索引上完成（训练在线程中执行）后整体替换；数据量
+    相对训练时增长超过retrain_growth倍或到达全量重载间隔时重新全量加载，
+    同时清理已删除的向量。
+    """
+
+    def __init__(self, max_staleness_seconds: float = 600, retrain_growth: float = 2.0,
+                 overlap_seconds: float = 5.0, page_size: int = 5000):
+        self.max_staleness_seconds = max_staleness_seconds
+        self.retrain_growth = retrain_growth
+        self.overlap_seconds = overlap_seconds
+        self.page_size = page_size
+        self.index = IVFIndex()
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh_at: Optional[float] = None
+        self.last_full_load_at: Optional[float] = None
+        self._stats = dict.fromkeys(("queries", "refreshes", "refresh_errors", "upserts", "skipped"), 0)
+        self._last_load_ms = 0.0
+
+    @property
+    def ready(self) -> bool:
+        if not self.loaded or not len(self.index):
+            return False
+        staleness = time.time() - self.last_refresh_at
+        return self.max_staleness_seconds <= 0 or staleness <= self.max_staleness_seconds
+
+    def search(self, query: np.ndarray, k: int, metric: str = "cosine", nprobe: int = 8,
+               min_score: Optional[float] = None,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """近似最近邻查询，见IVFIndex.search"""
+        self._stats["queries"] += 1
+        return self.index.search(query, k, metric=metric, nprobe=nprobe, min_score=min_score, exclude=exclude)
+
+    def _parse_rows(self, rows: List[Any], dim: Optional[int]
+                    ) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[datetime]]:
+        """解析一页向量行，丢弃无法解析或与索引维度不一致的向量"""
+        ids, vectors = [], []
+        watermark = None
+        for row in rows:
+            vector = parse_vector(row.emb)
+            if vector is not None and dim is None:
+                dim = len(vector)
+            if vector is None or len(vector) != dim:
+                self._stats["skipped"] += 1
+            else:
+                ids.append(row.item_id)
+                vectors.append(vector)
+            if row.updated_at is not None and (watermark is None or row.updated_at > watermark):
+                watermark = row.updated_at
+        if not vectors:
+            return np.zeros(0, dtype=np.int64), None, watermark
+        return np.array(ids, dtype=np.int64), np.stack(vectors), watermark
+
+    async def load(self, session_factory: Callable):
+        """全量加载并训练，完成后整体替换
+        
+        向量存储（见embedding_store）已映射时直接从mmap批量读取，再按存储导出时的
+        水位从数据库补齐之后的变化；否则从数据库分页解析JSONB。
+        """
+        start_time = time.perf_counter()
+        if item_embedding_store.loaded:
+            index, watermark = await self._load_from_store(session_factory)
+            source = "store"
+        else:
+            index, watermark = await self._load_from_db(session_factory)
+            source = "db"
+
+        await asyncio.to_thread(index.train)
+
+        async with self._lock:
+            self.index = index
+            self._watermark = watermark
+            self.loaded = True
+            self.last_refresh_at = self.last_full_load_at = time.time()
+            self._last_load_ms = (time.perf_counter() - start_time) * 1000
+
+        logger.info(f"内容向量索引全量加载完成（{source}）: {len(index)} 条向量, 维度 {index.dim}, "
+                    f"耗时 {self._last_load_ms:.1f}ms")
+        if source == "store":
+            await self.refresh(session_factory)
+
+    async def _load_from_store(self, session_factory: Callable) -> Tuple[IVFIndex, Optional[datetime]]:
+        """从向量存储批量加载内容类型的向量"""
+        store = item_embedding_store
+        async with session_factory() as db:
+            result = await db.execute(text("SELECT id FROM app.items WHERE kind = 'content'"))
+            content_ids = np.fromiter((row[0] for row in result.fetchall()), dtype=np.int64)
+        rows = store.rows(content_ids)
+        found = rows >= 0
+        index = IVFIndex()
+        if found.any():
+            rows = np.sort(rows[found])
+            index.add(store.ids[rows], np.asarray(store.vectors[rows], dtype=np.float32))
+        watermark = store.manifest.get("watermark")
+        return index, datetime.fromisoformat(watermark) if watermark else None
+
+    async def _load_from_db(self, session_factory: Callable) -> Tuple[IVFIndex, Optional[datetime]]:
+        """从数据库分页加载内容类型的向量"""
+        index = IVFIndex()
+        watermark = None
+        last_id = 0
+        query = text("""
+            SELECT ie.item_id, ie.emb, ie.updated_at
+            FROM feature.item_embeddings ie
+            JOIN app.items i ON ie.item_id = i.id
+            WHERE i.kind = 'content' AND ie.item_id > :last_id
+            ORDER BY ie.item_id
+            LIMIT :limit
+        """)
+
+        async with session_factory() as db:
+            while True:
+                rows = (await db.execute(query, {"last_id": last_id, "limit": self.page_size})).fetchall()
+                ids, vectors, page_watermark = self._parse_rows(rows, index.dim)
+                if vectors is not None:
+                    index.add(ids, vectors)
+                if page_watermark is not None and (watermark is None or page_watermark > watermark):
+                    watermark = page_watermark
+                if len(rows) < self.page_size:
+                    break
+                last_id = rows[-1].item_id
+        return index, watermark
+
+    async def refresh(self, session_factory: Callable) -> int:
+        """按updated_at水位增量写入，返回写入的向量数量"""
+        if not self.loaded:
+            await self.load(session_factory)
+            return len(self.index)
+
+        query = """
+            SELECT ie.item_id, ie.emb, ie.updated_at
+            FROM feature.item_embeddings ie
+            JOIN app.items i ON ie.item_id = i.id
+            WHERE i.kind = 'content'
+        """
+        params = {}
+        if self._watermark is not None:
+            query += " AND ie.updated_at > :since"
+            params["since"] = self._watermark - timedelta(seconds=self.overlap_seconds)
+
+        async with self._lock, session_factory() as db:
+            rows = (await db.execute(text(query), params)).fetchall()
+            ids, vectors, watermark = self._parse_rows(rows, self.index.dim)
+            if vectors is not None:
+                self.index.add(ids, vectors)
+            if watermark is not None and (self._watermark is None or watermark > self._watermark):
+                self._watermark = watermark
+            self.last_refresh_at = time.time()
+            self._stats["refreshes"] += 1
+            self._stats["upserts"] += len(ids)
+        return len(ids)
+
+    def needs_retrain(self) -> bool:
+        return len(self.index) > max(self.index.trained_size, self.index.brute_force_below) * self.retrain_growth
+
+    async def watch(self, session_factory: Callable, interval_seconds: float,
+                    full_reload_seconds: float = 3600):
+        """定期增量刷新，增长过多或到达全量重载间隔时重新全量加载"""
+        logger.info(f"开始刷新内容向量索引，间隔 {interval_seconds}s，全量重载间隔 {full_reload_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not self.loaded or self.needs_retrain() or (
+                        full_reload_seconds > 0 and time.time() - self.last_full_load_at >= full_reload_seconds):
+                    await self.load(session_factory)
+                else:
+                    await self.refresh(session_factory)
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                logger.error(f"刷新内容向量索引失败: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "ready": self.ready,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "staleness_s": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+            "last_load_ms": round(self._last_load_ms, 2),
+            **self.index.snapshot(),
+            **self._stats,
+        }
+
+# 全局内容向量索引
+item_vector_index = ItemVectorIndex(max_staleness_seconds=settings.ITEM_VECTOR_INDEX_MAX_STALENESS_S)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.services.rec.batch import CandidateBatch, INT_MISSING, topk
+
+ITEMS = [
+    {"id": 3, "title": "a", "author_id": 7, "match_score": 0.5, "tags": ["x", "y"],
+     "created_at": "2024-01-01T00:00:00+00:00", "features": {"ctr": 0.1}},
+    {"id": 1, "title": "b", "author_id": None, "tags": []},
+    {"id": 2, "author_id": 9, "match_score": 0.9, "tags": ["y"], "features": {"ctr": 0.3}},
+]
+
+def test_dicts_round_trip_with_missing_values():
+    batch = CandidateBatch.from_dicts(ITEMS)
+    assert batch.ids.tolist() == [3, 1, 2]
+    assert batch.author_ids.tolist() == [7, INT_MISSING, 9]
+    assert batch.tag_lists(names=True) == [["x", "y"], [], ["y"]]
+    assert batch.to_dicts() == [
+        {"id": 3, "title": "a", "author_id": 7, "match_score": 0.5,
+         "created_at": "2024-01-01T00:00:00+00:00", "features": {"ctr": 0.1}, "tags": ["x", "y"]},
+        {"id": 1, "title": "b", "created_at": None, "tags": []},
+        {"id": 2, "author_id": 9, "match_score": 0.9, "created_at": None, "features": {"ctr": 0.3},
+         "tags": ["y"]},
+    ]
+
+def test_all_none_column_is_dropped():
+    batch = CandidateBatch.from_dicts([{"id": 1, "source": None}, {"id": 2, "source": None}])
+    assert not batch.has_column("source")
+    assert batch.values("source") == [None, None]
+    assert batch.to_dicts() == [{"id": 1}, {"id": 2}]
+
+def test_ensure_accepts_batches_lists_and_empty_input():
+    batch = CandidateBatch.from_dicts(ITEMS)
+    assert CandidateBatch.ensure(batch) is batch
+    assert CandidateBatch.ensure(ITEMS).ids.tolist() == [3, 1, 2]
+    assert len(CandidateBatch.ensure(None)) == 0
+    assert len(CandidateBatch.ensure([])) == 0
+
+def test_concat_fills_missing_columns():
+    left = CandidateBatch.from_dicts([{"id": 1, "match_score": 0.5, "author_id": 4, "tags": ["x"]}])
+    right = CandidateBatch.from_dicts([{"id": 2, "source": "hot"}, {"id": 3, "source": "tag"}])
+    batch = CandidateBatch.concat([left, CandidateBatch.empty(), right])
+    assert batch.ids.tolist() == [1, 2, 3]
+    assert batch.values("match_score") == [0.5, None, None]
+    assert batch.author_ids.tolist() == [4, INT_MISSING, INT_MISSING]
+    assert batch.values("source") == [None, "hot", "tag"]
+    assert batch.tag_lists(names=True) == [["x"], [], []]
+
+def test_dedup_keeps_first_occurrence():
+    batch = CandidateBatch.from_dicts([
+        {"id": 5, "source": "tag"}, {"id": 2, "source": "tag"},
+        {"id": 5, "source": "hot"}, {"id": 1, "source": "hot"}, {"id": 2, "source": "hot"},
+    ])
+    deduped = batch.dedup()
+    assert deduped.ids.tolist() == [5, 2, 1]
+    assert deduped.values("source") == ["tag", "tag", "hot"]
+
+@pytest.mark.parametrize("k", [1, 2, 3, 5, 10])
+def test_topk_is_stable_on_ties(k):
+    scores = np.array([1.0, 3.0, 3.0, 2.0, 3.0, np.nan, 1.0, 2.0, 3.0, 0.0])
+    expected = sorted(range(len(scores)), key=lambda i: -np.nan_to_num(scores[i], nan=-np.inf))[:k]
+    assert topk(scores, k).tolist() == expected
+
+def test_topk_partition_path_matches_stable_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 5, size=200).astype(np.float64)
+    expected = np.argsort(-scores, kind="stable")[:20]
+    assert topk(scores, 20).tolist() == expected.tolist()
+    assert topk(scores, 0).tolist() == []
+
+def test_sort_by_keeps_input_order_on_ties():
+    batch = CandidateBatch.from_dicts([{"id": i} for i in range(6)])
+    ranked = batch.sort_by(np.array([0.2, 0.5, 0.2, 0.5, 0.1, 0.5]), k=4)
+    assert ranked.ids.tolist() == [1, 3, 5, 0]
+
+def test_scores_default_for_nan_and_missing_columns():
+    batch = CandidateBatch.from_dicts([{"id": 1, "match_score": 0.4}, {"id": 2}])
+    assert batch.scores("match_score").tolist() == [0.4, 0.0]
+    assert batch.scores("match_score", default=-1.0).tolist() == [0.4, -1.0]
+    assert batch.scores("rank_score", default=0.5).tolist() == [0.5, 0.5]
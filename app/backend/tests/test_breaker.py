@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+from src.services.rec.breaker import CircuitBreaker, breaker_registry
+from src.services.rec.config.dag import DAG, Node
+from tests.conftest import RecordingSession
+
+CONFIG = {"window_seconds": 30, "min_calls": 4, "error_rate": 0.5, "open_seconds": 15,
+          "half_open_probes": 1}
+
+def _open(breaker):
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success, 1.0)
+
+def _expire_open(breaker):
+    breaker.opened_at -= breaker.open_seconds
+
+def test_opens_on_error_rate_after_min_calls():
+    breaker = CircuitBreaker("test.errors", CONFIG)
+    for success in (False, False, False):
+        breaker.record(success, 1.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(True, 1.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()["rejected_count"] == 1
+
+def test_opens_on_slow_call_rate():
+    breaker = CircuitBreaker("test.slow", {**CONFIG, "slow_call_ms": 50, "slow_call_rate": 0.75})
+    for duration_ms in (80, 90, 10, 100):
+        breaker.record(True, duration_ms)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_half_open_probe_success_closes():
+    breaker = CircuitBreaker("test.recover", CONFIG)
+    _open(breaker)
+    _expire_open(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测名额用完后拒绝其他调用
+    assert not breaker.allow()
+    breaker.record(True, 1.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["window_calls"] == 0
+
+def test_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker("test.reopen", CONFIG)
+    _open(breaker)
+    _expire_open(breaker)
+    assert breaker.allow()
+    breaker.record(False, 1.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_count == 2
+    assert not breaker.allow()
+
+def test_release_returns_probe_slot():
+    breaker = CircuitBreaker("test.release", CONFIG)
+    _open(breaker)
+    _expire_open(breaker)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+class HangingNode(Node):
+    async def process(self, data, context):
+        await asyncio.sleep(10)
+        return [{"id": 1}]
+
+def test_cancelled_probe_does_not_leak_slot(tmp_path):
+    config = {
+        "nodes": {"recall": {"type": f"{__name__}.HangingNode",
+                             "circuit_breaker": {**CONFIG, "open_seconds": 0}}},
+        "edges": {},
+        "entry_nodes": ["recall"],
+    }
+    path = tmp_path / "breaker.json"
+    path.write_text(json.dumps(config))
+    dag = DAG("breaker_test", str(path))
+    breaker = breaker_registry.get("breaker_test", "recall", dag.node_configs["recall"]["circuit_breaker"])
+    _open(breaker)
+
+    async def run():
+        # 熔断器进入半开，本次执行是探测请求，执行中被取消
+        task = asyncio.create_task(dag.execute({"db": RecordingSession()}))
+        await asyncio.sleep(0.05)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert breaker.allow()
@@ -0,0 +1,44 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from src.services.rec import hydration
+from src.services.rec.catalog import CatalogItem, ItemCatalog
+from src.services.rec.hydration import HydratedItem, author_name, load_items
+from tests.conftest import Row, RecordingSession
+
+NOW = datetime.now(timezone.utc)
+AUTHOR = SimpleNamespace(id=7, username="alice", tags=[], created_at=NOW, updated_at=NOW)
+
+def _item(item_id):
+    return SimpleNamespace(id=item_id, kind="content", title=f"title {item_id}", content="body" * 100,
+                           tags=["news"], author_id=7, author=AUTHOR, media={"image_url": "a.png"},
+                           created_at=NOW, updated_at=NOW)
+
+def test_catalog_record_keeps_only_compact_fields():
+    record = CatalogItem(_item(1), None)
+    assert not hasattr(record, "content")
+    assert not hasattr(record, "title")
+    assert not hasattr(record, "tags")
+    assert record.tag_ids and record.media == {"image_url": "a.png"}
+
+def test_load_skips_bodies_and_hydration_fetches_them(monkeypatch):
+    def responder(sql, params):
+        if "items.title" in sql and "items.media" not in sql:
+            return [Row(id=item_id, title=f"title {item_id}", content="body", tags=["news"]) for item_id in (1, 2)]
+        if "app.items.id > " in sql:
+            return [(_item(1),), (_item(2),)]
+        return []
+
+    session = RecordingSession(responder)
+    catalog = ItemCatalog()
+    asyncio.run(catalog.load(lambda: session))
+    load_sql = session.statements[0]
+    assert "items.content" not in load_sql and "items.title" not in load_sql
+
+    monkeypatch.setattr(hydration, "item_catalog", catalog)
+    items = asyncio.run(load_items(session, [2, 1, 3]))
+    assert list(items) == [2, 1]
+    assert all(isinstance(item, HydratedItem) for item in items.values())
+    assert items[2].title == "title 2" and items[2].content == "body"
+    assert items[2].media == {"image_url": "a.png"} and author_name(items[2]) == "alice"
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from src.core.config import settings
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.config.dag import DAG, Node
+from src.services.rec.nodes.base_node import RecallNode
+from tests.conftest import RecordingSession
+
+class ProbeNode(Node):
+    """占用会话一段时间，返回节点ID"""
+
+    async def process(self, data, context):
+        await asyncio.sleep(0.02)
+        return [{"id": self.node_id}]
+
+class SequenceRecall(RecallNode):
+    """按读取数量返回0..n-1"""
+
+    async def recall(self, db, user_id, context):
+        return CandidateBatch.from_dicts([{"id": i} for i in range(await self.fetch_size(context))])
+
+class FirstIdsExcluded:
+    async def apply(self, candidates, size):
+        return candidates.mask(candidates.ids >= 3).head(size)
+
+class SessionCounter:
+    def __init__(self):
+        self.open = 0
+        self.peak = 0
+
+    def __call__(self):
+        counter = self
+
+        class Session(RecordingSession):
+            async def __aenter__(self):
+                counter.open += 1
+                counter.peak = max(counter.peak, counter.open)
+                return self
+
+            async def __aexit__(self, *exc):
+                counter.open -= 1
+                return False
+
+        return Session()
+
+def _write_dag(tmp_path, sources):
+    node_type = f"{__name__}.ProbeNode"
+    config = {
+        "dag": {"id": "probe"},
+        "nodes": {**{node_id: {"type": node_type} for node_id in sources}, "sink": {"type": node_type}},
+        "edges": {node_id: ["sink"] for node_id in sources},
+        "entry_nodes": sources,
+    }
+    path = tmp_path / "probe.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+def test_independent_branches_run_concurrently(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "REC_BRANCH_SESSIONS", 0)
+    dag = DAG("probe", _write_dag(tmp_path, [f"recall_{i}" for i in range(5)]))
+    counter = SessionCounter()
+    outputs = asyncio.run(dag.execute({"db": RecordingSession(), "session_factory": counter}))
+    assert outputs["sink"] == [{"id": "sink"}]
+    assert counter.peak == 5
+
+def test_branch_sessions_are_bounded_per_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "REC_BRANCH_SESSIONS", 2)
+    dag = DAG("probe", _write_dag(tmp_path, [f"recall_{i}" for i in range(5)]))
+    counter = SessionCounter()
+    outputs = asyncio.run(dag.execute({"db": RecordingSession(), "session_factory": counter}))
+    assert len([node_id for node_id in outputs if node_id.startswith("recall_")]) == 5
+    assert counter.peak == 2
+    assert counter.open == 0
+
+def test_output_cache_overfetches_for_per_user_exclusion(tmp_path):
+    config = {
+        "nodes": {"recall": {"type": f"{__name__}.SequenceRecall", "enabled": True, "recall_size": 5,
+                             "output_cache": {"ttl_seconds": 30, "overfetch": 2}}},
+        "edges": {},
+        "entry_nodes": ["recall"],
+        "output_node": "recall",
+    }
+    path = tmp_path / "cached.json"
+    path.write_text(json.dumps(config))
+    dag = DAG("cached_recall_test", str(path))
+
+    async def run():
+        context = {"db": RecordingSession(), "session_factory": RecordingSession}
+        anonymous = await dag.execute(dict(context))
+        excluded = await dag.execute({**context, "exclusion": FirstIdsExcluded()})
+        return anonymous["recall"], excluded["recall"]
+
+    anonymous, excluded = asyncio.run(run())
+    assert anonymous.ids.tolist() == [0, 1, 2, 3, 4]
+    assert excluded.ids.tolist() == [3, 4, 5, 6, 7]
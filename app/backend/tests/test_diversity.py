@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.diversity import dpp_order, mmr_order, normalize_relevance, similarity_matrix
+from src.services.rec.nodes.rank import rerank
+from src.services.rec.nodes.rank.rerank import ReRankNode
+
+# 0和1方向相同，2与它们正交
+VECTORS = np.array([[1.0, 0.0], [2.0, 0.0], [0.0, 1.0]])
+RELEVANCE = np.array([1.0, 0.9, 0.5])
+
+def _sim(found=(True, True, True)):
+    return similarity_matrix(VECTORS, np.array(found))
+
+def test_mmr_demotes_near_duplicates():
+    assert mmr_order(_sim(), RELEVANCE, 3, lam=0.5).tolist() == [0, 2, 1]
+    # 只看相关性时保持原始顺序
+    assert mmr_order(_sim(), RELEVANCE, 3, lam=1.0).tolist() == [0, 1, 2]
+
+def test_dpp_stops_on_duplicates_and_fills_in_order():
+    order, selected = dpp_order(_sim(), RELEVANCE, 3)
+    assert order.tolist() == [0, 2, 1]
+    assert selected == 2
+
+@pytest.mark.parametrize("k", [5, 0])
+def test_k_outside_candidate_count(k):
+    expected = sorted(range(min(k, 3)))
+    assert sorted(mmr_order(_sim(), RELEVANCE, k).tolist()) == expected
+    order, selected = dpp_order(_sim(), RELEVANCE, k)
+    assert sorted(order.tolist()) == expected and selected <= len(expected)
+
+def test_missing_vectors_are_dissimilar():
+    sim = _sim(found=(True, False, True))
+    assert sim[0, 1] == 0 and sim[1, 1] == 1
+    assert mmr_order(sim, RELEVANCE, 3, lam=0.5).tolist() == [0, 1, 2]
+
+def test_normalize_relevance_handles_non_finite_scores():
+    assert normalize_relevance(np.array([2.0, 4.0, np.nan, np.inf])).tolist() == [0.0, 1.0, 0.0, 1.0]
+
+def _rerank_node(model_type, rank_size=10):
+    return ReRankNode("rerank", {"enabled": True, "model_type": model_type, "rank_size": rank_size,
+                                 "diversity_weight": 0.2, "diversity_fields": ["author_id"],
+                                 "mmr_lambda": 0.5})
+
+def _store(monkeypatch, vectors, loaded=True):
+    def get(ids):
+        found = np.array([int(item_id) in vectors for item_id in ids])
+        return np.array([vectors.get(int(item_id), [0.0, 0.0]) for item_id in ids]), found
+    monkeypatch.setattr(rerank, "item_embedding_store", SimpleNamespace(loaded=loaded, get=get))
+
+def _candidates():
+    # 原始分数顺序：11, 12, 13
+    return CandidateBatch.from_dicts([{"id": 13, "original_score": 0.5}, {"id": 11, "original_score": 1.0},
+                                      {"id": 12, "original_score": 0.9}])
+
+@pytest.mark.parametrize("model_type", ["mmr", "dpp"])
+def test_embedding_rerank_orders_candidates(monkeypatch, model_type):
+    _store(monkeypatch, {11: [1.0, 0.0], 12: [2.0, 0.0], 13: [0.0, 1.0]})
+    candidates = _candidates()
+    order = _rerank_node(model_type)._embedding_rerank(candidates)
+    assert candidates.ids[order].tolist() == [11, 13, 12]
+    assert _rerank_node(model_type, rank_size=2)._embedding_rerank(candidates) == order[:2]
+
+def test_embedding_rerank_without_vectors(monkeypatch):
+    _store(monkeypatch, {})
+    assert _rerank_node("mmr")._embedding_rerank(_candidates()) is None
+    _store(monkeypatch, {11: [1.0, 0.0]}, loaded=False)
+    assert _rerank_node("dpp")._embedding_rerank(_candidates()) is None
+
+def test_embedding_rerank_with_partial_vectors(monkeypatch):
+    _store(monkeypatch, {11: [1.0, 0.0], 12: [2.0, 0.0]})
+    candidates = _candidates()
+    order = _rerank_node("mmr")._embedding_rerank(candidates)
+    # 13没有向量，视为与其他候选项都不相似，排在与11重复的12之前
+    assert candidates.ids[order].tolist() == [11, 13, 12]
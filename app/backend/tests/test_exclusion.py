@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.services.rec.ann import IVFIndex
+from src.services.rec.batch import tag_vocab
+from src.services.rec.exclusion import RecallExclusion
+from src.services.rec.tag_index import TagIndex
+from src.services.rec.nodes.recall.multi_hop_recall import MultiHopRecallNode
+from src.services.rec.nodes.recall.popular_recall import PopularRecallNode
+from src.services.rec.nodes.recall.vector_recall import VectorRecallNode
+from tests.conftest import Row, RecordingSession
+
+def test_exclusion_loads_blocks_and_seen_events():
+    def responder(sql, params):
+        if "relation_type = 'block'" in sql:
+            return [Row(entity_type="item", entity_id=3), Row(entity_type="user", entity_id=9)]
+        return [(1,), (2,)]
+
+    session = RecordingSession(responder)
+
+    async def run():
+        exclusion = RecallExclusion(lambda: session, 1, ["impression", "click"], 3600, block_authors=True)
+        return await exclusion.excluded_ids(), await exclusion.fetch_size(10, pushed_down=True)
+
+    excluded, size = asyncio.run(run())
+    assert excluded == [1, 2, 3]
+    # 拉黑作者只能在取出候选项后判断，仍需按倍数多取
+    assert size == 20
+    assert any("event_type = ANY(" in sql for sql in session.statements)
+
+def test_sql_recall_pushes_exclusion_down_as_array():
+    session = RecordingSession()
+    excluded = [1, 2]
+    asyncio.run(PopularRecallNode("popular_recall", {"enabled": True, "recall_size": 10, "time_window": "1d",
+                                                        "metrics": ["pv", "like"]})
+                ._recall_from_db(session, None, 10, excluded))
+    asyncio.run(VectorRecallNode("vector_recall", {"enabled": True, "recall_size": 10, "vector_field": "emb",
+                                                      "distance_metric": "cosine"})
+                ._recall_from_db(session, "[0.1, 0.2]", 10, excluded))
+    asyncio.run(MultiHopRecallNode("multi_hop_recall", {"enabled": True, "recall_size": 10, "max_hops": 2,
+                                                          "relation_types": ["like"], "hop_decay": 0.5})
+                ._recall_from_db(session, 1, None, 10, excluded))
+    assert len(session.statements) == 3
+    assert all("<> ALL(" in sql for sql in session.statements)
+
+def test_tag_index_skips_excluded_items_before_top_k():
+    tag = tag_vocab.intern("exclusion-test")
+    index = TagIndex()
+    index.on_load([SimpleNamespace(id=item_id, kind="content", tag_ids=(tag,), created_ts=float(item_id))
+                   for item_id in range(1, 6)])
+    item_ids, _, _ = index.top_k(["exclusion-test"], 2, exclude=np.array([4, 5]))
+    assert item_ids.tolist() == [3, 2]
+
+def test_ann_search_skips_excluded_items():
+    index = IVFIndex(dim=2)
+    index.add(np.array([1, 2, 3]), np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]], dtype=np.float32))
+    item_ids, _ = index.search(np.array([1.0, 0.0]), 2, exclude=np.array([1]))
+    assert item_ids.tolist() == [2, 3]
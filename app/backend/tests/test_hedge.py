@@ -0,0 +1,51 @@
+import asyncio
+
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.config.dag import DAG
+from src.services.rec.hedge import run_hedged
+from src.services.rec.nodes.recall.random_recall import RandomRecallNode
+
+def _slow_attempt(state):
+    async def attempt(is_hedge):
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        return ["fresh"]
+    return attempt
+
+def test_cache_strategy_keeps_primary_running_in_background():
+    state, late = {}, []
+
+    async def run():
+        result = await run_hedged("test.late", _slow_attempt(state), 5, cached=["cached"],
+                                  on_late_result=late.append)
+        await asyncio.sleep(0.1)
+        return result
+
+    assert asyncio.run(run()) == (["cached"], "cache")
+    assert late == [["fresh"]]
+    assert "cancelled" not in state
+
+def test_cache_strategy_cancels_primary_without_callback():
+    state = {}
+
+    async def run():
+        result = await run_hedged("test.cancel", _slow_attempt(state), 5, cached=["cached"])
+        await asyncio.sleep(0.1)
+        return result
+
+    assert asyncio.run(run()) == (["cached"], "cache")
+    assert state["cancelled"]
+
+def test_cached_recall_output_is_filtered_by_current_exclusion():
+    class Exclusion:
+        async def apply(self, candidates, size):
+            return candidates.mask(candidates.ids != 2).head(size)
+
+    node = RandomRecallNode("random_recall", {"enabled": True, "recall_size": 10})
+    cached = CandidateBatch.from_dicts([{"id": 1}, {"id": 2}, {"id": 3}])
+    output = asyncio.run(DAG._apply_exclusion(node, cached, {"exclusion": Exclusion()}))
+    assert output.ids.tolist() == [1, 3]
+    assert asyncio.run(DAG._apply_exclusion(node, cached, {})).ids.tolist() == [1, 2, 3]
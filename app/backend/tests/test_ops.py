@@ -0,0 +1,56 @@
+import pytest
+
+from src.services.rec.breaker import breaker_registry
+from tests.conftest import api_request
+
+PREFIX = "/api/v1/ops/rec"
+
+@pytest.mark.parametrize("path, key", [
+    ("/hedges", "hedges"),
+    ("/node-cache", "node_cache"),
+    ("/breakers", "breakers"),
+    ("/dags", "dags"),
+    ("/catalog", "catalog"),
+    ("/catalog", "tag_index"),
+    ("/vector-index", "vector_index"),
+    ("/popularity", "popularity"),
+    ("/related", "related"),
+    ("/relation-graph", "relation_graph"),
+    ("/seen-history", "seen_history"),
+    ("/negative-feedback", "negative_feedback"),
+])
+def test_stats_endpoints(path, key):
+    response = api_request("GET", PREFIX + path)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["code"] == 0
+    assert key in body["data"]
+
+def test_embedding_stores_are_keyed_by_name():
+    body = api_request("GET", PREFIX + "/embedding-stores").json()
+    assert body["code"] == 0
+    assert isinstance(body["data"], dict)
+
+def test_unloaded_caches_report_not_ready():
+    # 测试不触发启动事件，各缓存都未加载
+    for path, key in [("/relation-graph", "relation_graph"), ("/seen-history", "seen_history"),
+                      ("/negative-feedback", "negative_feedback")]:
+        stats = api_request("GET", PREFIX + path).json()["data"][key]
+        assert stats["loaded"] is False and stats["ready"] is False
+
+def test_invalidate_node_cache():
+    body = api_request("POST", PREFIX + "/node-cache/invalidate", params={"prefix": "missing:"}).json()
+    assert body == {"code": 0, "data": {"invalidated": 0}, "msg": ""}
+
+def test_reset_breaker():
+    breaker = breaker_registry.get("ops_test", "recall", {"enabled": True})
+    breaker._transition(breaker.OPEN)
+    body = api_request("POST", PREFIX + "/breakers/ops_test.recall/reset").json()
+    assert body["code"] == 0
+    assert body["data"]["key"] == "ops_test.recall"
+    assert body["data"]["state"] == "closed"
+
+def test_reset_unknown_breaker_returns_404():
+    response = api_request("POST", PREFIX + "/breakers/missing.node/reset")
+    assert response.status_code == 404
+    assert response.json()["code"] == 4004
@@ -0,0 +1,26 @@
+import pytest
+
+from src.services.rec.config.plan import compile_plan
+
+def test_cycle_is_rejected():
+    edges = {"recall": ["filter"], "filter": ["rank"], "rank": ["filter"]}
+    with pytest.raises(ValueError, match=r"存在环: \['filter', 'rank'\]"):
+        compile_plan("cyclic", ["recall", "filter", "rank"], edges, ["recall"], "rank")
+
+def test_self_loop_is_rejected():
+    with pytest.raises(ValueError, match="存在环"):
+        compile_plan("self_loop", ["recall", "rank"], {"recall": ["rank"], "rank": ["rank"]}, ["recall"])
+
+def test_acyclic_plan_orders_levels_and_prunes():
+    nodes = ["hot", "tag", "merge", "rank", "debug"]
+    edges = {"hot": ["merge"], "tag": ["merge"], "merge": ["rank"], "debug": []}
+    plan = compile_plan("feed", nodes, edges, ["hot", "tag", "debug"], "rank")
+    assert plan.output_node == "rank"
+    assert plan.levels == (("hot", "tag"), ("merge",), ("rank",))
+    assert plan.order.index("merge") < plan.order.index("rank")
+    assert plan.pruned == ("debug",)
+
+def test_multiple_sinks_require_output_node():
+    edges = {"recall": ["rank", "log"]}
+    with pytest.raises(ValueError, match="多个汇点"):
+        compile_plan("feed", ["recall", "rank", "log"], edges, ["recall"])
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from src.services.rec.popularity import PopularityCounters
+from src.services.rec.nodes.recall.popular_recall import PopularRecallNode
+from tests.conftest import Row, RecordingSession, run_with_database
+
+def _events_responder(rows):
+    def respond(sql, params):
+        if "MAX(id)" in sql:
+            return [(10,)]
+        if "GROUP BY e.item_id" in sql:
+            return rows
+        return []
+    return respond
+
+def test_load_and_refresh_bind_event_types_as_array():
+    counters = PopularityCounters(("1h", "1d"))
+    bucket = int(time.time() // counters.base_bucket_seconds)
+    rows = [
+        Row(item_id=1, event_type="impression", bucket=bucket, count=5),
+        Row(item_id=2, event_type="like", bucket=bucket, count=3),
+    ]
+    session = RecordingSession(_events_responder(rows))
+    asyncio.run(counters.load(lambda: session))
+
+    fetch = next(sql for sql in session.statements if "GROUP BY e.item_id" in sql)
+    assert "= ANY(" in fetch
+    item_ids, scores = counters.top("1h", counters.weight_vector(["pv", "like"], {"pv": 1.0, "like": 3.0}), 10)
+    assert item_ids.tolist() == [2, 1]
+    assert scores.tolist() == [9.0, 5.0]
+
+    asyncio.run(counters.refresh(lambda: RecordingSession(_events_responder([]))))
+
+def test_popular_recall_db_fallback_query():
+    node = PopularRecallNode("popular_recall", {"enabled": True, "recall_size": 10,
+                                                "time_window": "1d", "metrics": ["pv", "like"]})
+    session = RecordingSession(lambda sql, params: [
+        Row(id=1, tags=["a"], author_id=2, created_at=None, kind="content", popularity_score=4.0)])
+    candidates = asyncio.run(node._recall_from_db(session, None, 10, []))
+    assert [item["id"] for item in candidates] == [1]
+    assert "= ANY(" in session.statements[0]
+
+def test_load_on_database(database_url):
+    async def load(session_factory):
+        counters = PopularityCounters(("1h", "1d"))
+        await counters.load(session_factory)
+        await counters.refresh(session_factory)
+        return counters
+
+    assert run_with_database(database_url, load).loaded
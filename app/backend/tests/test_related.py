@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+from src.services.rec.related import ItemRelatedIndex, build_item_related
+from src.services.rec.nodes.recall.multi_hop_recall import MultiHopRecallNode
+from tests.conftest import Row, RecordingSession, run_with_database
+
+NOW = datetime.now(timezone.utc)
+
+def _relations_responder(sql, params):
+    if "SELECT NOW()" in sql:
+        return [(NOW,)]
+    if "SELECT DISTINCT entity_id" in sql:
+        return [(10,)]
+    if "FROM rel.user_entity_relations" in sql:
+        return [(user_id, item_id, 1.0, NOW) for user_id in (1, 2, 3) for item_id in (10, 11, 12)]
+    return []
+
+def test_build_item_related_full_and_incremental():
+    sessions = []
+
+    def factory():
+        sessions.append(RecordingSession(_relations_responder))
+        return sessions[-1]
+
+    assert asyncio.run(build_item_related(factory, ["like", "favorite"], top_k=5)) == 3
+    assert asyncio.run(build_item_related(factory, ["like"], top_k=5, since=NOW - timedelta(hours=1))) == 1
+    relation_queries = [sql for session in sessions for sql in session.statements
+                        if "rel.user_entity_relations" in sql]
+    assert len(relation_queries) == 3
+    assert all("relation_type = ANY(" in sql for sql in relation_queries)
+
+def test_index_load_and_expand():
+    rows = [Row(item_id=1, related_ids=[2, 3], scores=[0.9, 0.5], updated_at=NOW),
+            Row(item_id=2, related_ids=[4], scores=[1.0], updated_at=NOW)]
+    index = ItemRelatedIndex(page_size=10)
+    asyncio.run(index.load(lambda: RecordingSession(lambda sql, params: rows)))
+    asyncio.run(index.refresh(lambda: RecordingSession()))
+    item_ids, weights = index.expand([1], max_hops=3, hop_decay=0.5)
+    assert item_ids.tolist() == [1, 2, 3, 4]
+    assert np.allclose(weights, [1.0, 0.45, 0.25, 0.225])
+
+def test_multi_hop_queries():
+    node = MultiHopRecallNode("multi_hop_recall", {"enabled": True, "recall_size": 10, "max_hops": 2,
+                                                   "relation_types": ["like", "favorite"], "hop_decay": 0.5})
+    session = RecordingSession(lambda sql, params: [(5,), (6,), (5,)] if "ORDER BY last_interact_at DESC" in sql else [])
+    assert asyncio.run(node._seed_items(session, 1)) == [5, 6]
+    asyncio.run(node._recall_from_db(session, 1, None, 10, []))
+    assert all("relation_type = ANY(" in sql for sql in session.statements)
+
+def test_build_on_database(database_url):
+    async def build(session_factory):
+        return await build_item_related(session_factory, ["like", "favorite"], top_k=5,
+                                        since=NOW - timedelta(minutes=5))
+
+    assert run_with_database(database_url, build) >= 0
@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from src.services.rec.relation_graph import RelationGraph
+from tests.conftest import Row, RecordingSession, run_with_database
+
+NOW = datetime.now(timezone.utc)
+
+def test_load_and_refresh_bind_relation_types_as_array():
+    loaded = [Row(user_id=1, entity_id=10, relation_type="like", strength=1.0, last_interact_at=NOW),
+              Row(user_id=2, entity_id=10, relation_type="favorite", strength=None, last_interact_at=NOW),
+              Row(user_id=2, entity_id=11, relation_type="like", strength=1.0, last_interact_at=NOW)]
+    changed = [Row(user_id=1, entity_id=12, relation_type="like", status="active", strength=1.0,
+                   last_interact_at=NOW + timedelta(seconds=1))]
+    sessions = []
+
+    def factory(rows):
+        sessions.append(RecordingSession(lambda sql, params: rows))
+        return sessions[-1]
+
+    graph = RelationGraph(relation_types=["like", "favorite"])
+    asyncio.run(graph.load(lambda: factory(loaded)))
+    assert graph.ready
+    assert asyncio.run(graph.refresh(lambda: factory(changed))) == 1
+    assert sorted(graph.seed_items(1, 10).tolist()) == [10, 12]
+    statements = [sql for session in sessions for sql in session.statements]
+    assert len(statements) == 2
+    assert all("relation_type = ANY(" in sql for sql in statements)
+
+def test_load_on_database(database_url):
+    graph = RelationGraph(relation_types=["like", "favorite"])
+
+    async def load(session_factory):
+        await graph.load(session_factory)
+        return await graph.refresh(session_factory)
+
+    assert run_with_database(database_url, load) >= 0
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from src.api.v1.endpoints import relations
+from src.services.rec.negative import NegativeFeedbackCache, UserBlocks
+from src.services.rec.relation_graph import RelationGraph
+from tests.conftest import Row, RecordingSession, api_request
+
+PATH = "/api/v1/relations/upsert"
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def caches(monkeypatch):
+    graph = RelationGraph(relation_types=["like", "favorite"])
+    feedback = NegativeFeedbackCache()
+    monkeypatch.setattr(relations, "relation_graph", graph)
+    monkeypatch.setattr(relations, "negative_feedback", feedback)
+    return graph, feedback
+
+def test_upsert_writes_and_updates_relation_graph(caches):
+    graph, _ = caches
+    session = RecordingSession(lambda sql, params: [Row(last_interact_at=NOW)])
+    response = api_request("POST", PATH, db=session, json={
+        "user_id": 1, "entity_type": "item", "entity_id": 10, "relation_type": "like"})
+    assert response.json() == {"code": 0, "data": {"success": True}, "msg": ""}
+    [sql] = session.statements
+    assert "INSERT INTO rel.user_entity_relations" in sql
+    assert "ON CONFLICT (user_id, entity_type, entity_id, relation_type) DO UPDATE" in sql
+    assert "RETURNING rel.user_entity_relations.last_interact_at" in sql
+    assert graph.seed_items(1, 10).tolist() == [10]
+
+    # 取消关系后从关系图中去掉
+    api_request("POST", PATH, db=session, json={
+        "user_id": 1, "entity_type": "item", "entity_id": 10, "relation_type": "like",
+        "status": "inactive"})
+    assert graph.seed_items(1, 10).tolist() == []
+
+def test_upsert_block_updates_cached_blocks(caches):
+    _, feedback = caches
+    feedback._entries[1] = UserBlocks(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                                      expires_at=float("inf"))
+    session = RecordingSession(lambda sql, params: [Row(last_interact_at=NOW)])
+    for entity_type, entity_id in [("item", 10), ("user", 7)]:
+        body = api_request("POST", PATH, db=session, json={
+            "user_id": 1, "entity_type": entity_type, "entity_id": entity_id,
+            "relation_type": "block"}).json()
+        assert body["code"] == 0
+    blocks = feedback.get(1)
+    assert blocks.items.tolist() == [10]
+    assert blocks.authors.tolist() == [7]
+
+def test_upsert_failure_leaves_caches_untouched(caches):
+    graph, feedback = caches
+
+    def fail(sql, params):
+        raise RuntimeError("connection lost")
+
+    body = api_request("POST", PATH, db=RecordingSession(fail), json={
+        "user_id": 1, "entity_type": "item", "entity_id": 10, "relation_type": "like"}).json()
+    assert body["code"] == 5001
+    assert "connection lost" in body["msg"]
+    assert graph.seed_items(1, 10).tolist() == []
+    assert feedback.snapshot()["writes"] == 0
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from scripts.bench_rerank import make_candidates, scan_rerank
+from src.services.rec.nodes.rank.rerank import ReRankNode
+
+def _node(rank_size, diversity_weight=0.2):
+    return ReRankNode("rerank", {
+        "enabled": True,
+        "model_type": "diversity",
+        "rank_size": rank_size,
+        "diversity_weight": diversity_weight,
+        "diversity_fields": ["tags", "author_id"],
+        "max_items_per_key": {"author_id": 2, "tags": 3},
+    })
+
+@pytest.mark.parametrize("n", [1, 2, 7, 50, 200])
+@pytest.mark.parametrize("weight", [0.05, 0.2, 1.0])
+def test_heap_rerank_matches_scan(n, weight):
+    """增量堆实现与逐项扫描实现在随机样本上的输出逐项一致"""
+    rng = np.random.default_rng(n * 1000 + int(weight * 100))
+    for rank_size in (n, max(n // 3, 1)):
+        node = _node(rank_size, weight)
+        for _ in range(10):
+            candidates = make_candidates(n, rng)
+            assert node._diversity_rerank(candidates) == scan_rerank(node, candidates)
@@ -0,0 +1,44 @@
+import asyncio
+
+import numpy as np
+
+from src.services.rec.nodes.recall import random_recall
+from src.services.rec.nodes.recall.random_recall import RandomRecallNode
+from src.services.rec.sampling import sample_item_ids
+from tests.conftest import RecordingSession
+
+def _items_responder(sql, params):
+    if "pg_class" in sql:
+        return [(100,)]
+    return [(item_id,) for item_id in range(1, 101)]
+
+def test_seeded_pages_do_not_overlap():
+    session = RecordingSession(_items_responder)
+    first = asyncio.run(sample_item_ids(session, ["content"], 10, 0, seed="abc"))
+    second = asyncio.run(sample_item_ids(session, ["content"], 10, 10, seed="abc"))
+    assert len(first) == len(second) == 10
+    assert not set(first) & set(second)
+    assert first == asyncio.run(sample_item_ids(session, ["content"], 10, 0, seed="abc"))
+    assert all("kind = ANY(" in sql for sql in session.statements if "FROM app.items" in sql)
+
+def test_sampling_skips_excluded_ids():
+    session = RecordingSession(_items_responder)
+    page = asyncio.run(sample_item_ids(session, ["content"], 10, 0, seed="abc"))
+    excluded = np.array(sorted(page[:3]))
+    seeded = asyncio.run(sample_item_ids(session, ["content"], 10, 0, seed="abc", exclude=excluded))
+    assert seeded == page[3:]
+    unseeded = asyncio.run(sample_item_ids(session, ["content"], 10, exclude=np.arange(1, 51)))
+    assert len(unseeded) == 10 and min(unseeded) > 50
+
+def test_random_recall_windows_start_at_page_times_fetch(monkeypatch):
+    calls = []
+
+    async def fake_sample(db, kinds, count, offset, seed, exclude=None):
+        calls.append((count, offset))
+        return []
+
+    monkeypatch.setattr(random_recall, "sample_item_ids", fake_sample)
+    node = RandomRecallNode("random_recall", {"enabled": True, "recall_size": 50})
+    for offset in (0, 20, 40):
+        asyncio.run(node.recall(RecordingSession(), None, {"seed": "abc", "offset": offset, "count": 20}))
+    assert calls == [(50, 0), (50, 50), (50, 100)]
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import numpy as np
+
+from src.services.rec.seen import SeenHistory
+from tests.conftest import RecordingSession, run_with_database
+
+def test_fill_and_refresh_bind_event_types_as_array():
+    now = time.time()
+    max_id = [10]
+
+    def responder(sql, params):
+        if "MAX(id)" in sql:
+            return [(max_id[0],)]
+        if "ts >= " in sql:
+            return [(100, now - 60), (101, now - 120)]
+        return [(1, 102, now), (2, 200, now)]
+
+    session = RecordingSession(responder)
+    history = SeenHistory(event_types=["impression", "click"])
+
+    async def run():
+        await history.load(lambda: session)
+        mask = await history.seen_mask(session, 1, np.array([100, 101, 102]), 86400)
+        assert mask.tolist() == [True, True, False]
+        max_id[0] = 12
+        assert await history.refresh(lambda: session) == 2
+        return await history.seen_mask(session, 1, np.array([102, 200]), 86400)
+
+    assert asyncio.run(run()).tolist() == [True, False]
+    event_queries = [sql for sql in session.statements if "event_type" in sql]
+    assert len(event_queries) == 2
+    assert all("event_type = ANY(" in sql for sql in event_queries)
+
+def test_fill_on_database(database_url):
+    history = SeenHistory(event_types=["impression", "click"])
+
+    async def fill(session_factory):
+        await history.load(session_factory)
+        async with session_factory() as db:
+            await history.seen_mask(db, 1, np.array([1]), 86400)
+        return await history.refresh(session_factory)
+
+    assert run_with_database(database_url, fill) >= 0
@@ -0,0 +1,22 @@
+import asyncio
+
+from src.services.rec.batch import CandidateBatch
+from src.services.rec.nodes.filter.user_history_filter import UserHistoryFilterNode
+from tests.conftest import Row, RecordingSession
+
+def test_events_without_item_are_ignored():
+    events = [Row(item_id=2), Row(item_id=None), Row(item_id=4)]
+
+    def respond(sql, params):
+        # 与数据库一致：按 item_id IS NOT NULL 条件过滤
+        if "item_id IS NOT NULL" in sql:
+            return [row for row in events if row.item_id is not None]
+        return events
+
+    node = UserHistoryFilterNode("history_filter", {"enabled": True, "event_types": ["impression"]})
+    candidates = CandidateBatch.from_dicts([{"id": i} for i in range(1, 6)])
+    session = RecordingSession(respond)
+    filtered = asyncio.run(node.filter(candidates, 1, {"db": session}))
+    assert filtered.ids.tolist() == [1, 3, 5]
+    [sql] = session.statements
+    assert "app.events.item_id IS NOT NULL" in sql
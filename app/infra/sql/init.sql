@@ -67,6 +67,14 @@ CREATE TABLE IF NOT EXISTS rel.user_entity_relations (
     PRIMARY KEY (user_id, entity_type, entity_id, relation_type)
 );
 
+-- 相关内容表（按共同点赞/收藏离线计算，见scripts/build_item_related.py）
+CREATE TABLE IF NOT EXISTS feature.item_related (
+    item_id BIGINT PRIMARY KEY,
+    related_ids BIGINT[] NOT NULL,
+    scores REAL[] NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- 向量表 (使用JSONB类型代替vector，因为bitnami/postgresql:15镜像没有pgvector扩展)
 CREATE TABLE IF NOT EXISTS feature.item_embeddings (
     item_id BIGINT PRIMARY KEY REFERENCES app.items(id),
@@ -190,6 +198,12 @@ CREATE TABLE IF NOT EXISTS ops.sql_runs (
 
 -- 创建索引
 
+-- 相关内容表索引
+CREATE INDEX IF NOT EXISTS idx_item_related_updated_at ON feature.item_related(updated_at);
+
+-- 内容表索引（内容目录按updated_at水位增量刷新）
+CREATE INDEX IF NOT EXISTS idx_items_updated_at ON app.items(updated_at);
+
 -- 事件表索引
 CREATE INDEX IF NOT EXISTS idx_events_user_id_ts ON app.events(user_id, ts DESC);
 CREATE INDEX IF NOT EXISTS idx_events_item_id_ts ON app.events(item_id, ts DESC);